@@ -0,0 +1,32 @@
+class RandomAI:
+    """
+    The AI strategy of the game: every decision is a random choice.
+    A strategy answers each decision an AI seat has to make, the controller
+    passes itself so a strategy can look at the game, and the player
+    taking the decision. Randomness comes from the player's generator
+    so seeded games stay reproducible.
+    """
+
+    def choose_action(self, controller, player, options):
+        return player.rng.choice(options)
+
+    def choose_target(self, controller, player, action, targets):
+        return player.rng.choice(targets)
+
+    def decide_to_challenge(self, controller, player, challenged, action, target=None, claimed_card=None):
+        """
+        claimed_card is only given when the challenge is against a block,
+        otherwise the challenged player claims the character performing the action.
+        """
+        return player.rng.choice([True, False])
+
+    def decide_to_block(self, controller, player, blocked_player, action, target=None):
+        return player.rng.choice([True, False])
+
+    def choose_card_to_reveal(self, player):
+        # Return the index of the card to reveal
+        return player.rng.choice([0, 1]) if len(player.cards) > 1 else 0
+
+    def choose_cards_to_keep(self, controller, player, cards):
+        # Keep as many cards as the player had
+        return player.rng.sample(cards, len(player.cards))
@@ -0,0 +1,328 @@
+import argparse
+import math
+import numpy as np
+from moves import MoveGenerator
+from constants import (
+    CARD_COPIES,
+    CHARACTERS,
+    COUP_RULES_CONFIG,
+    MAX_PLAYERS,
+    MIN_PLAYERS,
+    TARGETED_ACTIONS
+)
+
+# Rule tables, indexed by the position of the action in COUP_RULES_CONFIG
+# and of the character in CHARACTERS
+ACTIONS = list(COUP_RULES_CONFIG)
+ACTION_INDEX = {action: index for index, action in enumerate(ACTIONS)}
+COSTS = np.array([COUP_RULES_CONFIG[action]["cost"] for action in ACTIONS])
+INCOMES = np.array([COUP_RULES_CONFIG[action]["income"] for action in ACTIONS])
+CHALLENGEABLE = np.array([COUP_RULES_CONFIG[action]["can_be_challenged"] for action in ACTIONS])
+BLOCKABLE = np.array([bool(COUP_RULES_CONFIG[action]["blocked_by"]) for action in ACTIONS])
+TARGETED = np.array([action in TARGETED_ACTIONS for action in ACTIONS])
+CLAIMS = np.array([
+    CHARACTERS.index(COUP_RULES_CONFIG[action]["performed_by"])
+    if COUP_RULES_CONFIG[action]["performed_by"] else -1
+    for action in ACTIONS
+])
+# First and second character able to block each action, -1 when there is none
+BLOCK_CLAIMS = np.full((len(ACTIONS), 2), -1)
+for _index, _action in enumerate(ACTIONS):
+    for _position, _character in enumerate(COUP_RULES_CONFIG[_action]["blocked_by"][:2]):
+        BLOCK_CLAIMS[_index, _position] = CHARACTERS.index(_character)
+
+COUP = ACTION_INDEX["coup"]
+ASSASSINATE = ACTION_INDEX["assassinate"]
+STEAL = ACTION_INDEX["steal"]
+EXCHANGE = ACTION_INDEX["exchange"]
+STEAL_AMOUNT = COUP_RULES_CONFIG["steal"]["amount"]
+# Legal actions by coin count, from the move generator tables
+_MOVES = MoveGenerator.for_game(2)
+COIN_ROWS = _MOVES.max_coins + 1
+LEGAL_ACTIONS = np.array([_MOVES.action_mask(coins) for coins in range(COIN_ROWS)])
+
+
+class TablePolicy:
+    """
+    A policy that ignores the cards: the action is drawn with the weights
+    of the row of the player's coin count, and every challenge or block
+    decision is a coin flip with a probability per action.
+    The default weights and probabilities are the random AI of GameController.
+    """
+
+    def __init__(self, action_weights=None, challenge_probability=0.5, block_probability=0.5, block_challenge_probability=0.5):
+        if action_weights is None:
+            action_weights = np.ones((COIN_ROWS, len(ACTIONS)))
+        self.action_weights = np.asarray(action_weights, dtype=float)
+        if self.action_weights.shape != (COIN_ROWS, len(ACTIONS)):
+            raise ValueError(f"Action weights must have the shape {(COIN_ROWS, len(ACTIONS))}")
+        self.challenge_probability = np.broadcast_to(np.asarray(challenge_probability, dtype=float), (len(ACTIONS),))
+        self.block_probability = np.broadcast_to(np.asarray(block_probability, dtype=float), (len(ACTIONS),))
+        self.block_challenge_probability = np.broadcast_to(np.asarray(block_challenge_probability, dtype=float), (len(ACTIONS),))
+
+
+class BatchSimulator:
+    """
+    Play many games in lockstep, one turn of every running game per step.
+    Coins, hands (a count per character), deck counts and the turn are
+    NumPy arrays with one row per game, and each rule is applied with
+    masked vector operations over the games it concerns.
+    The rules are the ones of GameController: responders are asked in seat
+    order, a challenge is asked before a block, a blocker claims a blocking
+    character they hold or bluffs the first one, and revealed or kept
+    cards are chosen at random.
+    """
+
+    def __init__(self, number_of_games, seats, policy=None, seed=None, copies=CARD_COPIES):
+        if seats < 2:
+            raise ValueError("A game needs at least 2 seats")
+        if seats * 2 + 2 > copies * len(CHARACTERS):
+            raise ValueError("Not enough cards in the deck to deal every seat and exchange")
+        self.number_of_games = number_of_games
+        self.seats = seats
+        self.policy = policy if policy is not None else TablePolicy()
+        self.rng = np.random.default_rng(seed)
+
+        games = number_of_games
+        self.coins = np.full((games, seats), 2, dtype=np.int16)
+        self.hands = np.zeros((games, seats, len(CHARACTERS)), dtype=np.int8)
+        self.influence = np.zeros((games, seats), dtype=np.int8)
+        self.deck = np.full((games, len(CHARACTERS)), copies, dtype=np.int16)
+        self.turn = np.zeros(games, dtype=np.int64)
+        self.turns = np.zeros(games, dtype=np.int64)
+        self.done = np.zeros(games, dtype=bool)
+        self.winner = np.full(games, -1, dtype=np.int64)
+
+        # Deal 2 cards to every seat, in seat order like GameController
+        every_game = np.arange(games)
+        for seat in range(seats):
+            for _ in range(2):
+                card = self._draw(self.deck[every_game])
+                self.deck[every_game, card] -= 1
+                self.hands[every_game, seat, card] += 1
+            self.influence[:, seat] = 2
+
+    # Sampling helpers
+    def _sample(self, weights):
+        # Draw one column per row with probability proportional to the weights
+        cumulative = np.cumsum(weights, axis=1)
+        threshold = self.rng.random(len(weights)) * cumulative[:, -1]
+        return (cumulative > threshold[:, None]).argmax(axis=1)
+
+    def _draw(self, counts):
+        # Draw a character from each row of counts, a uniformly random card
+        return self._sample(counts.astype(float))
+
+    def _draw_from_deck(self, games):
+        card = self._draw(self.deck[games])
+        self.deck[games, card] -= 1
+        return card
+
+    # Rules
+    @property
+    def alive(self):
+        return self.influence > 0
+
+    def _lose_influence(self, games, seats):
+        # The player reveals one of their cards at random, eliminated players are skipped
+        keep = self.influence[games, seats] > 0
+        games, seats = games[keep], seats[keep]
+        if not len(games):
+            return
+        card = self._draw(self.hands[games, seats])
+        self.hands[games, seats, card] -= 1
+        self.influence[games, seats] -= 1
+
+    def _replace_card(self, games, seats, cards):
+        # The card shown to win a challenge goes back to the deck for a new one
+        self.hands[games, seats, cards] -= 1
+        self.deck[games, cards] += 1
+        self.hands[games, seats, self._draw_from_deck(games)] += 1
+
+    def _resolve_challenge(self, games, challengers, challenged, claims):
+        """
+        Return a mask of the challenges that succeeded
+        """
+        holds = self.hands[games, challenged, claims] > 0
+        self._lose_influence(games[holds], challengers[holds])
+        self._replace_card(games[holds], challenged[holds], claims[holds])
+        self._lose_influence(games[~holds], challenged[~holds])
+        return ~holds
+
+    def _exchange(self, games, seats):
+        pool = self.hands[games, seats].astype(np.int16)
+        rows = np.arange(len(games))
+        for _ in range(2):
+            pool[rows, self._draw_from_deck(games)] += 1
+        kept = np.zeros_like(pool)
+        keep = self.influence[games, seats]
+        for position in range(int(keep.max(initial=0))):
+            picking = rows[keep > position]
+            card = self._draw(pool[picking])
+            pool[picking, card] -= 1
+            kept[picking, card] += 1
+        self.hands[games, seats] = kept
+        self.deck[games] += pool
+
+    def step(self):
+        """
+        Play one turn of every running game.
+        Return False once every game is over.
+        """
+        games = np.flatnonzero(~self.done)
+        if not len(games):
+            return False
+        count = len(games)
+        rows = np.arange(count)
+        policy = self.policy
+        actor = self.turn[games]
+        coins = self.coins[games, actor]
+        alive = self.alive[games]
+
+        # Step 1: Choose an action and target
+        coin_rows = np.minimum(coins, COIN_ROWS - 1)
+        weights = policy.action_weights[coin_rows] * LEGAL_ACTIONS[coin_rows]
+        action = self._sample(weights)
+        others = alive.copy()
+        others[rows, actor] = False
+        target = np.where(TARGETED[action], self._sample(others.astype(float)), -1)
+
+        # Step 2: Challenge or block, responders are asked in seat order
+        performed = np.ones(count, dtype=bool)
+        undecided = CHALLENGEABLE[action] | BLOCKABLE[action]
+        for seat in range(self.seats):
+            asked = undecided & others[:, seat]
+            if not asked.any():
+                continue
+            seat_of = np.full(count, seat)
+            challenge = asked & CHALLENGEABLE[action] & (self.rng.random(count) < policy.challenge_probability[action])
+            if challenge.any():
+                succeeded = self._resolve_challenge(
+                    games[challenge], seat_of[challenge], actor[challenge], CLAIMS[action[challenge]]
+                )
+                performed[challenge] = ~succeeded
+            block = asked & ~challenge & BLOCKABLE[action] & (self.rng.random(count) < policy.block_probability[action])
+            if block.any():
+                performed[block] = self._resolve_block(
+                    games[block], actor[block], seat_of[block], action[block]
+                )
+            undecided &= ~(challenge | block)
+
+        # Step 3: Perform the action
+        games_done, actor_done, target_done = games[performed], actor[performed], target[performed]
+        action_done = action[performed]
+        self.coins[games_done, actor_done] += INCOMES[action_done] - COSTS[action_done]
+        kills = (action_done == COUP) | (action_done == ASSASSINATE)
+        self._lose_influence(games_done[kills], target_done[kills])
+        steals = action_done == STEAL
+        if steals.any():
+            stolen_games, thief, victim = games_done[steals], actor_done[steals], target_done[steals]
+            amount = np.minimum(self.coins[stolen_games, victim], STEAL_AMOUNT)
+            self.coins[stolen_games, victim] -= amount
+            self.coins[stolen_games, thief] += amount
+        exchanges = action_done == EXCHANGE
+        if exchanges.any():
+            self._exchange(games_done[exchanges], actor_done[exchanges])
+
+        # Step 4: Check if game is over, then move to the next seat alive
+        self.turns[games] += 1
+        alive = self.alive[games]
+        over = alive.sum(axis=1) == 1
+        self.done[games[over]] = True
+        self.winner[games[over]] = alive[over].argmax(axis=1)
+        seats = (actor[:, None] + np.arange(1, self.seats + 1)) % self.seats
+        next_alive = alive[rows[:, None], seats].argmax(axis=1)
+        self.turn[games] = seats[rows, next_alive]
+        return True
+
+    def _resolve_block(self, games, actor, blocker, action):
+        """
+        Return a mask of the actions that go on despite the block
+        """
+        first, second = BLOCK_CLAIMS[action, 0], BLOCK_CLAIMS[action, 1]
+        holds_second = (second >= 0) & (self.hands[games, blocker, np.maximum(second, 0)] > 0)
+        holds_first = self.hands[games, blocker, first] > 0
+        claim = np.where(~holds_first & holds_second, second, first)
+        challenged = self.rng.random(len(games)) < self.policy.block_challenge_probability[action]
+        goes_on = np.zeros(len(games), dtype=bool)
+        if challenged.any():
+            goes_on[challenged] = self._resolve_challenge(
+                games[challenged], actor[challenged], blocker[challenged], claim[challenged]
+            )
+        return goes_on
+
+    def run(self, max_steps=100000):
+        """
+        Play every game to the end.
+        Return the arrays of winner seats and turns played.
+        """
+        for _ in range(max_steps):
+            if not self.step():
+                break
+        return self.winner, self.turns
+
+    def win_rates(self):
+        finished = self.winner[self.done]
+        return np.bincount(finished, minlength=self.seats) / max(len(finished), 1)
+
+
+def cross_check(number_of_games=20000, number_of_players=3, seed=0):
+    """
+    Compare the random AI played by the batch simulator with the one of
+    GameController over number_of_games games each.
+    Return the z scores of the difference of every seat's win rate and of
+    the mean game length, which should stay within about 3 if both engines
+    play the same rules.
+    """
+    from controller import deck_copies
+    from tournament import play_seeded_game
+    from simulation import game_seed
+
+    seats = number_of_players + 3
+    scalar_wins = np.zeros(seats)
+    scalar_turns = np.zeros(number_of_games)
+    for game_index in range(number_of_games):
+        result = play_seeded_game(game_seed(seed, game_index), number_of_players)
+        scalar_wins[result["winner"]] += 1
+        scalar_turns[game_index] = result["turns"]
+
+    # The deck GameController deals the table from
+    batch = BatchSimulator(number_of_games, seats, seed=seed, copies=deck_copies(seats))
+    winners, batch_turns = batch.run()
+    batch_wins = np.bincount(winners, minlength=seats).astype(float)
+
+    scalar_rates = scalar_wins / number_of_games
+    batch_rates = batch_wins / number_of_games
+    pooled = (scalar_rates + batch_rates) / 2
+    rate_error = np.sqrt(np.maximum(pooled * (1 - pooled), 1e-12) * 2 / number_of_games)
+    turns_error = math.sqrt((scalar_turns.var() + batch_turns.var()) / number_of_games)
+    return {
+        "scalar_win_rates": scalar_rates,
+        "batch_win_rates": batch_rates,
+        "win_rate_z": (batch_rates - scalar_rates) / rate_error,
+        "scalar_mean_turns": scalar_turns.mean(),
+        "batch_mean_turns": batch_turns.mean(),
+        "turns_z": (batch_turns.mean() - scalar_turns.mean()) / turns_error,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the batch simulator with GameController on random AI games")
+    parser.add_argument("--games", type=int, default=20000, help="games played by each engine (default: 20000)")
+    parser.add_argument(
+        "--players", type=int, nargs="+", default=list(range(MIN_PLAYERS, MAX_PLAYERS + 1)),
+        choices=range(MIN_PLAYERS, MAX_PLAYERS + 1), help="numbers of players to compare (default: 2 to 6)"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for players in args.players:
+        result = cross_check(args.games, players, args.seed)
+        print(
+            f"{players} players: largest win rate |z| {np.abs(result['win_rate_z']).max():.2f}, "
+            f"game length z {result['turns_z']:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
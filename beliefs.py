@@ -0,0 +1,313 @@
+from itertools import combinations_with_replacement
+from math import comb
+from operator import mul
+from ai import RandomAI
+from constants import CHARACTERS, COUP_RULES_CONFIG
+from events import (
+    ACTION, BLOCK, CHALLENGE, COINS, DEAL, EXCHANGE_DRAW, EXCHANGE_RETURN, GAME_END, GAME_START, NONE, RETURN,
+    REVEAL, TURN
+)
+from state import CARD_CODES, HAND_SIZE
+
+# Character claimed by each action code, NONE when the action claims none
+CLAIMS = tuple(
+    CARD_CODES[rule["performed_by"]] if rule["performed_by"] else NONE for rule in COUP_RULES_CONFIG.values()
+)
+# Events telling nothing of the hands
+UNUSED = frozenset((TURN, COINS, GAME_END))
+
+
+class HandSpace:
+    """
+    Every hand of up to HAND_SIZE cards, as sorted tuples of card codes,
+    with the tables to add a card to a hand or take one out of it.
+    """
+
+    _cache = {}
+
+    def __init__(self, characters):
+        self.characters = characters
+        self.hands = [tuple(combinations_with_replacement(range(characters), size)) for size in range(HAND_SIZE + 1)]
+        index = {hand: position for hands in self.hands for position, hand in enumerate(hands)}
+        self.counts = [[tuple(hand.count(code) for code in range(characters)) for hand in hands] for hands in self.hands]
+        # Position of the hand with one more card, and with one card less or None when it has none of it
+        self.added = [
+            [tuple(index[tuple(sorted(hand + (code,)))] for code in range(characters)) for hand in hands]
+            for hands in self.hands[:-1]
+        ]
+        self.removed = [None] + [
+            [tuple(index[hand[:hand.index(code)] + hand[hand.index(code) + 1:]] if code in hand else None
+                   for code in range(characters)) for hand in hands]
+            for hands in self.hands[1:]
+        ]
+
+        # (code, position of the hand with it added, copies already held) of each hand
+        self.draws = [
+            [tuple((code, self.added[size][position][code], counts[code]) for code in range(characters))
+             for position, counts in enumerate(self.counts[size])]
+            for size in range(HAND_SIZE)
+        ]
+        self._weighing = {}
+        self._fitting = {}
+        self._priors = {}
+
+    def weighing(self, size, code, holding, missing):
+        # Factor of each hand, holding for the hands with the character and missing for the others
+        key = (size, code, holding, missing)
+        factors = self._weighing.get(key)
+        if factors is None:
+            factors = self._weighing[key] = tuple(holding if counts[code] else missing for counts in self.counts[size])
+        return factors
+
+    def holding(self, size, code):
+        return self.weighing(size, code, 1.0, 0.0)
+
+    def fitting(self, size, code, copies):
+        # 1 for the hands holding at most copies of the character, 0 for the others
+        key = (size, code, copies)
+        factors = self._fitting.get(key)
+        if factors is None:
+            factors = self._fitting[key] = tuple(float(counts[code] <= copies) for counts in self.counts[size])
+        return factors
+
+    def prior(self, size, unseen):
+        # Weight of each hand dealt from the unseen counts of each character
+        key = (size, unseen)
+        weights = self._priors.get(key)
+        if weights is None:
+            weights = []
+            for counts in self.counts[size]:
+                weight = 1
+                for code, count in enumerate(counts):
+                    if count:
+                        weight *= comb(unseen[code], count)
+                weights.append(float(weight))
+            weights = self._priors[key] = tuple(weights) if any(weights) else (1.0,) * len(weights)
+        return weights
+
+    @classmethod
+    def for_characters(cls, characters):
+        if characters not in cls._cache:
+            cls._cache[characters] = cls(characters)
+        return cls._cache[characters]
+
+
+class BeliefTracker:
+    """
+    What one seat, the observer, believes the other seats hold.
+    Each opponent gets a probability for every hand it may hold, updated
+    from the events of the game as they come: claims of an action or a
+    block, challenges, revealed cards, cards returned after a challenge
+    and exchanges. Only what the observer can see is used, the cards dealt
+    to other seats and those of their exchanges are never looked at.
+
+    The hands are dealt from the cards the observer cannot see, so a hand
+    needing more copies of a character than are unseen is never believed.
+    A claim is bluff_rate times as likely from a hand without the character
+    as from a hand with it. Opponents are tracked one by one, what one
+    opponent holds is not taken out of what another may hold.
+
+    The weights kept for each hand are relative to the chances of dealing
+    it from the unseen cards, so a card the observer sees only changes the
+    unseen counts, the probabilities are only computed when asked for.
+    """
+
+    def __init__(self, observer, bluff_rate=0.5, characters=len(CHARACTERS)):
+        self.observer = observer
+        self.bluff_rate = bluff_rate
+        self.space = HandSpace.for_characters(characters)
+        self.unseen = []
+        self.sizes = []
+        self.weights = []
+        # Seats of which nothing is known but the cards unseen
+        self.fresh = set()
+
+    def __call__(self, kind, seat, other, code, value):
+        observer = self.observer
+        if kind == DEAL:
+            if seat == observer:
+                self._see(code)
+            else:
+                self._draw(seat)
+        elif kind == ACTION:
+            claim = CLAIMS[code]
+            if seat != observer and claim != NONE:
+                self._weigh(seat, claim, 1.0, self.bluff_rate)
+        elif kind == REVEAL:
+            if seat != observer:
+                self._take(seat, code, shown=True)
+        elif kind == CHALLENGE:
+            # other is the challenged player, who did not hold the character if the challenge succeeded
+            if other != observer:
+                self._weigh(other, code, 0.0, 1.0) if value else self._weigh(other, code, 1.0, 0.0)
+        elif kind == BLOCK:
+            if seat != observer:
+                self._weigh(seat, code, 1.0, self.bluff_rate)
+        elif kind == RETURN:
+            # The card goes back to the deck, unseen as before
+            if seat == observer:
+                self.unseen[code] += 1
+            else:
+                self._take(seat, code, shown=False)
+        elif kind == EXCHANGE_DRAW:
+            if seat == observer:
+                self._see(code)
+        elif kind == EXCHANGE_RETURN:
+            if seat == observer:
+                self.unseen[code] += 1
+            else:
+                # Any cards may have been kept
+                self._forget(seat)
+        elif kind == GAME_START:
+            copies = other
+            self.unseen = [copies] * self.space.characters
+            self.sizes = [0] * seat
+            self.weights = [[1.0] for _ in range(seat)]
+            self.fresh = set(range(seat))
+
+    # Queries
+    def probabilities(self, seat):
+        # Probability of each hand of the size the seat holds, in HandSpace order
+        weights = list(map(mul, self.weights[seat], self.space.prior(self.sizes[seat], tuple(self.unseen))))
+        total = sum(weights)
+        return [weight / total for weight in weights]
+
+    def hands(self, seat):
+        # (hand, probability) of every hand the seat may hold
+        hands = self.space.hands[self.sizes[seat]]
+        return [(hands[position], probability) for position, probability in enumerate(self.probabilities(seat)) if probability]
+
+    def holding(self, seat, code):
+        # Probability the seat holds at least one card of the character
+        return sum(map(mul, self.probabilities(seat), self.space.holding(self.sizes[seat], code)))
+
+    # Updates
+    def _weigh(self, seat, code, holding, missing):
+        size = self.sizes[seat]
+        weights = list(map(mul, self.weights[seat], self.space.weighing(size, code, holding, missing)))
+        # When no hand is left possible the evidence is dropped, only a certainty can rule every hand out
+        if (holding and missing) or any(map(mul, weights, self.space.prior(size, tuple(self.unseen)))):
+            self.weights[seat] = weights
+            self.fresh.discard(seat)
+        else:
+            self._forget(seat)
+
+    def _forget(self, seat):
+        # Nothing known of the hand but the cards unseen now, those seen later stay out of it
+        prior = self.space.prior(self.sizes[seat], tuple(self.unseen))
+        self.weights[seat] = [1.0 if chances else 0.0 for chances in prior]
+        self.fresh.add(seat)
+
+    def _set(self, seat, size, probabilities):
+        # Keep the probabilities of the hands as weights relative to the chances of dealing them
+        self.sizes[seat] = size
+        total = sum(probabilities)
+        if not total:
+            self._forget(seat)
+            return
+        self.fresh.discard(seat)
+        prior = self.space.prior(size, tuple(self.unseen))
+        self.weights[seat] = [
+            probability / (total * chances) if chances else 0.0 for probability, chances in zip(probabilities, prior)
+        ]
+
+    def _take(self, seat, code, shown):
+        """
+        The seat showed a card and lost it, each card of a hand being
+        as likely to be shown. A card shown is no longer unseen.
+        """
+        size = self.sizes[seat]
+        if size == 0:
+            return
+        counts = self.space.counts[size]
+        removed = self.space.removed[size]
+        probabilities = [0.0] * len(self.space.hands[size - 1])
+        for position, probability in enumerate(self.probabilities(seat)):
+            count = counts[position][code]
+            if probability and count:
+                probabilities[removed[position][code]] += probability * count
+        if shown:
+            self._see(code)
+        self._set(seat, size - 1, probabilities)
+
+    def _see(self, code):
+        """
+        One card of the character less unseen. Hands holding more of it
+        than are left unseen are impossible, and stay so when the observer
+        puts a card back: the hands of the other seats did not change.
+        """
+        unseen = self.unseen[code] - 1
+        self.unseen[code] = unseen
+        if unseen >= HAND_SIZE:
+            return
+        space = self.space
+        weights = self.weights
+        for seat, size in enumerate(self.sizes):
+            if size > unseen and seat != self.observer:
+                weights[seat] = list(map(mul, weights[seat], space.fitting(size, code, unseen)))
+
+    def _draw(self, seat):
+        # The seat drew a card the observer cannot see, out of the unseen cards not in its hand
+        size = self.sizes[seat]
+        if size == HAND_SIZE:
+            return
+        if seat in self.fresh:
+            # Cards drawn one by one from the unseen cards are dealt as a whole hand would be
+            self.sizes[seat] = size + 1
+            self._forget(seat)
+            return
+        unseen = self.unseen
+        probabilities = [0.0] * len(self.space.hands[size + 1])
+        for probability, draws in zip(self.probabilities(seat), self.space.draws[size]):
+            if probability:
+                for code, added, count in draws:
+                    drawable = unseen[code] - count
+                    if drawable > 0:
+                        probabilities[added] += probability * drawable
+        self._set(seat, size + 1, probabilities)
+
+
+class Beliefs:
+    """
+    A listener keeping a BeliefTracker for each observer seat,
+    every seat by default, renewed at the start of each game.
+    """
+
+    def __init__(self, observers=None, bluff_rate=0.5):
+        self.observers = observers
+        self.bluff_rate = bluff_rate
+        self.trackers = {}
+
+    def __call__(self, kind, seat, other, code, value):
+        if kind in UNUSED:
+            return
+        if kind == GAME_START:
+            observers = range(seat) if self.observers is None else self.observers
+            self.trackers = {observer: BeliefTracker(observer, self.bluff_rate) for observer in observers}
+        for tracker in self.trackers.values():
+            tracker(kind, seat, other, code, value)
+
+    def tracker(self, seat):
+        return self.trackers[seat]
+
+
+class BeliefAI(RandomAI):
+    """
+    Challenges the claims its beliefs find unlikely and blocks with the
+    characters it holds, or as a bluff one time in bluff_rate, otherwise
+    plays at random. beliefs must listen to the games played.
+    """
+
+    def __init__(self, beliefs, challenge_below=0.35, bluff_rate=0.2):
+        self.beliefs = beliefs
+        self.challenge_below = challenge_below
+        self.bluff_rate = bluff_rate
+
+    def decide_to_challenge(self, controller, player, challenged, action, target=None, claimed_card=None):
+        claimed = CARD_CODES[claimed_card or COUP_RULES_CONFIG[action]["performed_by"]]
+        return self.beliefs.tracker(player.seat).holding(challenged.seat, claimed) < self.challenge_below
+
+    def decide_to_block(self, controller, player, blocked_player, action, target=None):
+        if any(card in player.cards for card in COUP_RULES_CONFIG[action]["blocked_by"]):
+            return True
+        return player.rng.random() < self.bluff_rate
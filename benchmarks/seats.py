@@ -0,0 +1,110 @@
+"""
+Time the alive player bookkeeping of the controller at growing table sizes.
+For each number of seats, play headless games and time the game over
+check, the move to the next turn and the iteration over the opponents,
+next to the linear scans over the players they replace.
+
+    python -m benchmarks.seats --games 20 --seats 6 20 100
+"""
+import argparse
+from time import perf_counter
+from controller import GameController
+
+SEATS = (6, 20, 100)
+
+
+def time_call(function, repeat):
+    # Average time of one call in nanoseconds
+    start = perf_counter()
+    for _ in range(repeat):
+        function()
+    return (perf_counter() - start) / repeat * 1e9
+
+
+def scan_game_over(game):
+    return len([player for player in game.players if not player.is_eliminated]) == 1
+
+
+def scan_next_seat(game):
+    index = game.current_player_index
+    while True:
+        index = (index + 1) % len(game.players)
+        if not game.players[index].is_eliminated:
+            return index
+
+
+def scan_opponents(game, player):
+    for other in [other for other in game.players if other is not player and not other.is_eliminated]:
+        pass
+
+
+def ring_opponents(game, player):
+    for other in game.other_players(player):
+        pass
+
+
+def midgame(seats, seed):
+    # A game with about half of its seats eliminated
+    game = GameController(headless=True, seed=seed, number_of_seats=seats)
+    while game.state.alive_count > max(2, seats // 2):
+        game.play_turn()
+        game.next_turn()
+    return game
+
+
+def play_games(seats, games, seed):
+    turns = 0
+    start = perf_counter()
+    for index in range(games):
+        game = GameController(headless=True, seed=seed + index, number_of_seats=seats)
+        while not game.is_game_over():
+            game.play_turn()
+            game.next_turn()
+            turns += 1
+    return turns, perf_counter() - start
+
+
+def run(seat_counts=SEATS, games=20, repeat=20000, seed=0):
+    results = []
+    for seats in seat_counts:
+        # Built first so the move tables of small tables are not timed
+        game = midgame(seats, seed)
+        turns, seconds = play_games(seats, games, seed)
+        player = game.current_player
+        next_seat = game.state.next_alive
+        results.append({
+            "seats": seats,
+            "turns_per_second": turns / seconds,
+            "game_over_ns": (time_call(game.is_game_over, repeat), time_call(lambda: scan_game_over(game), repeat)),
+            "next_turn_ns": (
+                time_call(lambda: next_seat(game.current_player_index), repeat),
+                time_call(lambda: scan_next_seat(game), repeat)
+            ),
+            "opponents_ns": (
+                time_call(lambda: ring_opponents(game, player), repeat),
+                time_call(lambda: scan_opponents(game, player), repeat)
+            ),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the alive player bookkeeping at several table sizes.")
+    parser.add_argument("--games", type=int, default=20, help="number of full games played per table size")
+    parser.add_argument("--seats", type=int, nargs="+", default=list(SEATS), help="table sizes to time")
+    parser.add_argument("--repeat", type=int, default=20000, help="calls per micro timing")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    args = parser.parse_args()
+
+    print(f"{'seats':>5} {'turns/sec':>10} {'game over':>18} {'next turn':>18} {'opponents':>20}")
+    print(f"{'':>5} {'':>10} {'ring / scan ns':>18} {'ring / scan ns':>18} {'ring / scan ns':>20}")
+    for result in run(args.seats, args.games, args.repeat, args.seed):
+        timings = "".join(
+            f" {ring:>8.0f} / {scan:<7.0f}"
+            for ring, scan in (result["game_over_ns"], result["next_turn_ns"], result["opponents_ns"])
+        )
+        print(f"{result['seats']:>5} {result['turns_per_second']:>10.0f}{timings}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Load the game server with bot clients answering every prompt at random.
+Each bot plays its games back to back, the turn latency of a table is
+the time between two of its state messages, as seen by its clients.
+Tables per core is the number of tables finished per CPU second of the
+process, which runs the bots too unless --host or --unix is given.
+
+    python -m benchmarks.server_load --tables 200 --games 5
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+from time import perf_counter, process_time
+from server import GameServer
+
+
+async def bot(connect, games, players, humans, latencies, seed):
+    rng = random.Random(seed)
+    reader, writer = await connect()
+    for _ in range(games):
+        writer.write(json.dumps({"type": "join", "name": f"Bot {seed}", "players": players, "humans": humans}).encode() + b"\n")
+        last_state = None
+        while line := await reader.readline():
+            message = json.loads(line)
+            kind = message["type"]
+            if kind == "state":
+                now = perf_counter()
+                if last_state is not None:
+                    latencies.append(now - last_state)
+                last_state = now
+            elif kind == "prompt":
+                options = range(len(message["options"]))
+                keep = message.get("keep")
+                choice = rng.sample(options, keep) if keep is not None else rng.choice(options)
+                writer.write(json.dumps({"type": "answer", "id": message["id"], "choice": choice}).encode() + b"\n")
+            elif kind == "game_over" or kind == "error" and "stopped" in message["error"]:
+                break
+    writer.close()
+
+
+async def run(tables, games, players, humans, host=None, port=8765, path=None, seed=0):
+    listener = None
+    if host is None and path is None:
+        server = GameServer(max_tables=tables, seed=seed)
+        listener = await server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        host = "127.0.0.1"
+
+    def connect():
+        if path:
+            return asyncio.open_unix_connection(path)
+        return asyncio.open_connection(host, port)
+
+    latencies = []
+    start, cpu_start = perf_counter(), process_time()
+    await asyncio.gather(*(
+        bot(connect, games, players, humans, latencies, seed * 1000003 + index)
+        for index in range(tables * humans)
+    ))
+    seconds, cpu_seconds = perf_counter() - start, process_time() - cpu_start
+    if listener is not None:
+        listener.close()
+        await listener.wait_closed()
+    finished = tables * games
+    latencies.sort()
+    return {
+        "tables": finished,
+        "seconds": seconds,
+        "tables_per_second": finished / seconds,
+        "tables_per_cpu_second": finished / cpu_seconds if cpu_seconds else 0.0,
+        "turns": len(latencies),
+        "latency_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+        "latency_p99": latencies[int(len(latencies) * 0.99)] if latencies else 0.0,
+        "latency_mean": statistics.fmean(latencies) if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the game server with bot clients.")
+    parser.add_argument("--tables", type=int, default=100, help="tables played at the same time")
+    parser.add_argument("--games", type=int, default=3, help="games played by each table")
+    parser.add_argument("--players", type=int, default=3)
+    parser.add_argument("--humans", type=int, default=1, help="bot clients per table")
+    parser.add_argument("--host", help="server to load, one is started in process by default")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH", help="Unix socket of the server to load")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.tables, args.games, args.players, args.humans, args.host, args.port, args.unix, args.seed))
+    print(f"{result['tables']} tables in {result['seconds']:.2f}s, {result['tables_per_second']:.1f} tables/sec, "
+          f"{result['tables_per_cpu_second']:.1f} tables per CPU second")
+    print(f"Turn latency over {result['turns']} turns: mean {result['latency_mean'] * 1000:.2f}ms, "
+          f"p50 {result['latency_p50'] * 1000:.2f}ms, p99 {result['latency_p99'] * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Load the spectator channel of the game server with watcher clients.
+Every watcher follows the featured tables for a number of games, reading
+each message, and stalled watchers follow them without ever reading, so
+their queues fill up until they are skipped to snapshots and dropped.
+The socket buffers of the stalled watchers and of the server are kept
+small, the kernel would otherwise hold megabytes for each of them before
+any queue filled.
+The fan-out spread of an event is the time between the first and the
+last watcher reading it, events per second counts every event read by
+every watcher.
+
+    python -m benchmarks.spectators --watchers 2000 --stalled 100 --games 20
+"""
+import argparse
+import asyncio
+import json
+import socket
+from time import perf_counter, process_time
+from server import GameServer
+
+
+class Watched:
+    # Events read by the watchers, and the times of the first and last reading of each
+    def __init__(self):
+        self.events = 0
+        self.snapshots = 0
+        self.first = {}
+        self.last = {}
+        self.hidden_cards = 0
+        # Reading watchers the server disconnected
+        self.disconnected = 0
+
+    def read(self, message, now):
+        if message["type"] == "snapshot":
+            self.snapshots += 1
+            return
+        self.events += 1
+        key = (message["table"], message["seq"])
+        self.first.setdefault(key, now)
+        self.last[key] = now
+        if message["event"] in ("deal", "exchange_draw", "exchange_return") and "card" in message:
+            self.hidden_cards += 1
+
+
+async def watcher(connect, games, watched):
+    reader, writer = await connect()
+    writer.write(b'{"type": "watch"}\n')
+    followed = 0
+    try:
+        while line := await reader.readline():
+            message = json.loads(line)
+            kind = message["type"]
+            if kind in ("event", "snapshot"):
+                watched.read(message, perf_counter())
+            over = kind == "event" and message["event"] == "game_end" or kind == "snapshot" and message["winner"] is not None
+            if over:
+                followed += 1
+            if over or kind == "error":
+                if followed == games:
+                    break
+                if kind == "error":
+                    await asyncio.sleep(0.001)
+                writer.write(b'{"type": "watch"}\n')
+        else:
+            # Dropped by the server
+            watched.disconnected += 1
+    except OSError:
+        watched.disconnected += 1
+    writer.close()
+
+
+async def stalled_watcher(connect, stop):
+    # Follow the featured tables without reading anything, until stop is set
+    reader, writer = await connect(receive_buffer=4096)
+    try:
+        while not stop.is_set() and not writer.is_closing():
+            writer.write(b'{"type": "watch"}\n')
+            await asyncio.sleep(0.05)
+    except OSError:
+        pass
+    writer.close()
+
+
+async def run(watchers, stalled, games, tables=1, queue=256, skips=3, delay=0.001):
+    server = GameServer(featured=tables, featured_delay=delay, spectator_queue=queue, spectator_skips=skips)
+    listener = await server.start(port=0)
+    port = listener.sockets[0].getsockname()[1]
+    # Accepted connections inherit the send buffer of the listening socket
+    listener.sockets[0].setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 16384)
+
+    async def connect(receive_buffer=None):
+        if receive_buffer is None:
+            return await asyncio.open_connection("127.0.0.1", port, limit=1 << 20)
+        # Set before connecting, for the window advertised to follow it
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+        sock.setblocking(False)
+        await asyncio.get_running_loop().sock_connect(sock, ("127.0.0.1", port))
+        # The stream reads up to twice its limit ahead of the reader
+        return await asyncio.open_connection(sock=sock, limit=receive_buffer)
+
+    watched = Watched()
+    stop = asyncio.Event()
+    start, cpu_start = perf_counter(), process_time()
+    stalling = asyncio.gather(*(stalled_watcher(connect, stop) for _ in range(stalled)))
+    await asyncio.gather(*(watcher(connect, games, watched) for _ in range(watchers)))
+    seconds, cpu_seconds = perf_counter() - start, process_time() - cpu_start
+    stop.set()
+    await stalling
+    server.stop_featured()
+    while server.running:
+        await asyncio.sleep(0.01)
+    listener.close()
+    await listener.wait_closed()
+    dropped = server.dropped_spectators
+    spreads = sorted(watched.last[key] - watched.first[key] for key in watched.first)
+    return {
+        "seconds": seconds,
+        "cpu_seconds": cpu_seconds,
+        "events": watched.events,
+        "snapshots": watched.snapshots,
+        "events_per_second": watched.events / seconds,
+        "tables_finished": server.finished_tables,
+        "spread_p50": spreads[len(spreads) // 2] if spreads else 0.0,
+        "spread_p99": spreads[int(len(spreads) * 0.99)] if spreads else 0.0,
+        "dropped": dropped,
+        "disconnected": watched.disconnected,
+        "hidden_cards": watched.hidden_cards,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the spectator channel of the game server.")
+    parser.add_argument("--watchers", type=int, default=1000, help="watchers reading every message")
+    parser.add_argument("--stalled", type=int, default=0, help="watchers never reading")
+    parser.add_argument("--games", type=int, default=10, help="games followed by each watcher")
+    parser.add_argument("--tables", type=int, default=1, help="featured tables")
+    parser.add_argument("--queue", type=int, default=256, help="messages a watcher may have waiting")
+    parser.add_argument("--delay", type=float, default=0.001, help="seconds the AI pauses before each decision")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.watchers, args.stalled, args.games, args.tables, args.queue, delay=args.delay))
+    print(f"{result['events']} events read in {result['seconds']:.2f}s, {result['events_per_second']:.0f} events/sec, "
+          f"{result['cpu_seconds']:.2f} CPU seconds, {result['tables_finished']} games played")
+    print(f"Fan-out spread: p50 {result['spread_p50'] * 1000:.2f}ms, p99 {result['spread_p99'] * 1000:.2f}ms")
+    print(f"{result['snapshots']} snapshots read, {result['dropped']} watchers dropped "
+          f"({result['disconnected']} of them reading), {result['hidden_cards']} hidden cards seen")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Benchmarks of the engine hot paths, to catch performance regressions.
+
+    python -m benchmarks.suite run
+    python -m benchmarks.suite compare BASE HEAD --threshold 0.10
+
+run times every benchmark and writes the results to
+benchmarks/results/<commit>.json, the commit being suffixed with
++dirty when the working tree has changes. compare reads two result
+files, by commit prefix or by path, and exits with status 1 when a
+benchmark of HEAD is slower, or uses more memory, than BASE by more
+than the threshold.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tracemalloc
+from datetime import datetime, timezone
+from time import perf_counter
+from ai import RandomAI
+from constants import CARD_COPIES, CHARACTERS
+from controller import GameController
+from deck import Deck
+from simulation import game_seed, play_game
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(__file__), "results")
+DEFAULT_THRESHOLD = 0.10
+BENCHMARKS = {}
+
+
+def benchmark(name, unit="s"):
+    # Register a function returning (value, ops), value being per op and lower being better
+    def register(function):
+        BENCHMARKS[name] = (function, unit)
+        return function
+    return register
+
+
+def best_time(function, ops, repeat):
+    # Best time of one op over repeat runs of ops calls, the least disturbed by the machine
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        function(ops)
+        best = min(best, perf_counter() - start)
+    return best / ops
+
+
+class PassingAI(RandomAI):
+    # Never challenges nor blocks, so every responder is asked
+    def decide_to_challenge(self, controller, player, challenged, action, target=None, claimed_card=None):
+        return False
+
+    def decide_to_block(self, controller, player, blocked_player, action, target=None):
+        return False
+
+
+@benchmark("deck_draw_return")
+def deck_draw_return(scale):
+    deck = Deck(CHARACTERS, CARD_COPIES, random.Random(1))
+
+    def run(ops):
+        draw, put_back = deck.draw_index, deck.put_back_index
+        for _ in range(ops):
+            put_back(draw())
+    ops = 100000 * scale
+    return best_time(run, ops, 5), ops
+
+
+@benchmark("player_available_actions")
+def player_available_actions(scale):
+    game = GameController(headless=True, seed=1)
+    player = game.players[0]
+    coins = list(range(13))
+
+    def run(ops):
+        available = game.player_available_actions
+        for index in range(ops):
+            player.coins = coins[index % 13]
+            available(player)
+    ops = 100000 * scale
+    return best_time(run, ops, 5), ops
+
+
+@benchmark("challenge_or_block_resolution")
+def challenge_or_block_resolution(scale):
+    # Every responder of a 6 seat game is asked to challenge and block a foreign aid and a steal
+    game = GameController(headless=True, seed=1, ai=PassingAI())
+    actor, target = game.players[0], game.players[1]
+
+    def run(ops):
+        resolve = game.challenge_or_block
+        for _ in range(ops // 2):
+            resolve("foreign_aid", actor)
+            resolve("steal", actor, target)
+    ops = 20000 * scale
+    return best_time(run, ops, 5), ops
+
+
+@benchmark("perform_action_dispatch")
+def perform_action_dispatch(scale):
+    game = GameController(headless=True, seed=1)
+    player = game.players[0]
+    actions = ["income", "foreign_aid", "tax"]
+
+    def run(ops):
+        perform = game.perform_action
+        for index in range(ops):
+            perform(actions[index % 3], player)
+        player.coins = 2
+    ops = 50000 * scale
+    return best_time(run, ops, 5), ops
+
+
+def full_game(seats):
+    def measure(scale):
+        games = 200 * scale
+
+        def run(ops):
+            for index in range(ops):
+                play_game(GameController(headless=True, seed=game_seed(seats, index), number_of_seats=seats))
+        return best_time(run, games, 3), games
+    return measure
+
+
+for seats in range(2, 7):
+    benchmark(f"full_game_{seats}_seats")(full_game(seats))
+
+
+@benchmark("peak_memory_per_game", unit="bytes")
+def peak_memory_per_game(scale):
+    # Peak memory allocated while setting up and playing a 6 seat game, the median of the games
+    peaks = []
+    games = 20 * scale
+    for index in range(games):
+        tracemalloc.start()
+        play_game(GameController(headless=True, seed=game_seed("memory", index), number_of_seats=6))
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return sorted(peaks)[len(peaks) // 2], games
+
+
+def setup_game(reuse):
+    # Set up the games of a 6 seat table, with a new controller for each or by resetting one
+    controller = GameController(headless=True, seed=game_seed("setup", 0), number_of_seats=6)
+    if reuse:
+        def setup(index):
+            controller.reset(game_seed("setup", index))
+            return controller
+    else:
+        def setup(index):
+            return GameController(headless=True, seed=game_seed("setup", index), number_of_seats=6)
+    return setup
+
+
+def setup_time(reuse):
+    def measure(scale):
+        games = 2000 * scale
+        setup = setup_game(reuse)
+
+        def run(ops):
+            for index in range(ops):
+                setup(index)
+        return best_time(run, games, 5), games
+    return measure
+
+
+def setup_blocks(reuse):
+    def measure(scale):
+        # Memory blocks a game setup leaves allocated, the previous game still being held, the median of the games
+        games = 200 * scale
+        setup = setup_game(reuse)
+        counts = []
+        gc.disable()
+        try:
+            for index in range(games):
+                before = sys.getallocatedblocks()
+                controller = setup(index)
+                counts.append(sys.getallocatedblocks() - before)
+                play_game(controller)
+                del controller
+        finally:
+            gc.enable()
+        return sorted(counts)[len(counts) // 2], games
+    return measure
+
+
+for name, reuse in (("new", False), ("reset", True)):
+    benchmark(f"game_setup_{name}")(setup_time(reuse))
+    benchmark(f"allocated_blocks_per_game_{name}", unit="blocks")(setup_blocks(reuse))
+
+
+def current_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"]).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("+dirty" if dirty else "")
+
+
+def run(names=None, scale=1):
+    """
+    Run the benchmarks, all of them by default.
+    Return a dict of name: {"value", "unit", "ops"}.
+    """
+    results = {}
+    for name, (function, unit) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        value, ops = function(scale)
+        results[name] = {"value": value, "unit": unit, "ops": ops}
+    return results
+
+
+def write_results(results, directory=RESULTS_DIRECTORY, commit=None):
+    # Results of a commit already written are kept unless run again
+    commit = commit or current_commit()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{commit}.json")
+    if os.path.exists(path):
+        with open(path) as file:
+            results = {**json.load(file)["results"], **results}
+    with open(path, "w") as file:
+        json.dump({
+            "commit": commit,
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }, file, indent=2, sort_keys=True)
+    return path
+
+
+def load_results(reference, directory=RESULTS_DIRECTORY):
+    # Results of a path, or of the only commit starting with the reference
+    if not os.path.exists(reference):
+        matches = [name for name in os.listdir(directory) if name.startswith(reference) and name.endswith(".json")]
+        if len(matches) != 1:
+            raise SystemExit(f"{len(matches)} result files match {reference}.")
+        reference = os.path.join(directory, matches[0])
+    with open(reference) as file:
+        return json.load(file)
+
+
+def compare(base, head, threshold=DEFAULT_THRESHOLD):
+    """
+    Return (name, base value, head value, relative change, regressed)
+    for every benchmark of both results, a change being regressed
+    when head is more than threshold above base.
+    """
+    rows = []
+    for name, result in head["results"].items():
+        if name not in base["results"]:
+            continue
+        before, after = base["results"][name]["value"], result["value"]
+        change = (after - before) / before if before else 0.0
+        rows.append((name, before, after, change, change > threshold))
+    return rows
+
+
+def format_value(value, unit):
+    if unit == "bytes":
+        return f"{value / 1024:.1f} KiB"
+    if unit == "blocks":
+        return f"{value:.0f} blocks"
+    if value < 1e-3:
+        return f"{value * 1e6:.2f} us"
+    return f"{value * 1e3:.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the engine hot paths.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_command = commands.add_parser("run", help="run the benchmarks and write their results")
+    run_command.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="benchmarks to run")
+    run_command.add_argument("--scale", type=int, default=1, help="multiply the work of every benchmark")
+    run_command.add_argument("--output", default=RESULTS_DIRECTORY, help="directory of the result files")
+    compare_command = commands.add_parser("compare", help="compare the results of two commits")
+    compare_command.add_argument("base", help="commit prefix or result file of the reference")
+    compare_command.add_argument("head", help="commit prefix or result file to check")
+    compare_command.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="slowdown tolerated, 0.10 is 10%%")
+    compare_command.add_argument("--directory", default=RESULTS_DIRECTORY, help="directory of the result files")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run(args.only, args.scale)
+        for name, result in results.items():
+            print(f"{name:<32} {format_value(result['value'], result['unit']):>12}")
+        print(f"Results written to {write_results(results, args.output)}")
+        return
+
+    base, head = load_results(args.base, args.directory), load_results(args.head, args.directory)
+    rows = compare(base, head, args.threshold)
+    print(f"{base['commit'][:12]} -> {head['commit'][:12]}")
+    for name, before, after, change, regressed in rows:
+        unit = head["results"][name]["unit"]
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<32} {format_value(before, unit):>12} {format_value(after, unit):>12} {change:+8.1%}{flag}")
+    if any(row[4] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,17 @@
-from helpers import colorize_text
-
-ACTION_LABELS = {
-    "income": colorize_text("Income (Take 1 coin)", "income"),
-    "foreign_aid": colorize_text("Foreign aid (Take 2 coins)", "foreign_aid"),
-    "coup": colorize_text("Coup (Pay 7 coins to launch a coup)", "coup"),
-    "tax": colorize_text("Tax (Take 3 coins as the Duke)", "tax"),
-    "steal": colorize_text("Steal (Steal 2 coins as the Captain)", "steal"),
-    "exchange": colorize_text("Exchange (Exchange cards with the Court Deck as the Ambassador)", "exchange"),
-    "assassinate": colorize_text("Assassinate (Pay 3 coins to assassinate another player's influence)", "assassinate")
+ACTION_DESCRIPTIONS = {
+    "income": "Income (Take 1 coin)",
+    "foreign_aid": "Foreign aid (Take 2 coins)",
+    "coup": "Coup (Pay 7 coins to launch a coup)",
+    "tax": "Tax (Take 3 coins as the Duke)",
+    "steal": "Steal (Steal 2 coins as the Captain)",
+    "exchange": "Exchange (Exchange cards with the Court Deck as the Ambassador)",
+    "assassinate": "Assassinate (Pay 3 coins to assassinate another player's influence)"
 }
 
 # Characters
 CHARACTERS = ["duke", "assassin", "captain", "ambassador", "contessa"]
+# Copies of each character in the court deck
+CARD_COPIES = 3
 
 # Rules config for each action
 COUP_RULES_CONFIG = {
@@ -67,6 +67,9 @@ COUP_RULES_CONFIG = {
     }
 }
 
+# Actions played against another player
+TARGETED_ACTIONS = ["assassinate", "steal", "coup"]
+
 # constants
 MAX_COINS_FOR_COUP = 10
 MIN_PLAYERS = 2
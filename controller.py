@@ -1,39 +1,212 @@
+import math
 import random
-from time import sleep
-from views import GameView
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from time import monotonic, sleep
+from views import SILENT, GameView, PlayerView, Renderer, no_input
 from player import Player
+from ai import RandomAI
+from moves import BLOCK as BLOCK_RESPONSE, CHALLENGE as CHALLENGE_RESPONSE, PASS, MoveGenerator
+from state import CARD_CODES, HAND_SIZE, GameState
+from events import (
+    ACTION,
+    ACTION_CODES,
+    BLOCK,
+    CHALLENGE,
+    COINS,
+    DEAL,
+    EXCHANGE_DRAW,
+    EXCHANGE_RETURN,
+    GAME_END,
+    GAME_START,
+    NONE,
+    RETURN,
+    REVEAL,
+    TURN,
+    from_seed,
+    is_recorded_seed
+)
 from constants import (
+    CARD_COPIES,
     CHARACTERS,
     COUP_RULES_CONFIG,
-    MAX_COINS_FOR_COUP,
     MIN_PLAYERS,
-    MAX_PLAYERS
+    MAX_PLAYERS,
+    TARGETED_ACTIONS
 )
 
 
+def deck_copies(seats):
+    # Copies of each character to deal every seat and the two cards drawn by an exchange
+    return max(CARD_COPIES, math.ceil((seats * HAND_SIZE + 2) / len(CHARACTERS)))
+
+
 class GameController:
-    def __init__(self, number_of_players=3):
+    def __init__(
+        self, number_of_players=3, headless=False, ai_delay=None, sleep=sleep, seed=None, ai=None, state=None,
+        rng=None, number_of_seats=None, listeners=None, view=None, player_view=None, human_seats=None,
+        concurrent_responses=False, response_deadline=None, instruments=None, copies=None
+    ):
+        """
+        A headless game has only AI players, renders nothing and does not
+        pace the AI unless an ai_delay is given explicitly.
+        All the randomness of a game comes from one generator seeded with seed,
+        or the given rng, so a game with a given seed can be played again exactly.
+        Coins, cards, the deck and the turn live in self.state,
+        the players only read and write their seat of it.
+        A game can continue from an existing state, which is then used as is.
+        ai is the strategy of the AI seats, RandomAI by default.
+        A game of number_of_players seats number_of_players + 3 players,
+        number_of_seats sets the size of the table directly, for variants
+        bigger than the standard game. Copies of each character are added
+        to the deck of a big table so every seat can be dealt, copies sets
+        the copies of each character directly, as a replayed log records them.
+        listeners are called with every event of the game as
+        (kind, seat, other, code, value), see events.EventSchema.
+        view and player_view replace the terminal views, human_seats lists
+        the seats prompted through them instead of played by the AI,
+        the first seat by default and none in a headless game.
+        With concurrent_responses every player is asked at once whether they
+        challenge or block, see poll_responses, those who did not answer
+        within response_deadline seconds pass. A terminal game asks in turn.
+        instruments, an instruments.Instruments, times the phases of every
+        turn and counts the events of the game.
+        """
         # Validation
-        if number_of_players < 2 or number_of_players > 6:
+        if number_of_seats is not None:
+            if number_of_seats < 2:
+                raise ValueError("A game needs at least 2 seats")
+        elif state is None and (number_of_players < 2 or number_of_players > 6):
             raise ValueError("Number of players must be between 2 and 6")
 
-        # Setup the deck
-        self.deck = CHARACTERS * 3
-        self.reshuffle_deck()
+        self.headless = headless
+        if ai_delay is None:
+            ai_delay = 0 if headless else 1
+        self.ai_delay = ai_delay
+        self.sleep = sleep
+        self.seed = seed
+        self.rng = rng if rng is not None else random.Random(seed)
+        ai = ai if ai is not None else RandomAI()
+        self.listeners = list(listeners or [])
+        self.instruments = instruments
+        if instruments is not None:
+            self.listeners.append(instruments)
+        self.turns = 0
+        self.concurrent_responses = concurrent_responses
+        self.response_deadline = response_deadline
+        self._response_pool = None
+
+        # Setup the views, the players all share one view
+        if view is None:
+            view = GameView(Renderer(verbosity=SILENT, input=no_input) if headless else None)
+        if player_view is None:
+            player_view = PlayerView(getattr(view, "renderer", None))
+        self.view = view
+        if human_seats is None:
+            human_seats = () if headless else (0,)
+        # Kept to seat the players of a bigger table on reset
+        self.ai = ai
+        self.player_view = player_view
+        self.human_seats = human_seats
+
+        # Setup the state, which holds the deck
+        dealt = state is not None
+        if state is None:
+            if number_of_seats is None:
+                number_of_seats = number_of_players + 3
+            if copies is None:
+                copies = deck_copies(number_of_seats)
+            state = GameState(number_of_seats, self.rng, copies=copies)
+        self.state = state
+        number_of_seats = state.seats
+        self.moves = MoveGenerator.for_game(number_of_seats)
+        if not dealt and self.listeners:
+            seeded = is_recorded_seed(seed)
+            self.emit(GAME_START, number_of_seats, state.keys.copies, int(seeded), from_seed(seed) if seeded else 0)
 
         # Setup the players
-        self.players = [Player("Human", False, self.deck[:2])]
-        self.deck = self.deck[2:]  # Remove the cards taken by the human player
-        for i in range(1, number_of_players + 3):
-            self.players.append(Player(f"AI {i}", True, self.deck[:2]))
-            self.deck = self.deck[2:]  # Remove the cards taken by AI players
-
-        # Set the current player to the first player
-        self.current_player_index = 0
+        self.players = []
+        for i in range(number_of_seats):
+            self.players.append(self.seat_player(i, None if dealt else self.deal_cards(2)))
+            if not dealt and self.listeners:
+                for code in self.state.hand(i):
+                    self.emit(DEAL, i, code=code)
+
+        # The first player starts, which is the initial turn of the state
         self.actions = COUP_RULES_CONFIG.keys()
 
-        # Setup the view, we could pass the view as a parameter to the constructor
-        self.view = GameView()
+    def seat_player(self, seat, cards):
+        is_ai = seat not in self.human_seats
+        return Player(
+            f"AI {seat}" if is_ai else "Human",
+            is_ai,
+            cards,
+            view=self.player_view,
+            ai=self.ai if is_ai else None,
+            rng=self.rng,
+            ai_delay=self.ai_delay,
+            sleep=self.sleep,
+            state=self.state,
+            seat=seat
+        )
+
+    def reset(self, seed=None, number_of_players=None):
+        """
+        Start a new game in place, the same game GameController(number_of_players,
+        seed=seed) would play with the strategies, views and listeners of this one.
+        The generator is seeded again, the state is emptied and dealt again
+        and the players keep their names, strategies and view, so a new game
+        allocates next to nothing. Only a table of another size, when
+        number_of_players is given, gets a new state and more players.
+        Players keep the strategy they were given, even if it was changed
+        after the controller was built.
+        """
+        self.close()
+        state = self.state
+        seats = state.seats
+        if number_of_players is not None:
+            if number_of_players < MIN_PLAYERS or number_of_players > MAX_PLAYERS:
+                raise ValueError("Number of players must be between 2 and 6")
+            seats = number_of_players + 3
+        self.seed = seed
+        self.rng.seed(seed)
+        self.turns = 0
+        if seats == state.seats:
+            state.reset()
+            # A state given to the controller may draw from another generator
+            state.deck.rng = self.rng
+        else:
+            state = self.state = GameState(seats, self.rng, copies=deck_copies(seats))
+            self.moves = MoveGenerator.for_game(seats)
+            del self.players[seats:]
+            for player in self.players:
+                player.state = state
+            self.players.extend(self.seat_player(seat, None) for seat in range(len(self.players), seats))
+        listeners = self.listeners
+        if listeners:
+            seeded = is_recorded_seed(seed)
+            self.emit(GAME_START, seats, state.keys.copies, int(seeded), from_seed(seed) if seeded else 0)
+
+        # Deal as the players of a new controller are dealt, seat by seat
+        for seat in range(seats):
+            for _ in range(min(HAND_SIZE, state.deck_size)):
+                code = state.draw_card()
+                state.give_card(seat, code)
+            if listeners:
+                for code in state.hand(seat):
+                    self.emit(DEAL, seat, code=code)
+
+    def emit(self, kind, seat, other=NONE, code=NONE, value=0):
+        # Pass an event of the game to the listeners
+        for listener in self.listeners:
+            listener(kind, seat, other, code, value)
+
+    @property
+    def current_player_index(self):
+        return self.state.turn
+
+    @current_player_index.setter
+    def current_player_index(self, index):
+        self.state.set_turn(index)
 
     @property
     def current_player(self):
@@ -41,29 +214,69 @@ class GameController:
 
     @property
     def blockable_actions(self):
-        # loop through COUP_RULES_CONFIG and return a list of actions that can be blocked
-        blockable_actions = []
-        for action in self.actions:
-            if COUP_RULES_CONFIG[action]["blocked_by"]:
-                blockable_actions.append(action)
-        return blockable_actions
+        # The actions of COUP_RULES_CONFIG that can be blocked
+        return self.moves.blockable_actions
 
     # Deck methods
-    def reshuffle_deck(self, cards=[]):
-        # Put the cards back to the deck and shuffle
-        self.deck.extend(cards)
-        random.shuffle(self.deck)
+    def return_cards_to_deck(self, cards):
+        # Put the cards back to the deck, draws are random so no shuffle is needed
+        for card in cards:
+            self.state.return_card(CARD_CODES[card])
 
     def take_card_from_deck(self):
         # Take a card from the deck
-        if len(self.deck) == 0:
+        if self.state.deck_size == 0:
             self.view.print_error("Not enough cards in the deck.")
             raise Exception("Not enough cards in the deck.")
-        card = self.deck.pop()
-        self.reshuffle_deck()
-        return card
+        return CHARACTERS[self.state.draw_card()]
+
+    def deal_cards(self, number_of_cards):
+        # Deal up to number_of_cards, the last seats of a big table may get less
+        number_of_cards = min(number_of_cards, self.state.deck_size)
+        return [self.take_card_from_deck() for _ in range(number_of_cards)]
 
     # Game methods
+    def play_turn(self):
+        """
+        Play the turn of the current player: choose an action,
+        let the other players challenge or block it, then perform it.
+        Return a tuple of (action, target, performed).
+        """
+        current_player = self.current_player
+        instruments = self.instruments
+        self.turns += 1
+        if self.listeners:
+            self.emit(TURN, current_player.seat, value=self.turns)
+        if instruments is not None:
+            start = instruments.clock()
+
+        # Step 1: Choose an action and target
+        action, target = self.choose_action()
+        if self.listeners:
+            self.emit(ACTION, current_player.seat, target.seat if target else NONE, ACTION_CODES[action])
+        if instruments is not None:
+            start = instruments.record("choose_action", start)
+
+        # Step 2: Challenge or block if necessary
+        can_perform_action = self.challenge_or_block(
+            action,
+            current_player,
+            target
+        )
+        if instruments is not None:
+            start = instruments.record("challenge_or_block", start)
+
+        # Step 3: Perform the action
+        if can_perform_action:
+            self.perform_action(action, current_player, target)
+            if instruments is not None:
+                instruments.record("perform_action", start)
+        if self.listeners and self.is_game_over():
+            self.emit(GAME_END, self.get_winner().seat, value=self.turns)
+        if self._response_pool is not None and self.is_game_over():
+            self.close()
+        return action, target, can_perform_action
+
     def choose_action(self):
         """
         Choose an action and target for the current player.
@@ -73,12 +286,12 @@ class GameController:
         target = None
         if current_player.is_ai:
             self.view.print_ai_thinking(about="choosing an action", player=current_player)
-            sleep(1)
+            self.ai_pause()
             # AI logic to choose an action
             player_options = self.player_available_actions(
                 current_player
             )
-            action = random.choice(player_options)
+            action = current_player.ai.choose_action(self, current_player, player_options)
         else:
             player_options = self.player_available_actions(
                 current_player
@@ -87,12 +300,12 @@ class GameController:
                 current_player,
                 player_options
             )
-        if action in ["assassinate", "steal", "coup"]:
+        if action in TARGETED_ACTIONS:
             possible_targets = self.get_other_players(
                 current_player
             )
             if current_player.is_ai:
-                target = random.choice(possible_targets)
+                target = current_player.ai.choose_target(self, current_player, action, possible_targets)
             else:
                 target = self.view.get_player_target(
                     possible_targets,
@@ -102,15 +315,29 @@ class GameController:
             target = None
         return action, target
 
-    def challenge_or_block(self, action: str, current_player: Player, target: Player = None):
+    def challenge_or_block(self, action: str, current_player: Player, target: Player = None, players_to_ask: list = None):
         """
         Loop through the players and ask them if they want to challenge or block.
         If a player decides to challenge or block, call the corresponding method and return the result.
+        players_to_ask defaults to every other player, in seat order.
         """
         can_be_challenged = COUP_RULES_CONFIG[action].get("can_be_challenged", False)
         can_be_blocked = COUP_RULES_CONFIG[action].get("blocked_by", [])
 
-        players_to_ask = self.get_other_players(current_player)
+        if players_to_ask is None:
+            players_to_ask = self.other_players(current_player)
+
+        if self.concurrent_responses:
+            if not can_be_challenged and not can_be_blocked:
+                return True
+            player, response = self.poll_responses(
+                action, current_player, target, players_to_ask, can_be_challenged, can_be_blocked
+            )
+            if response == CHALLENGE_RESPONSE:
+                return self.handle_challenge(challenger=player, challenged=current_player, action=action) is False
+            if response == BLOCK_RESPONSE:
+                return self.handle_block(blocker=player, blocked_player=current_player, action=action, target=target) is False
+            return True
 
         for player in players_to_ask:
             # If the player is not the current player and not eliminated
@@ -147,9 +374,96 @@ class GameController:
         # No challenge or block occurred
         return True
 
+    @property
+    def response_pool(self):
+        # Threads waiting on the answers of a poll, started on the first poll of a game
+        if self._response_pool is None:
+            self._response_pool = ThreadPoolExecutor(max(1, len(self.players) - 1), thread_name_prefix="responses")
+        return self._response_pool
+
+    def close(self):
+        """
+        Stop the threads of the response pool, done when the game ends
+        and on reset, a next poll starts them again.
+        Prompts still open are not waited for, their answers are dropped.
+        """
+        if self._response_pool is not None:
+            self._response_pool.shutdown(wait=False, cancel_futures=True)
+            self._response_pool = None
+
+    def poll_responses(self, action, current_player, target, players, can_be_challenged, can_be_blocked):
+        """
+        Ask every player at once whether they challenge or block the action.
+        The humans are all prompted right away, an AI answers only once
+        every player seated before it passed, as when asking in turn, so
+        seeded games draw the same numbers and play the same. The AI seats
+        asked are paced together, by a single ai_delay.
+        Players without an answer when response_deadline runs out pass.
+        As in turn by turn asking, the first player in seat order not passing
+        wins, and their answer is returned as soon as everyone before them
+        passed, the prompts still open are then withdrawn and waited for.
+        A view that cannot withdraw a prompt, as the terminal, is not waited
+        for and the late answer is dropped.
+        Return (player, CHALLENGE or BLOCK) from moves, or (None, PASS).
+        """
+        players = [player for player in players if player != current_player]
+        start = monotonic()
+        prompts = {
+            player: self.response_pool.submit(
+                self.human_response, player, current_player, action, target, can_be_challenged, can_be_blocked
+            )
+            for player in players if not player.is_ai
+        }
+
+        deadline = None if self.response_deadline is None else start + self.response_deadline
+        decision = (None, PASS)
+        asked_ai = False
+        for player in players:
+            if player.is_ai:
+                asked_ai = True
+                response = self.ai_response(player, current_player, action, target, can_be_challenged, can_be_blocked)
+            else:
+                try:
+                    response = prompts[player].result(None if deadline is None else max(0.0, deadline - monotonic()))
+                except FutureTimeoutError:
+                    response = PASS
+            if response != PASS:
+                decision = (player, response)
+                break
+        if asked_ai and self.ai_delay:
+            self.sleep(max(0.0, start + self.ai_delay - monotonic()))
+
+        # Late answers do not count, open prompts are closed before the game goes on
+        late = [(player, future) for player, future in prompts.items() if not future.done()]
+        for future in prompts.values():
+            future.cancel()
+        if late:
+            late_players = [player for player, _ in late]
+            if self.view.withdraw_prompts(late_players):
+                wait([future for _, future in late])
+                self.view.reopen_prompts(late_players)
+        return decision
+
+    def ai_response(self, player, challenged, action, target, can_be_challenged, can_be_blocked):
+        self.view.print_ai_thinking(about="challenging or blocking", player=player)
+        if can_be_challenged and player.ai.decide_to_challenge(self, player, challenged, action, target):
+            return CHALLENGE_RESPONSE
+        if can_be_blocked and player.ai.decide_to_block(self, player, challenged, action, target):
+            return BLOCK_RESPONSE
+        return PASS
+
+    def human_response(self, player, challenged, action, target, can_be_challenged, can_be_blocked):
+        if can_be_challenged and self.view.get_challenge_decision(
+            challenger=player, challenged=challenged, action=action, target=target
+        ):
+            return CHALLENGE_RESPONSE
+        if can_be_blocked and self.view.get_block_decision(blocker=player, blocked_player=challenged, action=action):
+            return BLOCK_RESPONSE
+        return PASS
+
     def ask_block(self, blocker: Player, blocked_player: Player, action: str, target: Player = None):
         if blocker.is_ai:
-            return self.ai_decide_to_block(blocker)
+            return self.ai_decide_to_block(blocker, blocked_player, action, target)
         else:
             return self.view.get_block_decision(blocker=blocker, blocked_player=blocked_player, action=action)
 
@@ -159,8 +473,13 @@ class GameController:
         return True if the block is successful, False otherwise.
         """
         # If the target player decides to challenge the block
+        claimed_card = self.blocking_claim(blocker, action)
+        if self.listeners:
+            self.emit(BLOCK, blocker.seat, blocked_player.seat, CARD_CODES[claimed_card])
         if blocked_player.is_ai:
-            challenge_decision = self.ai_decide_to_challenge(blocked_player)
+            challenge_decision = self.ai_decide_to_challenge(
+                blocked_player, blocker, action, target, claimed_card
+            )
         else:
             challenge_decision = self.view.get_challenge_decision(
                 challenger=blocked_player,
@@ -170,8 +489,16 @@ class GameController:
             )
 
         if challenge_decision:
-            # Handle the challenge to the block
-            return self.handle_challenge(challenger=blocker, challenged=blocked_player, action=action)
+            # Handle the challenge to the block, the blocker has to show the character they claimed
+            challenge_successful = self.handle_challenge(
+                challenger=blocked_player,
+                challenged=blocker,
+                action=action,
+                claimed_card=claimed_card
+            )
+            if challenge_successful:
+                # The blocker was bluffing, the action goes on
+                return False
 
         # If there's no challenge to the block, or the challenge to the block fails
         self.view.block_successful(blocker=blocker, blocked_player=blocked_player, action=action)
@@ -179,7 +506,7 @@ class GameController:
 
     def ask_challenge(self, challenged: Player, challenger: Player, action: str, target: Player = None):
         if challenger.is_ai:
-            return self.ai_decide_to_challenge(challenger)
+            return self.ai_decide_to_challenge(challenger, challenged, action, target)
         else:
             return self.view.get_challenge_decision(
                 challenger=challenger,
@@ -188,14 +515,20 @@ class GameController:
                 target=target
             )
 
-    def handle_challenge(self, challenger: Player, challenged: Player, action: str):
+    def handle_challenge(self, challenger: Player, challenged: Player, action: str, claimed_card: str = None):
         """
+        The claimed card defaults to the character performing the action,
+        a challenged block passes the character claimed by the blocker.
         return True if the challenge succeeds, False otherwise.
         """
-        claimed_card = COUP_RULES_CONFIG[action]["performed_by"]
+        if claimed_card is None:
+            claimed_card = COUP_RULES_CONFIG[action]["performed_by"]
 
         # Check if the challenged player has the claimed card
-        if claimed_card in challenged.cards:
+        has_card = claimed_card in challenged.cards
+        if self.listeners:
+            self.emit(CHALLENGE, challenger.seat, challenged.seat, CARD_CODES[claimed_card], int(not has_card))
+        if has_card:
             # Challenge fails; challenger loses an influence
             self.view.challenge_failed(challenger, challenged, claimed_card)
             self.resolve_influence_loss(challenger)
@@ -208,31 +541,55 @@ class GameController:
             self.resolve_influence_loss(challenged)
             return True
 
+    def blocking_claim(self, blocker: Player, action: str):
+        # The blocker claims a blocking character they hold, or bluffs the first one
+        blocked_by = COUP_RULES_CONFIG[action]["blocked_by"]
+        cards = blocker.cards
+        for character in blocked_by:
+            if character in cards:
+                return character
+        return blocked_by[0]
+
     def replace_player_card(self, challenged: Player, claimed_card: str):
-        challenged.cards.remove(claimed_card)
+        self.state.take_card(challenged.seat, CARD_CODES[claimed_card])
         # put the card back to the deck
-        self.reshuffle_deck([claimed_card])
+        self.return_cards_to_deck([claimed_card])
         card = self.take_card_from_deck()
-        challenged.cards.append(card)
+        self.state.give_card(challenged.seat, CARD_CODES[card])
+        if self.listeners:
+            self.emit(RETURN, challenged.seat, code=CARD_CODES[claimed_card])
+            self.emit(DEAL, challenged.seat, code=CARD_CODES[card])
+
+    def reveal(self, player: Player):
+        # The player loses an influence
+        card = player.reveal_card()
+        if self.listeners:
+            self.emit(REVEAL, player.seat, code=CARD_CODES[card])
+
+    def add_coins(self, player: Player, amount: int):
+        # Coins won, or lost when the amount is negative
+        player.coins += amount
+        if self.listeners:
+            self.emit(COINS, player.seat, value=amount)
 
     # Methods for player actions
     def income(self, player):
-        player.coins += COUP_RULES_CONFIG["income"]["income"]  # Take 1 coin from the treasury
+        self.add_coins(player, COUP_RULES_CONFIG["income"]["income"])  # Take 1 coin from the treasury
 
     def foreign_aid(self, player):
-        player.coins += COUP_RULES_CONFIG["foreign_aid"]['income']
+        self.add_coins(player, COUP_RULES_CONFIG["foreign_aid"]['income'])
 
     def coup(self, player: Player, target: Player):
         cost = COUP_RULES_CONFIG["coup"]['cost']
         if player.coins < cost:
             raise Exception("Not enough coins to perform a coup.")
-        player.coins -= cost
+        self.add_coins(player, -cost)
         # Target player loses an influence card
         if not target.is_eliminated:
-            target.reveal_card()
+            self.reveal(target)
 
     def tax(self, player):
-        player.coins += COUP_RULES_CONFIG["tax"]['income']
+        self.add_coins(player, COUP_RULES_CONFIG["tax"]['income'])
 
     def assassinate(self, player: Player, target: Player):
         cost = COUP_RULES_CONFIG["assassinate"]['cost']
@@ -240,84 +597,82 @@ class GameController:
             raise Exception("Not enough coins to perform an assassination.")
         if len(player.cards) < 1:
             raise Exception("Player has no more cards to lose.")
-        player.coins -= cost
-        # Target player loses an influence card
-        target.reveal_card()
+        self.add_coins(player, -cost)
+        # Target player loses an influence card,
+        # unless a lost challenge already eliminated them
+        if not target.is_eliminated:
+            self.reveal(target)
 
     def exchange(self, player):
         # Exchange cards with the deck
-        if len(self.deck) < 2:
+        if self.state.deck_size < 2:
             self.view.print_error("Not enough cards in the deck.")
             raise Exception("Not enough cards in the deck.")
 
         # Take 2 cards from the deck
-        cards_to_choose_from = player.cards + [self.take_card_from_deck(), self.take_card_from_deck()]
+        drawn = [self.take_card_from_deck(), self.take_card_from_deck()]
+        cards_to_choose_from = player.cards + drawn
+        if self.listeners:
+            for card in drawn:
+                self.emit(EXCHANGE_DRAW, player.seat, code=CARD_CODES[card])
 
-        # Choose 2 cards to keep
+        # Choose as many cards to keep as the player had
         if player.is_ai:
-            cards_to_keep = random.sample(cards_to_choose_from, 2)
+            cards_to_keep = player.ai.choose_cards_to_keep(self, player, cards_to_choose_from)
         else:
             cards_to_keep = self.view.choose_cards_to_exchange(player, cards_to_choose_from)
 
         # Set new player cards
         # and remove the remaining cards
         # to keep from the cards to choose from
-        player.cards = cards_to_keep
+        self.state.set_hand(player.seat, [CARD_CODES[card] for card in cards_to_keep])
         for card in cards_to_keep:
             cards_to_choose_from.remove(card)
 
         # Put the cards to choose from back to the deck
-        self.reshuffle_deck(cards_to_choose_from)
+        self.return_cards_to_deck(cards_to_choose_from)
+        if self.listeners:
+            for card in cards_to_choose_from:
+                self.emit(EXCHANGE_RETURN, player.seat, code=CARD_CODES[card])
 
     def steal(self, player, target):
         # Take 2 coins from the target player
-        steal_amount = COUP_RULES_CONFIG["steal"]['amount']
-        if target.coins < steal_amount:
-            player.coins += target.coins
-            target.coins = 0
-        else:
-            player.coins += steal_amount
-            target.coins -= steal_amount
+        steal_amount = min(COUP_RULES_CONFIG["steal"]['amount'], target.coins)
+        self.add_coins(player, steal_amount)
+        self.add_coins(target, -steal_amount)
 
     #  AI player methods
-    def ai_decide_to_challenge(self, player: Player):
-        # TODO: Finish this method
-        # Randomly decide to challenge or not
+    def ai_decide_to_challenge(self, player: Player, challenged: Player, action: str, target: Player = None, claimed_card: str = None):
+        # claimed_card is given when challenging a block
         self.view.print_ai_thinking(about="deciding to challenge or not", player=player)
-        sleep(1)
-        return random.choice([True, False])
+        self.ai_pause()
+        return player.ai.decide_to_challenge(self, player, challenged, action, target, claimed_card)
 
-    def ai_decide_to_block(self, player: Player):
-        # TODO: Finish this method
+    def ai_decide_to_block(self, player: Player, blocked_player: Player, action: str, target: Player = None):
         self.view.print_ai_thinking(about="deciding to block or not", player=player)
-        sleep(1)
-        return random.choice([True, False])
+        self.ai_pause()
+        return player.ai.decide_to_block(self, player, blocked_player, action, target)
+
+    def ai_pause(self):
+        if self.ai_delay:
+            self.sleep(self.ai_delay)
 
     # Helper methods
     def resolve_influence_loss(self, player: Player):
-        player.reveal_card()
+        self.reveal(player)
 
     def player_available_actions(self, player):
-        # Return a list of available actions for the player
-        actions = []
-        if player.coins >= MAX_COINS_FOR_COUP:
-            actions.append("coup")
-            return actions
-        for action in self.actions:
-            coup_rules_for_action = COUP_RULES_CONFIG[action]
-            # Check if the player has enough coins to perform the action
-            if player.coins >= coup_rules_for_action["cost"]:
-                actions.append(action)
-        return actions
+        # Return the actions the player has enough coins for, only a coup from MAX_COINS_FOR_COUP
+        return self.moves.legal_actions(player.coins)
 
     def next_turn(self):
-        # Skip eliminated players
-        while True:
-            self.current_player_index = (
-                (self.current_player_index + 1) % len(self.players)
-            )
-            if not self.players[self.current_player_index].is_eliminated:
-                break
+        # Move to the next player alive, the current one may have just been eliminated
+        if self.instruments is None:
+            self.current_player_index = self.state.next_alive(self.current_player_index)
+            return
+        start = self.instruments.clock()
+        self.current_player_index = self.state.next_alive(self.current_player_index)
+        self.instruments.record("next_turn", start)
 
     def perform_action(self, action, player, target=None):
         # Dispatch the action to the corresponding method
@@ -346,38 +701,31 @@ class GameController:
             raise Exception("Unknown action.")
 
     def get_other_players(self, player):
-        # Return a list of possible targets for the player
-        possible_targets = []
-        for index, player in enumerate(self.players):
-            is_valid_target = not player.is_eliminated
-            same_player = index == self.current_player_index
-            if not is_valid_target or same_player:
-                continue
-            possible_targets.append(player)
-        return possible_targets
+        # Return a list of possible targets for the current player
+        players = self.players
+        return [
+            players[seat]
+            for seat in self.moves.targets(self.current_player_index, self.state.alive_mask())
+        ]
+
+    def other_players(self, player):
+        # Yield the players alive other than the given one, in seat order, without building a list
+        state = self.state
+        players = self.players
+        next_seat = state.next_seat
+        seat = state.first_alive()
+        for _ in range(state.alive_count):
+            if seat != player.seat:
+                yield players[seat]
+            seat = next_seat[seat]
 
     def is_game_over(self):
         # The game is over when only one player is left not eliminated
-        active_players = [
-            player for player in self.players if not player.is_eliminated
-        ]
-        return len(active_players) == 1
+        return self.state.alive_count == 1
 
     def get_winner(self):
         # Return the winner of the game
-        active_players = [
-            player for player in self.players if not player.is_eliminated
-        ]
-        if len(active_players) != 1:
+        if self.state.alive_count != 1:
             raise Exception("The game is not over yet.")
 
-        return active_players[0]
-
-    def reset(self):
-        # Prompt the user for number of players
-        number_of_players = int(input("Enter number of players: "))
-        while number_of_players < MIN_PLAYERS or number_of_players > MAX_PLAYERS:
-            self.view.print_error(
-                "Number of players must be between 2 and 6. Please try again."
-            )
-            self.reset()
+        return self.players[self.state.first_alive()]
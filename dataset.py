@@ -0,0 +1,398 @@
+import argparse
+import mmap
+import os
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+import numpy as np
+from ai import RandomAI
+from controller import GameController
+from env import (
+    BLOCK, BLOCK_ACTION, CHALLENGE, CHALLENGE_ACTION, CHALLENGE_BLOCK, CHOOSE_ACTION, KEEP_CARDS, PASS, REVEAL_CARD,
+    Encoding
+)
+from events import GAME_END, GAME_START, rules_fingerprint
+from constants import COUP_RULES_CONFIG, MAX_PLAYERS, MIN_PLAYERS
+from simulation import game_seed, play_game
+
+MAGIC = b"COUPSET\0"
+VERSION = 1
+# magic, version, seats, rows, columns, rules fingerprint
+HEADER = struct.Struct("<8sHHIIQ")
+# name, dtype, shape after the rows (up to 2 dimensions, 0 when unused), codec, offset, stored size
+COLUMN = struct.Struct("<16s8sBIIBQQ")
+RAW = 0
+ZLIB = 1
+# Raw columns start on this boundary so they can be mapped as arrays of any type
+ALIGNMENT = 64
+# Columns besides the observations: legal actions, action taken, seat deciding,
+# game the decision is from and 1 if that seat won it, -1 if it lost, 0 if unknown
+DECISION_COLUMNS = ("mask", "action", "seat", "game", "outcome")
+CHUNK_SUFFIX = ".chunk"
+
+
+class RowGroup:
+    # Preallocated columns of a fixed number of rows, and how many of its rows wait for their outcome
+    def __init__(self, encoding, size):
+        self.columns, masks = encoding.allocate(size)
+        self.columns["mask"] = masks
+        self.columns["action"] = np.zeros(size, dtype=np.int16)
+        self.columns["seat"] = np.zeros(size, dtype=np.int8)
+        self.columns["game"] = np.zeros(size, dtype=np.int64)
+        self.columns["outcome"] = np.zeros(size, dtype=np.int8)
+        self.size = size
+        self.rows = 0
+        self.open = 0
+
+
+class DatasetWriter:
+    """
+    Write decisions, one row each, to chunk files of a directory, each
+    chunk holding one row group of row_group rows, the last one less.
+    Rows are written in place into preallocated row groups, the columns
+    are the observations of env.Encoding and DECISION_COLUMNS.
+
+    The outcome of a row is only known when its game ends, end_game fills
+    it in for every row of the game. A row group is written out once it
+    is full and all its games ended, then reused, so memory holds the
+    groups spanned by the games still being played and no more.
+
+    Chunks are named prefix-NNNNNN.chunk and appear whole, through a
+    rename, so writers of separate processes may share a directory as
+    long as their prefixes differ. Columns are stored raw by default, so
+    readers map them as arrays without copying, or compressed with zlib at
+    level compression to archive a dataset, then decompressed on reading.
+    """
+
+    def __init__(self, directory, seats, prefix="part", row_group=65536, compression=None):
+        self.directory = directory
+        self.prefix = prefix
+        self.encoding = Encoding.for_seats(seats)
+        self.row_group = row_group
+        self.compression = compression
+        self.fingerprint = rules_fingerprint()
+        os.makedirs(directory, exist_ok=True)
+        self.groups = [RowGroup(self.encoding, row_group)]
+        self.free = []
+        self.chunks = 0
+        self.rows = 0
+
+    def add_row(self, game_rows, game, seat):
+        """
+        Take the next row for a decision of the seat in the game, its
+        position is appended to game_rows, the rows of the game.
+        Return (columns, row) to write the decision to.
+        """
+        group = self.groups[-1]
+        if group.rows == group.size:
+            group = self.free.pop() if self.free else RowGroup(self.encoding, self.row_group)
+            group.rows = 0
+            self.groups.append(group)
+        row = group.rows
+        group.rows += 1
+        group.open += 1
+        columns = group.columns
+        columns["seat"][row] = seat
+        columns["game"][row] = game
+        columns["outcome"][row] = 0
+        game_rows.append((group, row))
+        self.rows += 1
+        return columns, row
+
+    def end_game(self, game_rows, winner):
+        # Fill in the outcome of the rows of a game, and write out the row groups done
+        for group, row in game_rows:
+            columns = group.columns
+            columns["outcome"][row] = 1 if columns["seat"][row] == winner else -1
+            group.open -= 1
+        groups = self.groups
+        while len(groups) > 1 and not groups[0].open:
+            self.write_chunk(groups[0])
+            self.free.append(groups.pop(0))
+
+    def write_chunk(self, group):
+        rows = group.rows
+        path = os.path.join(self.directory, f"{self.prefix}-{self.chunks:06d}{CHUNK_SUFFIX}")
+        self.chunks += 1
+        entries = []
+        blobs = []
+        offset = HEADER.size + COLUMN.size * len(group.columns)
+        for name, column in group.columns.items():
+            data = column[:rows].tobytes()
+            if self.compression is None:
+                codec = RAW
+                padding = -offset % ALIGNMENT
+                if padding:
+                    blobs.append(bytes(padding))
+                    offset += padding
+            else:
+                codec = ZLIB
+                data = zlib.compress(data, self.compression)
+            shape = column.shape[1:] + (0,) * (3 - column.ndim)
+            entries.append(COLUMN.pack(
+                name.encode(), column.dtype.str.encode(), column.ndim - 1, shape[0], shape[1], codec, offset, len(data)
+            ))
+            blobs.append(data)
+            offset += len(data)
+        header = HEADER.pack(MAGIC, VERSION, self.encoding.seats, rows, len(entries), self.fingerprint)
+        partial = path + ".partial"
+        with open(partial, "wb") as file:
+            file.write(header)
+            file.writelines(entries)
+            file.writelines(blobs)
+        os.replace(partial, path)
+
+    def close(self):
+        """
+        Write out the rows left, those of games not ended keep an outcome of 0
+        """
+        for group in self.groups:
+            if group.rows:
+                self.write_chunk(group)
+        self.groups = []
+        self.free = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class DecisionRecorder:
+    """
+    A strategy recording every decision of the seats it plays to a
+    DatasetWriter, in the action space of env.Encoding, the decisions
+    being taken by ai, RandomAI by default. It is also the listener
+    telling the writer when a game ends, and must be one of the
+    controller's listeners. game is written to the rows as the game
+    they are from.
+    """
+
+    def __init__(self, writer, ai=None):
+        self.writer = writer
+        self.encoding = writer.encoding
+        self.ai = ai if ai is not None else RandomAI()
+        self.game = 0
+        self.game_rows = []
+        self._action = None
+
+    def __call__(self, kind, seat, other, code, value):
+        if kind == GAME_START:
+            self.game_rows = []
+        elif kind == GAME_END:
+            self.writer.end_game(self.game_rows, seat)
+            self.game_rows = []
+
+    def row(self, player, kind, actor=-1, action=None, target=None, claim=None):
+        # A row of the writer with the observation of the decision written, its mask is left to the caller
+        columns, row = self.writer.add_row(self.game_rows, self.game, player.seat)
+        self.encoding.write(columns, row, player.state, player.seat, kind, actor, action, target, claim)
+        return columns, row
+
+    def respond(self, kind, answer, player, challenged, action, target, claim, decision):
+        columns, row = self.row(player, kind, challenged.seat, action, None if target is None else target.seat, claim)
+        self.encoding.mask_response(columns["mask"][row], answer)
+        columns["action"][row] = self.encoding.response_offset + (answer if decision else PASS)
+        return decision
+
+    def choose_action(self, controller, player, options):
+        columns, row = self.row(player, CHOOSE_ACTION)
+        self.encoding.mask_actions(columns["mask"][row], controller.moves, player.state, player.seat, options)
+        action = self.ai.choose_action(controller, player, options)
+        columns["action"][row] = self.encoding.action_index(action, None, player.seat)
+        # A targeted action is written again once its target is chosen
+        self._action = (columns, row, action)
+        return action
+
+    def choose_target(self, controller, player, action, targets):
+        target = self.ai.choose_target(controller, player, action, targets)
+        columns, row, _ = self._action
+        columns["action"][row] = self.encoding.action_index(action, target.seat, player.seat)
+        return target
+
+    def decide_to_challenge(self, controller, player, challenged, action, target=None, claimed_card=None):
+        decision = self.ai.decide_to_challenge(controller, player, challenged, action, target, claimed_card)
+        if claimed_card is None:
+            claim = COUP_RULES_CONFIG[action]["performed_by"]
+            return self.respond(CHALLENGE_ACTION, CHALLENGE, player, challenged, action, target, claim, decision)
+        return self.respond(CHALLENGE_BLOCK, CHALLENGE, player, challenged, action, target, claimed_card, decision)
+
+    def decide_to_block(self, controller, player, blocked_player, action, target=None):
+        decision = self.ai.decide_to_block(controller, player, blocked_player, action, target)
+        return self.respond(BLOCK_ACTION, BLOCK, player, blocked_player, action, target, None, decision)
+
+    def choose_card_to_reveal(self, player):
+        index = self.ai.choose_card_to_reveal(player)
+        hand = player.state.hand(player.seat)
+        if len(hand) > 1:
+            columns, row = self.row(player, REVEAL_CARD)
+            self.encoding.mask_reveal(columns["mask"][row], hand)
+            columns["action"][row] = self.encoding.reveal_offset + hand[index]
+        return index
+
+    def choose_cards_to_keep(self, controller, player, cards):
+        columns, row = self.row(player, KEEP_CARDS)
+        self.encoding.mask_keep(columns["mask"][row], columns, row, cards, len(player.cards))
+        kept = self.ai.choose_cards_to_keep(controller, player, cards)
+        columns["action"][row] = self.encoding.keep_index(kept)
+        return kept
+
+
+class DatasetChunk:
+    """
+    A chunk file read through a memory map. Raw columns are arrays
+    viewing the map, compressed ones are decompressed from it when asked
+    for. Drop the arrays of raw columns before closing.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.seats, self.rows, columns, self.fingerprint = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a dataset chunk.")
+        if version != VERSION:
+            raise ValueError(f"Unsupported dataset chunk version {version}.")
+        self.entries = {}
+        for index in range(columns):
+            name, dtype, ndim, first, second, codec, offset, size = COLUMN.unpack_from(
+                self.map, HEADER.size + index * COLUMN.size
+            )
+            shape = (self.rows,) + (first, second)[:ndim]
+            self.entries[name.rstrip(b"\0").decode()] = (np.dtype(dtype.rstrip(b"\0").decode()), shape, codec, offset, size)
+
+    @property
+    def names(self):
+        return list(self.entries)
+
+    def column(self, name):
+        dtype, shape, codec, offset, size = self.entries[name]
+        if codec == RAW:
+            return np.frombuffer(self.map, dtype, self.rows * int(np.prod(shape[1:])), offset).reshape(shape)
+        data = zlib.decompress(memoryview(self.map)[offset:offset + size])
+        return np.frombuffer(data, dtype).reshape(shape)
+
+    def columns(self, names=None):
+        return {name: self.column(name) for name in (names or self.entries)}
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class DatasetReader:
+    """
+    The chunks of a dataset directory, in name order, opened one at a
+    time as they are iterated. Chunks still being written are not listed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.paths = sorted(glob(os.path.join(directory, "*" + CHUNK_SUFFIX)))
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        for path in self.paths:
+            with DatasetChunk(path) as chunk:
+                yield chunk
+
+    def rows(self):
+        total = 0
+        for path in self.paths:
+            with open(path, "rb") as file:
+                total += HEADER.unpack(file.read(HEADER.size))[3]
+        return total
+
+
+def record_games(directory, base_seed, first_game, last_game, number_of_players, row_group, compression):
+    """
+    Worker entry point, records the decisions of games first_game..last_game - 1
+    to chunks of its own, return the number of rows written.
+    """
+    seats = number_of_players + 3
+    with DatasetWriter(directory, seats, f"games-{first_game:010d}", row_group, compression) as writer:
+        recorder = DecisionRecorder(writer)
+        controller = None
+        for game_index in range(first_game, last_game):
+            recorder.game = game_index
+            seed = game_seed(base_seed, game_index)
+            if controller is None:
+                controller = GameController(number_of_players, headless=True, seed=seed, ai=recorder, listeners=[recorder])
+            else:
+                controller.reset(seed)
+            play_game(controller)
+    return writer.rows
+
+
+def record(directory, number_of_games, number_of_players=3, seed=0, workers=None, chunk_size=None, row_group=65536, compression=None):
+    """
+    Record the decisions of number_of_games AI-only games to a dataset
+    directory over a pool of worker processes, each writing the chunks of
+    a contiguous range of games. Games are seeded from their index as in
+    tournament.run_tournament. Return the number of rows written.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        # Only the last chunk of a range of games is short
+        return record_games(directory, seed, 0, number_of_games, number_of_players, row_group, compression)
+    if chunk_size is None:
+        chunk_size = max(1, min(10000, number_of_games // (workers * 4)))
+    ranges = [
+        (first_game, min(first_game + chunk_size, number_of_games))
+        for first_game in range(0, number_of_games, chunk_size)
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(record_games, directory, seed, first, last, number_of_players, row_group, compression)
+            for first, last in ranges
+        ]
+        return sum(future.result() for future in futures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record the decisions of self-play games for offline training.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_parser = commands.add_parser("record", help="record the decisions of AI-only games")
+    record_parser.add_argument("directory")
+    record_parser.add_argument("--games", type=int, default=10000)
+    record_parser.add_argument("--players", type=int, default=3, choices=range(MIN_PLAYERS, MAX_PLAYERS + 1))
+    record_parser.add_argument("--seed", type=int, default=0)
+    record_parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    record_parser.add_argument("--row-group", type=int, default=65536, help="rows of each chunk (default: 65536)")
+    record_parser.add_argument(
+        "--level", type=int, default=0,
+        help="zlib compression level to archive the dataset, 0 stores raw columns that map as arrays (default: 0)"
+    )
+    info_parser = commands.add_parser("info", help="describe a dataset")
+    info_parser.add_argument("directory")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        compression = args.level or None
+        rows = record(
+            args.directory, args.games, args.players, args.seed, args.workers, row_group=args.row_group,
+            compression=compression
+        )
+        print(f"Recorded {rows} decisions of {args.games} games to {args.directory}")
+        return
+    reader = DatasetReader(args.directory)
+    print(f"{len(reader)} chunks, {reader.rows()} decisions")
+    for chunk in reader:
+        if chunk.fingerprint != rules_fingerprint():
+            print("The dataset was recorded with other rules than the current ones.")
+        print("Columns: " + ", ".join(f"{name} {chunk.entries[name][0]}{list(chunk.entries[name][1][1:])}" for name in chunk.names))
+        break
+
+
+if __name__ == "__main__":
+    main()
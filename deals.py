@@ -0,0 +1,142 @@
+from bisect import bisect_right
+from collections import OrderedDict
+from math import comb
+from operator import le
+from beliefs import HandSpace
+
+
+class DealSampler:
+    """
+    Uniform deals of the cards a seat cannot see, the hands of the other
+    seats and the deck, among the deals consistent with what it knows:
+    how many cards of each character are unseen, how many cards each
+    other seat holds and, for some seats, the only hands they may hold.
+
+    Every physical card is as likely to be anywhere it may be, so a hand
+    is dealt with a weight of the number of ways to pick its cards from
+    the unseen ones times the number of ways to deal the constrained hands
+    left. These counts are computed once per public state and kept, the
+    samplers of the last MAX_CACHED public states are kept too. Seats
+    without constraints are dealt afterwards by drawing from the cards
+    left, any draw leaves the same number of ways to deal the others.
+    """
+
+    MAX_CACHED = 256
+    _cache = OrderedDict()
+
+    def __init__(self, unseen, hands):
+        """
+        unseen holds the number of unseen cards of each character,
+        hands a (size, allowed hands or None) for each seat dealt.
+        """
+        self.unseen = unseen
+        self.hands = hands
+        self.space = HandSpace.for_characters(len(unseen))
+        # Constrained seats are dealt first, through the counts
+        self.constrained = [position for position, (_, allowed) in enumerate(hands) if allowed is not None]
+        self.free = [position for position, (_, allowed) in enumerate(hands) if allowed is None]
+        self._choices = {}
+        # Ways to deal the cards of the constrained seats, 0 when no deal is consistent
+        self.total = self._count(0, unseen)
+
+    @classmethod
+    def for_public_state(cls, unseen, hands):
+        key = (unseen, hands)
+        sampler = cls._cache.get(key)
+        if sampler is None:
+            sampler = cls._cache[key] = cls(unseen, hands)
+            if len(cls._cache) > cls.MAX_CACHED:
+                cls._cache.popitem(last=False)
+        else:
+            cls._cache.move_to_end(key)
+        return sampler
+
+    @classmethod
+    def for_state(cls, state, seat, allowed=None):
+        """
+        The sampler of the hands of the other seats alive, in seat order,
+        as seen by the seat. allowed maps seats to the hands, sorted tuples
+        of card codes, they may hold.
+        """
+        unseen = list(state.deck.counts)
+        seats = dealt_seats(state, seat)
+        sizes = []
+        for other in seats:
+            hand = state.hand(other)
+            sizes.append(len(hand))
+            for code in hand:
+                unseen[code] += 1
+        space = HandSpace.for_characters(len(unseen))
+        hands = []
+        for other, size in zip(seats, sizes):
+            constraint = allowed.get(other) if allowed else None
+            if constraint is not None:
+                constraint = frozenset(constraint)
+                # A seat that may hold any hand the unseen cards allow is dealt as a free one
+                if all(hand in constraint for hand, counts in zip(space.hands[size], space.counts[size])
+                       if all(map(le, counts, unseen))):
+                    constraint = None
+            hands.append((size, constraint))
+        return cls.for_public_state(tuple(unseen), tuple(hands))
+
+    def _count(self, level, pool):
+        # Number of ways to deal the constrained seats from level on out of the pool
+        if level == len(self.constrained):
+            return 1
+        key = (level, pool)
+        choice = self._choices.get(key)
+        if choice is None:
+            size, allowed = self.hands[self.constrained[level]]
+            options = []
+            cumulative = []
+            total = 0
+            for hand, counts in zip(self.space.hands[size], self.space.counts[size]):
+                if hand not in allowed:
+                    continue
+                ways = 1
+                for unseen, needed in zip(pool, counts):
+                    if needed:
+                        ways *= comb(unseen, needed)
+                if not ways:
+                    continue
+                rest = tuple(unseen - needed for unseen, needed in zip(pool, counts))
+                ways *= self._count(level + 1, rest)
+                if ways:
+                    total += ways
+                    options.append((hand, rest))
+                    cumulative.append(total)
+            choice = self._choices[key] = (options, cumulative, total)
+        return choice[2]
+
+    def sample(self, count, rng):
+        """
+        Return count deals, each a tuple of the hand of every seat dealt.
+        Raise a ValueError when no deal is consistent with the constraints.
+        """
+        if not self.total:
+            raise ValueError("No deal is consistent with the constraints.")
+        hands = self.hands
+        constrained = self.constrained
+        free = [(position, hands[position][0]) for position in self.free]
+        needed = sum(size for _, size in free)
+        choices = self._choices
+        deals = []
+        for _ in range(count):
+            deal = [None] * len(hands)
+            pool = self.unseen
+            for level, position in enumerate(constrained):
+                options, cumulative, total = choices[(level, pool)]
+                deal[position], pool = options[bisect_right(cumulative, rng.randrange(total))]
+            if free:
+                cards = rng.sample([code for code, unseen in enumerate(pool) for _ in range(unseen)], needed)
+                start = 0
+                for position, size in free:
+                    deal[position] = tuple(sorted(cards[start:start + size]))
+                    start += size
+            deals.append(tuple(deal))
+        return deals
+
+
+def dealt_seats(state, seat):
+    # The seats whose hands the seat cannot see, in seat order
+    return [other for other in range(state.seats) if other != seat and not state.is_eliminated(other)]
@@ -0,0 +1,71 @@
+class Deck:
+    """
+    The court deck, kept as a count of cards per character.
+    Drawing picks one of the remaining cards uniformly at random,
+    which is what drawing from a freshly shuffled deck does,
+    so the deck never has to be shuffled.
+    Drawing and returning a card only walk the list of characters,
+    whatever the number of cards in the deck.
+    """
+
+    __slots__ = ("characters", "counts", "size", "rng", "_index")
+
+    def __init__(self, characters, copies, rng):
+        self.characters = list(characters)
+        self._index = {character: index for index, character in enumerate(self.characters)}
+        self.counts = [copies] * len(self.characters)
+        self.size = copies * len(self.characters)
+        self.rng = rng
+
+    def __len__(self):
+        return self.size
+
+    def copy(self, rng=None):
+        deck = Deck.__new__(Deck)
+        deck.characters = self.characters
+        deck._index = self._index
+        deck.counts = self.counts[:]
+        deck.size = self.size
+        deck.rng = rng if rng is not None else self.rng
+        return deck
+
+    def reset(self, copies):
+        # Put every card back, copies of each character
+        counts = self.counts
+        for index in range(len(counts)):
+            counts[index] = copies
+        self.size = copies * len(counts)
+
+    def count(self, card):
+        return self.counts[self._index[card]]
+
+    def draw(self):
+        # Take a uniformly random card from the deck
+        return self.characters[self.draw_index()]
+
+    def draw_index(self):
+        # Same as draw, but return the index of the character
+        if self.size == 0:
+            raise Exception("Not enough cards in the deck.")
+        position = self.rng.randrange(self.size)
+        counts = self.counts
+        for index, count in enumerate(counts):
+            if position < count:
+                counts[index] = count - 1
+                self.size -= 1
+                return index
+            position -= count
+
+    def take_index(self, index):
+        # Take a given card, to play a known draw again
+        if self.counts[index] == 0:
+            raise Exception("The card is not in the deck.")
+        self.counts[index] -= 1
+        self.size -= 1
+
+    def put_back(self, card):
+        self.put_back_index(self._index[card])
+
+    def put_back_index(self, index):
+        self.counts[index] += 1
+        self.size += 1
@@ -0,0 +1,513 @@
+"""
+Exact solution of two player endgames, stored in a table file.
+
+    python endgame.py build --workers 8
+    python endgame.py probe duke,captain contessa 3 5
+
+Once two players are left, each with one or two influences, the whole
+game is small enough to be solved outright. The solver plays the perfect
+information game: both hands are known, so a claim is only made with
+the character in hand and never challenged, and a block only with the
+blocking character. The exchange is left out, what it does depends on
+the deck. Every state is won, lost or drawn, drawn being the states
+where both players can keep the game going forever.
+
+Losing an influence only makes the game smaller, so the states are
+solved by number of influences left, fewest first. Within a number of
+influences the hands do not change, every pair of hands is solved on
+its own, in parallel, from the states already solved.
+
+The table has one entry per (hand to move, other hand, coins to move,
+other coins), the result for the player to move and the number of turns
+to the end of the game under best play. Its header holds a fingerprint
+of the rules, a table is never read with other rules.
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from itertools import combinations, combinations_with_replacement
+from math import comb
+from ai import RandomAI
+from constants import CHARACTERS, COUP_RULES_CONFIG, MAX_COINS_FOR_COUP, TARGETED_ACTIONS
+from moves import MoveGenerator
+from state import CARD_CODES, HAND_SIZE
+
+MAGIC = b"COUPEND\0"
+VERSION = 1
+# magic, version, rules fingerprint, number of hands, number of coin counts
+HEADER = struct.Struct("<8sHQHH")
+# result for the player to move, turns to the end of the game
+ENTRY = struct.Struct("<BB")
+DEFAULT_TABLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "endgame.table")
+
+# Results, for the player to move
+DRAW = 0
+WIN = 1
+LOSS = 2
+RESULT_NAMES = {DRAW: "draw", WIN: "win", LOSS: "loss"}
+# The successor of an action eliminating the other player
+TERMINAL = -1
+MAX_DEPTH = 255
+# Moves whose scores are this close are taken as equally good
+SCORE_TOLERANCE = 1e-9
+
+
+def table_fingerprint(rules=COUP_RULES_CONFIG, characters=CHARACTERS):
+    # Fingerprint of everything the table depends on, the rules and the constants they are played with
+    description = json.dumps(
+        [rules, list(characters), list(TARGETED_ACTIONS), MAX_COINS_FOR_COUP, HAND_SIZE], sort_keys=True
+    )
+    return int.from_bytes(blake2b(description.encode(), digest_size=8).digest(), "little")
+
+
+def rank(result):
+    # Order of the results for the player they belong to, a quick win and a slow loss first
+    value, depth = result
+    if value == WIN:
+        return (2, -depth)
+    if value == DRAW:
+        return (1, 0)
+    return (0, depth)
+
+
+def score(result):
+    # A win counts 1, a draw 1/2 and a loss 0, a quicker win or a slower loss slightly more
+    value, depth = result
+    if value == WIN:
+        return 1.0 - depth / (4 * MAX_DEPTH)
+    if value == DRAW:
+        return 0.5
+    return depth / (4 * MAX_DEPTH)
+
+
+def flip(result):
+    # The result of a state for the other player
+    value, depth = result
+    return (LOSS if value == WIN else WIN if value == LOSS else DRAW, depth)
+
+
+def resolve(results, decisive, choose):
+    """
+    Combine the results of the choices of one player, None being a choice
+    not solved yet. One decisive result is enough, otherwise every choice
+    must be solved. choose is max for the player choosing, min for the other.
+    """
+    known = [result for result in results if result is not None]
+    if any(result[0] == decisive for result in known):
+        return choose((result for result in known if result[0] == decisive), key=rank)
+    if len(known) < len(results):
+        return None
+    return choose(known, key=rank)
+
+
+class EndgameModel:
+    """
+    The perfect information two player game of a rule set, with states
+    numbered as in the table. Hands are sorted tuples of card codes.
+    """
+
+    def __init__(self, rules=COUP_RULES_CONFIG, characters=CHARACTERS):
+        self.rules = rules
+        self.characters = characters
+        self.fingerprint = table_fingerprint(rules, characters)
+        self.moves = MoveGenerator.for_game(2, rules)
+        self.coins = self.moves.max_coins + 1
+        self.hands = [
+            hand for size in range(1, HAND_SIZE + 1)
+            for hand in combinations_with_replacement(range(len(characters)), size)
+        ]
+        self.hand_index = {hand: index for index, hand in enumerate(self.hands)}
+        self.size = len(self.hands) ** 2 * self.coins ** 2
+        code = {character: index for index, character in enumerate(characters)}
+        # Actions with no effect on coins or influences, the exchange, are not played
+        self.actions = {
+            action: (
+                code.get(rule["performed_by"]),
+                tuple(code[character] for character in rule["blocked_by"]),
+                rule["cost"],
+                rule["income"],
+                rule.get("amount", 0),
+                action in TARGETED_ACTIONS,
+            )
+            for action, rule in rules.items()
+            if rule["income"] or rule["cost"] or rule.get("amount") or action in TARGETED_ACTIONS
+        }
+
+    def index(self, mover, other, mover_coins, other_coins):
+        coins = self.coins
+        mover_coins = min(mover_coins, coins - 1)
+        other_coins = min(other_coins, coins - 1)
+        hands = len(self.hands)
+        return ((self.hand_index[mover] * hands + self.hand_index[other]) * coins + mover_coins) * coins + other_coins
+
+    def hand(self, cards):
+        # The hand of a list of card codes or character names
+        return tuple(sorted(CARD_CODES[card] if isinstance(card, str) else card for card in cards))
+
+    def outcomes(self, action, mover, other, mover_coins, other_coins):
+        """
+        Return (blocked, performed) for an action of the player to move:
+        the state after the other player blocks it, None if they cannot,
+        and the states after it is performed, one for each card the other
+        player may choose to lose. States are those of the other player
+        to move, TERMINAL when the other player is out.
+        """
+        claim, blockers, cost, income, amount, targeted = self.actions[action]
+        blocked = None
+        if any(code in other for code in blockers):
+            blocked = self.index(other, mover, other_coins, mover_coins)
+        coins = mover_coins - cost + income
+        if not targeted:
+            return blocked, [self.index(other, mover, other_coins, coins)]
+        if amount:
+            taken = min(amount, other_coins)
+            return blocked, [self.index(other, mover, other_coins - taken, coins + taken)]
+        performed = []
+        for code in sorted(set(other)):
+            rest = list(other)
+            rest.remove(code)
+            performed.append(self.index(tuple(rest), mover, other_coins, coins) if rest else TERMINAL)
+        return blocked, performed
+
+    def legal_moves(self, mover, other, mover_coins, other_coins):
+        # (action, successors the other player chooses from) of every honest action
+        moves = []
+        for action in self.moves.legal_actions(mover_coins):
+            if action not in self.actions:
+                continue
+            claim = self.actions[action][0]
+            if claim is not None and claim not in mover:
+                continue
+            blocked, performed = self.outcomes(action, mover, other, mover_coins, other_coins)
+            moves.append((action, performed if blocked is None else [blocked] + performed))
+        return moves
+
+    def move_result(self, successors, lookup):
+        # Result of a move for the player to move, the other player choosing among the successors
+        results = []
+        for successor in successors:
+            if successor == TERMINAL:
+                results.append((WIN, 0))
+            else:
+                result = lookup(successor)
+                results.append(None if result is None else flip(result))
+        return resolve(results, LOSS, min)
+
+    def solve_pair(self, first, second, lookup):
+        """
+        Solve the states of two hands, either to move, given the lookup of
+        the states with fewer influences. Return (index, result, turns) for
+        each of them.
+        """
+        coins = range(self.coins)
+        states = {}
+        for mover, other in dict.fromkeys([(first, second), (second, first)]):
+            for mover_coins in coins:
+                for other_coins in coins:
+                    index = self.index(mover, other, mover_coins, other_coins)
+                    states[index] = self.legal_moves(mover, other, mover_coins, other_coins)
+        # Turns to the end of the longest game already solved, past it nothing new can be solved
+        longest = max(
+            (lookup(successor)[1] for moves in states.values() for _, successors in moves
+             for successor in successors if successor != TERMINAL and successor not in states),
+            default=0
+        )
+        solved = {}
+        turns = 0
+
+        def find(index):
+            # Only the states ending within the turns of this round are known, draws are known from the start
+            if index in states:
+                return solved.get(index)
+            result = lookup(index)
+            return result if result[0] == DRAW or result[1] < turns else None
+
+        # Round n solves the states ending in n turns, so the turns of every state are exact
+        while turns <= longest + 1:
+            turns += 1
+            found = []
+            for index, moves in states.items():
+                if index in solved:
+                    continue
+                result = resolve([self.move_result(successors, find) for _, successors in moves], WIN, max)
+                if result is not None and result[0] != DRAW:
+                    found.append((index, (result[0], min(result[1] + 1, MAX_DEPTH))))
+            solved.update(found)
+            if found:
+                longest = max(longest, turns)
+        # The states left are drawn, neither player can force the end of the game
+        return [(index, *solved.get(index, (DRAW, 0))) for index in states]
+
+
+# State of the build processes
+_worker = None
+
+
+def _start_worker(rules, characters, table):
+    global _worker
+    _worker = (EndgameModel(rules, characters), table)
+
+
+def _solve_pair(pair):
+    model, table = _worker
+    return model.solve_pair(model.hands[pair[0]], model.hands[pair[1]], lambda index: ENTRY.unpack_from(table, index * ENTRY.size))
+
+
+def build(path=DEFAULT_TABLE, rules=COUP_RULES_CONFIG, characters=CHARACTERS, workers=None):
+    """
+    Solve every endgame of the rules and write the table to path,
+    with workers processes, as many as CPUs by default.
+    """
+    model = EndgameModel(rules, characters)
+    table = bytearray(model.size * ENTRY.size)
+    hands = range(len(model.hands))
+    for influences in range(2, 2 * HAND_SIZE + 1):
+        pairs = [
+            (first, second) for first in hands for second in hands[first:]
+            if len(model.hands[first]) + len(model.hands[second]) == influences
+        ]
+        if workers == 1:
+            _start_worker(rules, characters, table)
+            solved = map(_solve_pair, pairs)
+        else:
+            pool = ProcessPoolExecutor(workers, initializer=_start_worker, initargs=(rules, characters, bytes(table)))
+            solved = pool.map(_solve_pair, pairs)
+        for entries in solved:
+            for index, value, depth in entries:
+                ENTRY.pack_into(table, index * ENTRY.size, value, depth)
+        if workers != 1:
+            pool.shutdown()
+
+    # Written next to the table then renamed over it, a reader never sees half a table
+    partial = f"{path}.partial"
+    with open(partial, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, model.fingerprint, len(model.hands), model.coins))
+        file.write(table)
+    os.replace(partial, path)
+    return model
+
+
+class EndgameTable:
+    """
+    A solved table, memory mapped. Every lookup reads two bytes.
+    """
+
+    def __init__(self, path=DEFAULT_TABLE, rules=COUP_RULES_CONFIG, characters=CHARACTERS):
+        self.model = EndgameModel(rules, characters)
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < HEADER.size:
+            self.data.close()
+            raise ValueError("Not an endgame table.")
+        magic, version, fingerprint, hands, coins = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            self.data.close()
+            raise ValueError("Not an endgame table.")
+        if version != VERSION:
+            self.data.close()
+            raise ValueError(f"Unsupported endgame table version {version}.")
+        if fingerprint != self.model.fingerprint or (hands, coins) != (len(self.model.hands), self.model.coins):
+            self.data.close()
+            raise ValueError("The endgame table was built for other rules, build it again.")
+
+    def lookup(self, index):
+        return ENTRY.unpack_from(self.data, HEADER.size + index * ENTRY.size)
+
+    def result(self, mover, other, mover_coins, other_coins):
+        """
+        Return (result, turns to the end) for the player to move,
+        hands being sorted tuples of card codes.
+        """
+        return self.lookup(self.model.index(mover, other, mover_coins, other_coins))
+
+    def move_results(self, mover, other, mover_coins, other_coins):
+        # (result, turns to the end) of every honest action of the player to move
+        results = {}
+        for action, successors in self.model.legal_moves(mover, other, mover_coins, other_coins):
+            value, depth = self.model.move_result(successors, self.lookup)
+            results[action] = (value, min(depth + 1, MAX_DEPTH))
+        return results
+
+    def close(self):
+        self.data.close()
+
+
+def opponent_hands(state, seat, opponent):
+    """
+    Return (hand, probability) of every hand the opponent may hold,
+    as seen from the seat: dealt from the cards it cannot see.
+    """
+    unseen = list(state.deck.counts)
+    for code in state.hand(opponent):
+        unseen[code] += 1
+    hands = []
+    for hand in set(combinations_with_replacement(range(len(unseen)), state.hand_size(opponent))):
+        weight = 1
+        for code in set(hand):
+            weight *= comb(unseen[code], hand.count(code))
+        if weight:
+            hands.append((hand, weight))
+    total = sum(weight for _, weight in hands)
+    return [(hand, weight / total) for hand, weight in sorted(hands)]
+
+
+class EndgameAI(RandomAI):
+    """
+    Plays two player endgames from a solved table, and every other
+    decision with the fallback strategy, RandomAI by default.
+    The opponent's hand is unknown: each decision is looked up for every
+    hand the opponent may hold and the best on average is taken, see
+    score. Hands are dealt from the unseen cards, or weighed by beliefs,
+    a beliefs.Beliefs listening to the game. A claim is challenged when
+    the opponent more likely than not does not hold the character.
+    """
+
+    def __init__(self, table, fallback=None, beliefs=None):
+        self.table = table
+        self.model = table.model
+        self.fallback = fallback if fallback is not None else RandomAI()
+        self.beliefs = beliefs
+
+    def opponent_hands(self, state, seat, opponent):
+        # The hands the opponent may hold, weighed by the beliefs of the seat when there are any
+        if self.beliefs is None:
+            return opponent_hands(state, seat, opponent)
+        return self.beliefs.tracker(seat).hands(opponent)
+
+    def endgame(self, state, seat):
+        # (hand, opponent seat) when the seat is in a two player endgame, None otherwise
+        if state.alive_count != 2 or state.is_eliminated(seat):
+            return None
+        opponent = state.next_alive(seat)
+        return self.model.hand(state.hand(seat)), opponent
+
+    def choose_action(self, controller, player, options):
+        endgame = self.endgame(controller.state, player.seat)
+        if endgame is None:
+            return self.fallback.choose_action(controller, player, options)
+        hand, opponent = endgame
+        state = controller.state
+        scores = {}
+        for other, probability in self.opponent_hands(state, player.seat, opponent):
+            results = self.table.move_results(hand, other, player.coins, state.coins[opponent])
+            for action, result in results.items():
+                if action in options:
+                    scores[action] = scores.get(action, 0.0) + probability * score(result)
+        if not scores:
+            return self.fallback.choose_action(controller, player, options)
+        best = max(scores.get(action, -1.0) for action in options)
+        ties = [action for action in options if scores.get(action, -1.0) >= best - SCORE_TOLERANCE]
+        # Drawn states all score the same, a fixed choice among them could repeat forever
+        return ties[0] if len(ties) == 1 else player.rng.choice(ties)
+
+    def choose_target(self, controller, player, action, targets):
+        return self.fallback.choose_target(controller, player, action, targets)
+
+    def decide_to_challenge(self, controller, player, challenged, action, target=None, claimed_card=None):
+        endgame = self.endgame(controller.state, player.seat)
+        if endgame is None:
+            return self.fallback.decide_to_challenge(controller, player, challenged, action, target, claimed_card)
+        claimed = CARD_CODES[claimed_card or COUP_RULES_CONFIG[action]["performed_by"]]
+        holding = sum(
+            probability for other, probability in self.opponent_hands(controller.state, player.seat, challenged.seat)
+            if claimed in other
+        )
+        return holding < 0.5
+
+    def decide_to_block(self, controller, player, blocked_player, action, target=None):
+        endgame = self.endgame(controller.state, player.seat)
+        if endgame is None or action not in self.model.actions:
+            return self.fallback.decide_to_block(controller, player, blocked_player, action, target)
+        hand, opponent = endgame
+        state = controller.state
+        block = allow = 0.0
+        for other, probability in self.opponent_hands(state, player.seat, opponent):
+            blocked, performed = self.model.outcomes(action, other, hand, state.coins[opponent], player.coins)
+            if blocked is None:
+                return False
+            # The successors are states of this player to move, who chooses the card to lose
+            block += probability * score(self.table.lookup(blocked))
+            allow += probability * max(
+                score((LOSS, 0)) if successor == TERMINAL else score(self.table.lookup(successor))
+                for successor in performed
+            )
+        return block >= allow
+
+    def choose_card_to_reveal(self, player):
+        state = player.state
+        endgame = self.endgame(state, player.seat)
+        cards = player.cards
+        if endgame is None or len(cards) < 2 or cards[0] == cards[1]:
+            return self.fallback.choose_card_to_reveal(player)
+        # Keep the card that is best for the turn after the reveal, the next player's
+        _, opponent = endgame
+        scores = []
+        for index in range(len(cards)):
+            rest = self.model.hand(cards[:index] + cards[index + 1:])
+            scores.append(self.hand_score(state, player.seat, opponent, rest, opponent_to_move=state.turn == player.seat))
+        return scores.index(max(scores))
+
+    def choose_cards_to_keep(self, controller, player, cards):
+        endgame = self.endgame(controller.state, player.seat)
+        if endgame is None:
+            return self.fallback.choose_cards_to_keep(controller, player, cards)
+        _, opponent = endgame
+        # The exchange ends the turn, the opponent moves next
+        options = sorted(set(combinations(sorted(cards), len(player.cards))))
+        keep = max(
+            options,
+            key=lambda kept: self.hand_score(controller.state, player.seat, opponent, self.model.hand(kept), True)
+        )
+        return list(keep)
+
+    def hand_score(self, state, seat, opponent, hand, opponent_to_move):
+        # Average score of holding hand, over the hands the opponent may hold
+        total = 0.0
+        for other, probability in self.opponent_hands(state, seat, opponent):
+            if opponent_to_move:
+                result = flip(self.table.result(other, hand, state.coins[opponent], state.coins[seat]))
+            else:
+                result = self.table.result(hand, other, state.coins[seat], state.coins[opponent])
+            total += probability * score(result)
+        return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve two player endgames.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_command = commands.add_parser("build", help="solve every endgame and write the table")
+    build_command.add_argument("--output", default=DEFAULT_TABLE, help="path of the table")
+    build_command.add_argument("--workers", type=int, help="processes solving at once (default: one per CPU)")
+    probe_command = commands.add_parser("probe", help="print the result of a state and of its actions")
+    probe_command.add_argument("hand", help="cards of the player to move, comma separated")
+    probe_command.add_argument("other", help="cards of the other player, comma separated")
+    probe_command.add_argument("coins", type=int, help="coins of the player to move")
+    probe_command.add_argument("other_coins", type=int, help="coins of the other player")
+    probe_command.add_argument("--table", default=DEFAULT_TABLE, help="path of the table")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        model = build(args.output, workers=args.workers)
+        print(f"Solved {model.size} endgames into {args.output}")
+        return
+
+    table = EndgameTable(args.table)
+    try:
+        hand, other = (table.model.hand(cards.split(",")) for cards in (args.hand, args.other))
+    except KeyError as error:
+        raise SystemExit(f"Unknown character {error}.")
+    if not 1 <= len(hand) <= HAND_SIZE or not 1 <= len(other) <= HAND_SIZE:
+        raise SystemExit(f"A hand holds 1 to {HAND_SIZE} cards.")
+    value, turns = table.result(hand, other, args.coins, args.other_coins)
+    print(f"{RESULT_NAMES[value]} in {turns} turns" if value != DRAW else "draw")
+    for action, (value, turns) in table.move_results(hand, other, args.coins, args.other_coins).items():
+        print(f"  {action:<12} {RESULT_NAMES[value]:<5} {turns if value != DRAW else ''}")
+    table.close()
+
+
+if __name__ == "__main__":
+    main()
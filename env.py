@@ -0,0 +1,456 @@
+import threading
+import numpy as np
+from ai import RandomAI
+from beliefs import HandSpace
+from constants import CHARACTERS, COUP_RULES_CONFIG, MAX_PLAYERS, MIN_PLAYERS, TARGETED_ACTIONS
+from controller import GameController
+from simulation import game_seed
+from state import CARD_CODES, HAND_SIZE
+
+ACTIONS = tuple(COUP_RULES_CONFIG)
+ACTION_INDEX = {action: index for index, action in enumerate(ACTIONS)}
+# Kinds of decisions the agent is asked for, the "decision" observation
+CHOOSE_ACTION = 0
+CHALLENGE_ACTION = 1
+BLOCK_ACTION = 2
+CHALLENGE_BLOCK = 3
+REVEAL_CARD = 4
+KEEP_CARDS = 5
+DECISIONS = ("action", "challenge", "block", "challenge_block", "reveal", "keep")
+# Answers to a challenge or block decision
+PASS, CHALLENGE, BLOCK = range(3)
+# Hands an exchange may keep, one or two cards
+KEEP_HANDS = tuple(hand for size in range(1, HAND_SIZE + 1) for hand in HandSpace.for_characters(len(CHARACTERS)).hands[size])
+KEEP_COUNTS = tuple(tuple(hand.count(code) for code in range(len(CHARACTERS))) for hand in KEEP_HANDS)
+KEEP_POSITIONS = {hand: position for position, hand in enumerate(KEEP_HANDS)}
+# Commands of the game threads besides the seed of a new game
+_ABORT = object()
+_CLOSE = object()
+
+
+class Aborted(Exception):
+    # Raised in a game thread to drop the game it plays
+    pass
+
+
+class Truncated(Exception):
+    # Raised in a game thread when its game ran out of turns
+    pass
+
+
+class Encoding:
+    """
+    The observations and the action space of the decisions of a seat,
+    for games of a number of seats. Actions are indices in one discrete
+    space:
+        action * seats + target     an action, untargeted ones target the deciding seat
+        response_offset + PASS, CHALLENGE or BLOCK
+        reveal_offset + character   the card to reveal
+        keep_offset + position      the hand of KEEP_HANDS to keep
+    with a mask of the legal ones for every decision.
+
+    Observations are NumPy arrays with one row per decision, written in
+    place by write, see allocate for their shapes.
+    """
+
+    _cache = {}
+
+    def __init__(self, seats):
+        self.seats = seats
+        self.response_offset = len(ACTIONS) * seats
+        self.reveal_offset = self.response_offset + 3
+        self.keep_offset = self.reveal_offset + len(CHARACTERS)
+        self.action_count = self.keep_offset + len(KEEP_HANDS)
+        # Masks of the keep decision by (cards to choose from, cards kept)
+        self._keep_masks = {}
+
+    @classmethod
+    def for_seats(cls, seats):
+        if seats not in cls._cache:
+            cls._cache[seats] = cls(seats)
+        return cls._cache[seats]
+
+    def shapes(self):
+        """
+        Return the shape after the row and the dtype of every observation:
+            hand        own hidden cards of each character
+            coins       coins of each seat
+            influence   hidden cards of each seat
+            revealed    cards shown by each seat, per character
+            alive       seats still alive
+            turn        seat playing the turn
+            decision    kind of decision asked, see DECISIONS
+            pending     actor, action, target and claimed character of the
+                        action or block answered, -1 where there is none
+            choices     cards to choose from in an exchange, per character
+        """
+        seats = self.seats
+        characters = len(CHARACTERS)
+        return {
+            "hand": ((characters,), np.int8),
+            "coins": ((seats,), np.int16),
+            "influence": ((seats,), np.int8),
+            "revealed": ((seats, characters), np.int8),
+            "alive": ((seats,), bool),
+            "turn": ((), np.int8),
+            "decision": ((), np.int8),
+            "pending": ((4,), np.int8),
+            "choices": ((characters,), np.int8),
+        }
+
+    def allocate(self, rows):
+        # Observation arrays for rows decisions, and their action masks
+        observations = {name: np.zeros((rows,) + shape, dtype=dtype) for name, (shape, dtype) in self.shapes().items()}
+        return observations, np.zeros((rows, self.action_count), dtype=bool)
+
+    def write(self, observations, row, state, seat, kind, actor=-1, action=None, target=None, claim=None):
+        """
+        Write what the seat sees of the state when asked for a decision of
+        the kind. target is a seat, claim a character. The choices of an
+        exchange are written by mask_keep.
+        """
+        hand = observations["hand"][row]
+        hand[:] = 0
+        for code in state.hand(seat):
+            hand[code] += 1
+        observations["coins"][row] = state.coins
+        revealed = observations["revealed"][row]
+        revealed[:] = 0
+        influence = observations["influence"][row]
+        alive = observations["alive"][row]
+        for other in range(state.seats):
+            influence[other] = state.hand_size(other)
+            alive[other] = not state.is_eliminated(other)
+            for code in state.revealed_cards(other):
+                revealed[other, code] += 1
+        observations["turn"][row] = state.turn
+        observations["decision"][row] = kind
+        pending = observations["pending"][row]
+        pending[0] = actor
+        pending[1] = -1 if action is None else ACTION_INDEX[action]
+        pending[2] = -1 if target is None else target
+        pending[3] = -1 if claim is None else CARD_CODES[claim]
+        if kind != KEEP_CARDS:
+            observations["choices"][row] = 0
+
+    # Legal actions, each mask row is cleared first
+    def mask_actions(self, mask, moves, state, seat, options):
+        seats = self.seats
+        mask[:] = False
+        targets = moves.targets(seat, state.alive_mask())
+        for action in options:
+            offset = ACTION_INDEX[action] * seats
+            if action in TARGETED_ACTIONS:
+                for target in targets:
+                    mask[offset + target] = True
+            else:
+                mask[offset + seat] = True
+
+    def mask_response(self, mask, answer):
+        # Pass, or the answer, CHALLENGE or BLOCK
+        mask[:] = False
+        mask[self.response_offset + PASS] = True
+        mask[self.response_offset + answer] = True
+
+    def mask_reveal(self, mask, hand):
+        mask[:] = False
+        for code in hand:
+            mask[self.reveal_offset + code] = True
+
+    def mask_keep(self, mask, observations, row, cards, kept):
+        # The hands of kept cards out of cards, also written to the choices observation
+        choices = observations["choices"][row]
+        choices[:] = 0
+        for card in cards:
+            choices[CARD_CODES[card]] += 1
+        key = (tuple(choices.tolist()), kept)
+        keep_mask = self._keep_masks.get(key)
+        if keep_mask is None:
+            keep_mask = self._keep_masks[key] = np.array([
+                len(hand) == kept and all(map(int.__le__, counts, key[0]))
+                for hand, counts in zip(KEEP_HANDS, KEEP_COUNTS)
+            ])
+        mask[:self.keep_offset] = False
+        mask[self.keep_offset:] = keep_mask
+
+    # Between actions and their indices
+    def action_index(self, action, target, seat):
+        # target is a seat or None, untargeted actions are indexed by the deciding seat
+        return ACTION_INDEX[action] * self.seats + (seat if target is None else target)
+
+    def decode_action(self, index):
+        # Return (action, target seat), the target of an untargeted action being the deciding seat
+        return ACTIONS[index // self.seats], index % self.seats
+
+    def keep_index(self, cards):
+        return self.keep_offset + KEEP_POSITIONS[tuple(sorted(CARD_CODES[card] for card in cards))]
+
+    def kept_cards(self, index):
+        return [CHARACTERS[code] for code in KEEP_HANDS[index - self.keep_offset]]
+
+
+class VectorEnv:
+    """
+    number_of_games headless games played together behind a reset/step
+    interface, for training policies: one seat of each game, the agent
+    seat, is played by the actions given to step, the others by ai,
+    RandomAI by default. number_of_players is as in GameController.
+
+    Every decision of the agent is one step: choosing an action and its
+    target, challenging or blocking, challenging a block, the card to
+    reveal and the cards to keep after an exchange. Actions are indices
+    in the space of the Encoding of the table, action_masks tells which
+    ones are legal for every game.
+    Observations, one row per game, and masks are allocated once and
+    written in place at every step, copy them to keep them.
+
+    A game ends when the agent wins, reward 1, is eliminated, reward -1,
+    or after max_turns turns, truncated with reward 0. Finished games
+    are reset right away: the observation returned for them is the first
+    of the next game, as with Gymnasium vector environments.
+
+    The games run in threads of their own, each one blocked while it
+    waits for the agent, so the engine drives every game as it does
+    any other. Call close to stop them.
+    """
+
+    def __init__(self, number_of_games, number_of_players=3, ai=None, seat=0, max_turns=None, seed=None):
+        if not MIN_PLAYERS <= number_of_players <= MAX_PLAYERS:
+            raise ValueError(f"Number of players must be between {MIN_PLAYERS} and {MAX_PLAYERS}")
+        self.number_of_games = number_of_games
+        self.number_of_players = number_of_players
+        self.ai = ai if ai is not None else RandomAI()
+        self.seat = seat
+        self.max_turns = max_turns
+        self.seats = number_of_players + 3
+        if not 0 <= seat < self.seats:
+            raise ValueError(f"The agent seat must be between 0 and {self.seats - 1}")
+        self.encoding = Encoding.for_seats(self.seats)
+        self.action_count = self.encoding.action_count
+        self.observations, self.action_masks = self.encoding.allocate(number_of_games)
+        self.rewards = np.zeros(number_of_games, dtype=np.float32)
+        self.terminated = np.zeros(number_of_games, dtype=bool)
+        self.truncated = np.zeros(number_of_games, dtype=bool)
+
+        self.seed = seed
+        self.games = 0
+        self.slots = [GameSlot(self, index) for index in range(number_of_games)]
+        self.running = False
+
+    def reset(self, seed=None):
+        """
+        Drop the games being played and start new ones, game n of the
+        environment being seeded with simulation.game_seed(seed, n).
+        Return (observations, infos).
+        """
+        if seed is not None:
+            self.seed = seed
+        self.games = 0
+        if self.running:
+            for slot in self.slots:
+                slot.send(_ABORT)
+            for slot in self.slots:
+                slot.wait()
+        self.rewards[:] = 0
+        self.terminated[:] = False
+        self.truncated[:] = False
+        for slot in self.slots:
+            slot.send(self.next_seed())
+        for slot in self.slots:
+            self.collect(slot)
+        self.running = True
+        return self.observations, {}
+
+    def step(self, actions):
+        """
+        Play one decision of every game, actions holding an index of the
+        action space for each. Return (observations, rewards, terminated,
+        truncated, infos), the arrays being reused by the next step.
+        """
+        if not self.running:
+            raise Exception("The environment must be reset before stepping.")
+        actions = [int(action) for action in actions]
+        if len(actions) != self.number_of_games:
+            raise ValueError(f"One action is needed for each of the {self.number_of_games} games.")
+        # Checked before any game moves on, so a bad action leaves every game as it was
+        legal = self.action_masks[np.arange(self.number_of_games), actions]
+        if not legal.all():
+            game = int(np.flatnonzero(~legal)[0])
+            raise ValueError(f"Action {actions[game]} is not legal in game {game}.")
+        for slot, action in zip(self.slots, actions):
+            slot.send(action)
+        self.rewards[:] = 0
+        self.terminated[:] = False
+        self.truncated[:] = False
+        for slot in self.slots:
+            self.collect(slot)
+        return self.observations, self.rewards, self.terminated, self.truncated, {}
+
+    def collect(self, slot):
+        # Wait for the game of the slot to ask for a decision, starting new games as they end
+        while slot.wait():
+            index = slot.index
+            self.rewards[index] = slot.reward
+            if slot.reward:
+                self.terminated[index] = True
+            else:
+                self.truncated[index] = True
+            slot.send(self.next_seed())
+
+    def next_seed(self):
+        seed = None if self.seed is None else game_seed(self.seed, self.games)
+        self.games += 1
+        return seed
+
+    def close(self):
+        # Stop the game threads, the environment cannot be used afterwards
+        if self.running:
+            for slot in self.slots:
+                slot.send(_ABORT)
+            for slot in self.slots:
+                slot.wait()
+        for slot in self.slots:
+            slot.send(_CLOSE)
+            slot.thread.join()
+        self.running = False
+
+
+class GameSlot(RandomAI):
+    """
+    One game of a VectorEnv and the strategy of its agent seat: each
+    decision writes the observation and legal actions of the game to the
+    row of the environment, then blocks the game thread until step sends
+    the answer. Two locks hand control back and forth between the thread
+    calling step and the game thread, only one of them runs at a time.
+    """
+
+    def __init__(self, env, index):
+        self.env = env
+        self.index = index
+        self.encoding = env.encoding
+        self.mask = env.action_masks[index]
+        self.controller = None
+        self.target = None
+        self.reward = 0.0
+        self.error = None
+        self.command = None
+        # Released by the environment when a command is sent, by the game when it waits for one
+        self.commanded = threading.Lock()
+        self.commanded.acquire()
+        self.waiting = threading.Lock()
+        self.waiting.acquire()
+        self.ended = False
+        self.thread = threading.Thread(target=self.run, name=f"env-game-{index}", daemon=True)
+        self.thread.start()
+
+    # Environment side
+    def send(self, command):
+        self.command = command
+        self.commanded.release()
+
+    def wait(self):
+        # Wait for the game to ask for a decision or to end, return True when it ended
+        self.waiting.acquire()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        return self.ended
+
+    # Game thread side
+    def run(self):
+        while True:
+            self.commanded.acquire()
+            command = self.command
+            if command is _CLOSE:
+                return
+            if command is _ABORT:
+                # No game is running, there is nothing to drop
+                self.ended = False
+                self.waiting.release()
+                continue
+            try:
+                self.reward = self.play(command)
+                self.ended = True
+            except Aborted:
+                self.ended = False
+            except Truncated:
+                # A truncated game ends without a winner
+                self.reward = 0.0
+                self.ended = True
+            except Exception as error:
+                self.error = error
+            self.waiting.release()
+
+    def play(self, seed):
+        # Play a game until the agent wins or is eliminated, return the reward
+        env = self.env
+        seat = env.seat
+        controller = self.controller
+        if controller is None:
+            controller = self.controller = GameController(env.number_of_players, headless=True, seed=seed, ai=env.ai)
+            controller.players[seat].ai = self
+        else:
+            controller.reset(seed)
+        state = controller.state
+        while not controller.is_game_over():
+            controller.play_turn()
+            if state.is_eliminated(seat):
+                return -1.0
+            if controller.is_game_over():
+                break
+            controller.next_turn()
+        return 1.0
+
+    def decide(self, kind, actor=-1, action=None, target=None, claim=None):
+        """
+        Write the observation of the game for a decision, its legal actions
+        being already in the mask row, and wait for the answer.
+        """
+        env = self.env
+        controller = self.controller
+        if env.max_turns is not None and controller.turns > env.max_turns:
+            raise Truncated()
+        self.encoding.write(env.observations, self.index, controller.state, env.seat, kind, actor, action, target, claim)
+        self.ended = False
+        self.waiting.release()
+        self.commanded.acquire()
+        command = self.command
+        if command is _ABORT:
+            raise Aborted()
+        return command
+
+    def respond(self, kind, answer, challenged, action, target, claim):
+        self.encoding.mask_response(self.mask, answer)
+        target = None if target is None else target.seat
+        return self.decide(kind, challenged.seat, action, target, claim) == self.encoding.response_offset + answer
+
+    # Strategy of the agent seat
+    def choose_action(self, controller, player, options):
+        self.encoding.mask_actions(self.mask, controller.moves, controller.state, player.seat, options)
+        action, self.target = self.encoding.decode_action(self.decide(CHOOSE_ACTION))
+        return action
+
+    def choose_target(self, controller, player, action, targets):
+        return controller.players[self.target]
+
+    def decide_to_challenge(self, controller, player, challenged, action, target=None, claimed_card=None):
+        if claimed_card is None:
+            return self.respond(
+                CHALLENGE_ACTION, CHALLENGE, challenged, action, target, COUP_RULES_CONFIG[action]["performed_by"]
+            )
+        return self.respond(CHALLENGE_BLOCK, CHALLENGE, challenged, action, target, claimed_card)
+
+    def decide_to_block(self, controller, player, blocked_player, action, target=None):
+        return self.respond(BLOCK_ACTION, BLOCK, blocked_player, action, target, None)
+
+    def choose_card_to_reveal(self, player):
+        hand = player.state.hand(player.seat)
+        if len(hand) == 1:
+            return 0
+        self.encoding.mask_reveal(self.mask, hand)
+        return hand.index(self.decide(REVEAL_CARD) - self.encoding.reveal_offset)
+
+    def choose_cards_to_keep(self, controller, player, cards):
+        encoding = self.encoding
+        encoding.mask_keep(self.mask, self.env.observations, self.index, cards, len(player.cards))
+        return encoding.kept_cards(self.decide(KEEP_CARDS))
@@ -0,0 +1,171 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+from events import GAME_START, RECORD, Event, EventSchema
+
+MAGIC = b"COUPLOG\0"
+VERSION = 1
+# magic, version, record size, length of the JSON schema that follows
+HEADER = struct.Struct("<8sHHI")
+
+
+def read_header(file):
+    """
+    Read the header of a log from the start of an open file.
+    Return the schema of the log and the offset of its first record.
+    """
+    file.seek(0)
+    magic, version, record_size, schema_size = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("Not a game event log.")
+    if version != VERSION or record_size != RECORD.size:
+        raise ValueError(f"Unsupported event log version {version}.")
+    schema = EventSchema.from_description(json.loads(file.read(schema_size)))
+    return schema, HEADER.size + schema_size
+
+
+class EventLogWriter:
+    """
+    Append the events of games to a log file.
+    The writer is a listener of GameController: each event is packed into
+    a fixed width record of a preallocated buffer, written out once the
+    buffer is full. The file starts with a header describing the schema,
+    appending to an existing log requires the same rules.
+    """
+
+    def __init__(self, path, schema=None, buffer_records=8192):
+        self.schema = schema if schema is not None else EventSchema.from_rules()
+        self.file = open(path, "ab")
+        if self.file.tell() == 0:
+            description = json.dumps(self.schema.describe()).encode()
+            self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, len(description)) + description)
+        else:
+            with open(path, "rb") as existing:
+                schema, data_offset = read_header(existing)
+            if schema.fingerprint != self.schema.fingerprint:
+                self.file.close()
+                raise ValueError("The event log was written with other rules.")
+            # Drop a record cut short by a crash, appends must stay aligned
+            end = self.file.tell()
+            self.file.truncate(end - (end - data_offset) % RECORD.size)
+        self.buffer = bytearray(RECORD.size * buffer_records)
+        self.position = 0
+        self.records = 0
+
+    def __call__(self, kind, seat, other, code, value):
+        RECORD.pack_into(self.buffer, self.position, kind, seat, other, code, value)
+        self.position += RECORD.size
+        self.records += 1
+        if self.position == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        self.file.write(memoryview(self.buffer)[:self.position])
+        self.file.flush()
+        self.position = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class EventLogReader:
+    """
+    Read a log written by EventLogWriter through a memory map,
+    records are decoded as they are iterated and never all loaded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            self.schema, self.data_offset = read_header(file)
+            size = os.fstat(file.fileno()).st_size
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = (size - self.data_offset) // RECORD.size
+        self.view = memoryview(self.map)[self.data_offset:self.data_offset + self.size * RECORD.size]
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError("Event index out of range.")
+        return Event._make(RECORD.unpack_from(self.view, index * RECORD.size))
+
+    def __iter__(self):
+        return self.records()
+
+    def records(self, start=0, stop=None):
+        """
+        Yield the raw (kind, seat, other, code, value) tuples of records start to stop
+        """
+        stop = self.size if stop is None else min(stop, self.size)
+        return RECORD.iter_unpack(self.view[start * RECORD.size:stop * RECORD.size])
+
+    def game_starts(self):
+        # Yield the index of the first record of every game
+        for index, kind in enumerate(self.view[::RECORD.size]):
+            if kind == GAME_START:
+                yield index
+
+    def games(self):
+        """
+        Yield the events of one game at a time, as lists of Event
+        """
+        game = None
+        for record in self.records():
+            if record[0] == GAME_START:
+                if game:
+                    yield game
+                game = []
+            if game is not None:
+                game.append(Event._make(record))
+        if game:
+            yield game
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read a binary event log of games.")
+    parser.add_argument("path", help="event log to read")
+    parser.add_argument("--game", type=int, metavar="G", help="print the events of game G of the log")
+    args = parser.parse_args()
+
+    with EventLogReader(args.path) as reader:
+        if args.game is None:
+            games = sum(1 for _ in reader.game_starts())
+            print(f"{len(reader)} events, {games} games, rules {reader.schema.fingerprint:016x}")
+            if not reader.schema.matches():
+                print("The log was written with other rules than the current ones.")
+            return
+        for index, start in enumerate(reader.game_starts()):
+            if index == args.game:
+                break
+        else:
+            raise SystemExit(f"The log has no game {args.game}.")
+        for offset, record in enumerate(reader.records(start)):
+            if offset and record[0] == GAME_START:
+                break
+            print(reader.schema.format(record))
+
+
+if __name__ == "__main__":
+    main()
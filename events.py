@@ -0,0 +1,130 @@
+import json
+import struct
+from collections import namedtuple
+from hashlib import blake2b
+from constants import COUP_RULES_CONFIG, CHARACTERS
+
+# Kinds of events of a game, the first byte of a record
+GAME_START = 0
+TURN = 1
+DEAL = 2
+ACTION = 3
+CHALLENGE = 4
+BLOCK = 5
+REVEAL = 6
+RETURN = 7
+EXCHANGE_DRAW = 8
+EXCHANGE_RETURN = 9
+COINS = 10
+GAME_END = 11
+EVENT_NAMES = (
+    "game_start", "turn", "deal", "action", "challenge", "block",
+    "reveal", "return", "exchange_draw", "exchange_return", "coins", "game_end"
+)
+
+# Marks an unused seat or code field
+NONE = 255
+
+# kind, seat, other seat, code of an action or a character, signed value
+RECORD = struct.Struct("<BBBBq")
+
+Event = namedtuple("Event", ["kind", "seat", "other", "code", "value"])
+
+# Codes of the actions of the game rules, characters use the codes of GameState
+ACTION_CODES = {action: code for code, action in enumerate(COUP_RULES_CONFIG)}
+
+
+def rules_fingerprint(rules=COUP_RULES_CONFIG, characters=CHARACTERS):
+    """
+    Return a 64 bit fingerprint of a rule set and its characters.
+    Logs record it so events are never decoded with codes of other rules.
+    """
+    description = json.dumps([rules, list(characters)], sort_keys=True)
+    return int.from_bytes(blake2b(description.encode(), digest_size=8).digest(), "little")
+
+
+class EventSchema:
+    """
+    Meaning of the fields of a record, derived from a rule set:
+    actions are coded by their order in the rules and characters by their
+    order in CHARACTERS, which are also the card codes of GameState.
+
+    Fields used by each kind of event, in record order, the others hold NONE or 0:
+        game_start       seats, card copies, 1 if seeded, seed
+        turn             player, turn number
+        deal             player, character drawn
+        action           player, target, action
+        challenge        challenger, challenged, character, 1 if it succeeded
+        block            blocker, blocked player, character
+        reveal, return, exchange_draw, exchange_return
+                         player, character
+        coins            player, coins won or lost
+        game_end         winner, turns played
+
+    A return puts a card shown to win a challenge back in the deck,
+    the deal that follows replaces it. The cards kept by an exchange are
+    the hand and the cards drawn, less the cards returned.
+    Seeds are 64 bit unsigned and stored as the signed value of the same bits.
+    """
+
+    def __init__(self, actions, characters, fingerprint):
+        self.actions = tuple(actions)
+        self.characters = tuple(characters)
+        self.fingerprint = fingerprint
+        self.action_codes = {action: code for code, action in enumerate(self.actions)}
+        self.card_codes = {character: code for code, character in enumerate(self.characters)}
+
+    @classmethod
+    def from_rules(cls, rules=COUP_RULES_CONFIG, characters=CHARACTERS):
+        return cls(rules, characters, rules_fingerprint(rules, characters))
+
+    @classmethod
+    def from_description(cls, description):
+        return cls(description["actions"], description["characters"], int(description["fingerprint"], 16))
+
+    def describe(self):
+        # JSON friendly description, stored in the header of a log
+        return {
+            "actions": list(self.actions),
+            "characters": list(self.characters),
+            "events": list(EVENT_NAMES),
+            "record": RECORD.format,
+            "fingerprint": f"{self.fingerprint:016x}",
+        }
+
+    def matches(self, rules=COUP_RULES_CONFIG, characters=CHARACTERS):
+        return self.fingerprint == rules_fingerprint(rules, characters)
+
+    def format(self, event):
+        """
+        Return a short human readable line for an event
+        """
+        kind, seat, other, code, value = event
+        name = EVENT_NAMES[kind]
+        if kind == GAME_START:
+            seed = to_seed(value) if code == 1 else None
+            return f"{name} seats={seat} copies={other} seed={seed}"
+        if kind in (TURN, GAME_END, COINS):
+            return f"{name} seat={seat} value={value}"
+        if kind == ACTION:
+            target = "" if other == NONE else f" target={other}"
+            return f"{name} seat={seat} {self.actions[code]}{target}"
+        card = self.characters[code]
+        if kind in (CHALLENGE, BLOCK):
+            result = f" succeeded={bool(value)}" if kind == CHALLENGE else ""
+            return f"{name} seat={seat} other={other} {card}{result}"
+        return f"{name} seat={seat} {card}"
+
+
+def is_recorded_seed(seed):
+    # Only 64 bit unsigned integer seeds fit in a record
+    return isinstance(seed, int) and 0 <= seed < 1 << 64
+
+
+def from_seed(seed):
+    # Store an unsigned 64 bit seed in the signed value field
+    return seed - (1 << 64) if seed >= 1 << 63 else seed
+
+
+def to_seed(value):
+    return value & (1 << 64) - 1
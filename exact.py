@@ -0,0 +1,478 @@
+import argparse
+import math
+from collections import OrderedDict
+from itertools import combinations
+import numpy as np
+from constants import CARD_COPIES, CHARACTERS, COUP_RULES_CONFIG, TARGETED_ACTIONS
+from moves import MoveGenerator
+
+ACTIONS = list(COUP_RULES_CONFIG)
+ACTION_INDEX = {action: index for index, action in enumerate(ACTIONS)}
+STEAL_AMOUNT = COUP_RULES_CONFIG["steal"]["amount"]
+HAND_SIZE = 2
+
+
+class UniformPolicy:
+    """
+    The random AI of GameController as a table policy: every legal action
+    equally likely and every challenge or block decision a fair coin flip.
+    """
+
+    def __init__(self):
+        rows = MoveGenerator.for_game(2).max_coins + 1
+        self.action_weights = [[1.0] * len(ACTIONS) for _ in range(rows)]
+        self.challenge_probability = [0.5] * len(ACTIONS)
+        self.block_probability = [0.5] * len(ACTIONS)
+        self.block_challenge_probability = [0.5] * len(ACTIONS)
+
+
+def drawn(deck):
+    # (chances, character) of drawing each character left in the deck
+    size = sum(deck)
+    return [(count / size, card) for card, count in enumerate(deck) if count]
+
+
+def remove(cards, card):
+    cards = list(cards)
+    cards.remove(card)
+    return tuple(cards)
+
+
+def exchange_outcomes(hand, deck):
+    # [(chances, kept hand, deck after)] of an exchange, which only depend on the hand and the deck
+    results = {}
+    for first_chances, first in drawn(deck):
+        after_first = list(deck)
+        after_first[first] -= 1
+        for second_chances, second in drawn(after_first):
+            cards = hand + (first, second)
+            kept_sets = list(combinations(range(len(cards)), len(hand)))
+            for kept in kept_sets:
+                after_deck = after_first[:]
+                after_deck[second] -= 1
+                for position, card in enumerate(cards):
+                    if position not in kept:
+                        after_deck[card] += 1
+                key = (tuple(sorted(cards[position] for position in kept)), tuple(after_deck))
+                results[key] = results.get(key, 0.0) + first_chances * second_chances / len(kept_sets)
+    return [(chances, kept, after_deck) for (kept, after_deck), chances in results.items()]
+
+
+class ExactEvaluator:
+    """
+    Exact chances of winning of every seat when all of them play a table
+    policy, batch.TablePolicy or UniformPolicy, which only looks at the
+    coins: the policy and the random draws make each turn a distribution
+    over the next states, so the chances of a state are the weighted
+    chances of the states after its turn.
+
+    A state is the seat to play, the coins, the hand of every seat and the
+    deck counts, which are everything the rules and the policy look at.
+    The number of cards in hands never goes up and, while it stays the
+    same, the coins in play never go down, so states only come back to
+    themselves within a class of equal cards and coins. The states of a
+    class reached from a state are solved together, one strongly connected
+    set at a time, once the classes they lead to are known.
+
+    The chances of the last max_states states solved are kept, the least
+    recently used being dropped first, a dropped state is solved again
+    when it is needed. A game of 2 seats has about 450000 states, those
+    of 3 seats or more have millions.
+    """
+
+    def __init__(self, seats, policy=None, copies=CARD_COPIES, max_states=500000):
+        if seats < 2:
+            raise ValueError("A game needs at least 2 seats")
+        if seats * HAND_SIZE + 2 > copies * len(CHARACTERS):
+            raise ValueError("Not enough cards in the deck to deal every seat and exchange")
+        self.seats = seats
+        self.copies = copies
+        self.max_states = max_states
+        self.moves = MoveGenerator.for_game(seats)
+        policy = policy if policy is not None else UniformPolicy()
+        self.action_weights = [[float(weight) for weight in row] for row in policy.action_weights]
+        self.challenge_probability = [float(p) for p in policy.challenge_probability]
+        self.block_probability = [float(p) for p in policy.block_probability]
+        self.block_challenge_probability = [float(p) for p in policy.block_challenge_probability]
+        self.memo = OrderedDict()
+        # Outcomes of responses and exchanges, which only depend on the cards
+        self.cards_cache = OrderedDict()
+        self.solved = 0
+
+    # States
+    def initial_states(self):
+        """
+        Return [(chances, state)] of every deal, cards dealt two by two in
+        seat order like GameController, seat 0 to play with 2 coins each.
+        """
+        deals = {((), tuple([self.copies] * len(CHARACTERS))): 1.0}
+        for _ in range(self.seats):
+            dealt = {}
+            for (hands, deck), chances in deals.items():
+                for first_chances, first in drawn(deck):
+                    after_first = list(deck)
+                    after_first[first] -= 1
+                    for second_chances, second in drawn(after_first):
+                        after_second = after_first[:]
+                        after_second[second] -= 1
+                        key = (hands + (tuple(sorted((first, second))),), tuple(after_second))
+                        dealt[key] = dealt.get(key, 0.0) + chances * first_chances * second_chances
+            deals = dealt
+        coins = (2,) * self.seats
+        return [(chances, (0, coins, hands, deck)) for (hands, deck), chances in deals.items()]
+
+    def win_probabilities(self):
+        # Chances of winning of every seat, over every deal
+        totals = [0.0] * self.seats
+        for chances, state in self.initial_states():
+            for seat, value in enumerate(self.value(state)):
+                totals[seat] += chances * value
+        return totals
+
+    @staticmethod
+    def level(state):
+        # The class of a state: the cards in hands, then the coins in play
+        _, coins, hands, _ = state
+        return sum(map(len, hands)), sum(coins)
+
+    def value(self, state):
+        """
+        Return the chances of winning of every seat from the state.
+        """
+        value = self.memo.get(state)
+        if value is not None:
+            self.memo.move_to_end(state)
+            return value
+        _, _, hands, _ = state
+        alive = [seat for seat, hand in enumerate(hands) if hand]
+        if len(alive) == 1:
+            return tuple(1.0 if seat == alive[0] else 0.0 for seat in range(self.seats))
+        return self.solve_class(state)
+
+    def remember(self, cache, key, value):
+        cache[key] = value
+        if len(cache) > self.max_states:
+            cache.popitem(last=False)
+
+    # Solving
+    def solve_class(self, start):
+        """
+        Solve every state of the class of start reached from it. The chances
+        of the states it leads to in other classes are known first, then the
+        strongly connected sets are solved, the ones leading to no other first.
+        Return the chances of start, which the memo may already have dropped.
+        """
+        level = self.level(start)
+        members = [start]
+        index = {start: 0}
+        transitions = []
+        # Chances of winning of the states of other classes, weighted, per member
+        known = []
+        position = 0
+        while position < len(members):
+            inside = {}
+            outside = [0.0] * self.seats
+            for state, chances in self.turn(members[position]).items():
+                if self.level(state) == level and state not in self.memo:
+                    if state not in index:
+                        index[state] = len(members)
+                        members.append(state)
+                    inside[index[state]] = chances
+                else:
+                    for seat, value in enumerate(self.value(state)):
+                        outside[seat] += chances * value
+            transitions.append(inside)
+            known.append(outside)
+            position += 1
+
+        values = [None] * len(members)
+        for component in strongly_connected(transitions):
+            self.solve_component(component, transitions, known, values)
+        for member, state in enumerate(members):
+            self.remember(self.memo, state, values[member])
+        self.solved += len(members)
+        return values[0]
+
+    def solve_component(self, component, transitions, known, values):
+        # Fold the solved states into the constants, then solve the states left together
+        if len(component) == 1:
+            # A state alone only comes back to itself
+            member = component[0]
+            constant = known[member][:]
+            staying = 0.0
+            for other, chances in transitions[member].items():
+                if other == member:
+                    staying = chances
+                else:
+                    for seat, value in enumerate(values[other]):
+                        constant[seat] += chances * value
+            values[member] = tuple(value / (1 - staying) for value in constant)
+            return
+        local = {member: position for position, member in enumerate(component)}
+        matrix = np.identity(len(component))
+        constants = np.array([known[member] for member in component])
+        for position, member in enumerate(component):
+            for other, chances in transitions[member].items():
+                if other in local:
+                    matrix[position, local[other]] -= chances
+                else:
+                    constants[position] += chances * np.asarray(values[other])
+        solution = np.linalg.solve(matrix, constants)
+        for position, member in enumerate(component):
+            values[member] = tuple(solution[position].tolist())
+
+    # Rules
+    def turn(self, state):
+        """
+        Return {next state: chances} after the turn of the seat to play.
+        """
+        actor, coins, hands, deck = state
+        alive_mask = sum(1 << seat for seat, hand in enumerate(hands) if hand)
+        legal = self.moves.legal_actions(coins[actor])
+        row = self.action_weights[min(coins[actor], len(self.action_weights) - 1)]
+        total = sum(row[ACTION_INDEX[action]] for action in legal)
+        outcomes = {}
+        # The seat to play next and the seats eliminated, for each set of hands after the turn
+        following = {}
+        for action in legal:
+            action_chances = row[ACTION_INDEX[action]] / total
+            if not action_chances:
+                continue
+            targets = self.moves.targets(actor, alive_mask) if action in TARGETED_ACTIONS else (None,)
+            target_chances = action_chances / len(targets)
+            for chances, after_hands, after_deck, performed in self.responses(actor, action, hands, deck):
+                chances *= target_chances
+                for target in targets:
+                    if performed:
+                        results = self.perform(actor, action, target, coins, after_hands, after_deck)
+                    else:
+                        results = ((1.0, coins, after_hands, after_deck),)
+                    for result_chances, result_coins, result_hands, result_deck in results:
+                        after = following.get(result_hands)
+                        if after is None:
+                            after = following[result_hands] = next_seat(actor, result_hands)
+                        seat, eliminated = after
+                        if eliminated and any(result_coins[dead] for dead in eliminated):
+                            # Eliminated seats drop their coins, nobody can take them
+                            result_coins = tuple(0 if not hand else coin for hand, coin in zip(result_hands, result_coins))
+                        result = (seat, result_coins, result_hands, result_deck)
+                        outcomes[result] = outcomes.get(result, 0.0) + chances * result_chances
+        return outcomes
+
+    def responses(self, actor, action, hands, deck):
+        """
+        Return [(chances, hands, deck, performed)] after the other seats
+        were asked in seat order to challenge, then to block, until one of
+        them did. They only depend on the cards, and are kept.
+        """
+        key = (actor, action, hands, deck)
+        results = self.cards_cache.get(key)
+        if results is not None:
+            self.cards_cache.move_to_end(key)
+            return results
+        rule = COUP_RULES_CONFIG[action]
+        challenge = self.challenge_probability[ACTION_INDEX[action]] if rule["can_be_challenged"] else 0.0
+        block = self.block_probability[ACTION_INDEX[action]] if rule["blocked_by"] else 0.0
+        results = []
+        asked = 1.0
+        for seat, hand in enumerate(hands):
+            if seat == actor or not hand:
+                continue
+            if challenge:
+                claim = CHARACTERS.index(rule["performed_by"])
+                for chances, after_hands, after_deck, succeeded in self.challenge(hands, deck, seat, actor, claim):
+                    results.append((asked * challenge * chances, after_hands, after_deck, not succeeded))
+                asked *= 1 - challenge
+            if block:
+                for chances, after_hands, after_deck, goes_on in self.block(hands, deck, seat, actor, action):
+                    results.append((asked * block * chances, after_hands, after_deck, goes_on))
+                asked *= 1 - block
+        if asked:
+            results.append((asked, hands, deck, True))
+        self.remember(self.cards_cache, key, results)
+        return results
+
+    def challenge(self, hands, deck, challenger, challenged, claim):
+        """
+        Return [(chances, hands, deck, succeeded)] of a challenge of a claim:
+        a challenged seat holding the card shows it and draws a new one, the
+        loser reveals one of their cards.
+        """
+        if claim not in hands[challenged]:
+            return [(chances, after, deck, True) for chances, after in lose_influence(hands, challenged)]
+        results = []
+        for chances, after in lose_influence(hands, challenger):
+            for replaced_chances, replaced, after_deck in replace_card(after, deck, challenged, claim):
+                results.append((chances * replaced_chances, replaced, after_deck, False))
+        return results
+
+    def block(self, hands, deck, blocker, actor, action):
+        """
+        Return [(chances, hands, deck, goes on)] of a block: the blocker
+        claims a blocking character they hold or bluffs the first one, and
+        the actor may challenge the claim.
+        """
+        blocked_by = [CHARACTERS.index(character) for character in COUP_RULES_CONFIG[action]["blocked_by"]]
+        claim = next((character for character in blocked_by if character in hands[blocker]), blocked_by[0])
+        challenge = self.block_challenge_probability[ACTION_INDEX[action]]
+        results = [(1 - challenge, hands, deck, False)] if challenge < 1 else []
+        if challenge:
+            for chances, after_hands, after_deck, succeeded in self.challenge(hands, deck, actor, blocker, claim):
+                results.append((challenge * chances, after_hands, after_deck, succeeded))
+        return results
+
+    def perform(self, actor, action, target, coins, hands, deck):
+        # [(chances, coins, hands, deck)] after the action
+        rule = COUP_RULES_CONFIG[action]
+        coins = list(coins)
+        coins[actor] += rule["income"] - rule["cost"]
+        if action == "steal":
+            amount = min(coins[target], STEAL_AMOUNT)
+            coins[target] -= amount
+            coins[actor] += amount
+        coins = tuple(coins)
+        if action in ("coup", "assassinate"):
+            return [(chances, coins, after, deck) for chances, after in lose_influence(hands, target)]
+        if action == "exchange":
+            key = (hands[actor], deck)
+            outcomes = self.cards_cache.get(key)
+            if outcomes is None:
+                outcomes = exchange_outcomes(hands[actor], deck)
+                self.remember(self.cards_cache, key, outcomes)
+            return [
+                (chances, coins, hands[:actor] + (kept,) + hands[actor + 1:], after_deck)
+                for chances, kept, after_deck in outcomes
+            ]
+        return [(1.0, coins, hands, deck)]
+
+
+def next_seat(actor, hands):
+    # The next seat alive after the actor, and the seats eliminated
+    seats = len(hands)
+    eliminated = tuple(seat for seat, hand in enumerate(hands) if not hand)
+    for step in range(1, seats + 1):
+        seat = (actor + step) % seats
+        if hands[seat]:
+            return seat, eliminated
+
+
+def lose_influence(hands, seat):
+    # [(chances, hands)] after the seat reveals one of their cards at random
+    hand = hands[seat]
+    if not hand:
+        return [(1.0, hands)]
+    return [
+        (hand.count(card) / len(hand), hands[:seat] + (remove(hand, card),) + hands[seat + 1:])
+        for card in sorted(set(hand))
+    ]
+
+
+def replace_card(hands, deck, seat, card):
+    # [(chances, hands, deck)] after the card goes back to the deck and a new one is drawn
+    deck = list(deck)
+    deck[card] += 1
+    hand = remove(hands[seat], card)
+    results = []
+    for chances, new in drawn(deck):
+        after_deck = deck[:]
+        after_deck[new] -= 1
+        results.append((chances, hands[:seat] + (tuple(sorted(hand + (new,))),) + hands[seat + 1:], tuple(after_deck)))
+    return results
+
+
+def strongly_connected(transitions):
+    """
+    Tarjan's algorithm without recursion over the graph of the transitions.
+    Return the strongly connected sets of states, each set before the
+    sets leading to it.
+    """
+    count = len(transitions)
+    order = [None] * count
+    low = [0] * count
+    on_stack = [False] * count
+    stack = []
+    components = []
+    counter = 0
+    for root in range(count):
+        if order[root] is not None:
+            continue
+        work = [(root, iter(transitions[root]))]
+        order[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        while work:
+            node, successors = work[-1]
+            for successor in successors:
+                if order[successor] is None:
+                    order[successor] = low[successor] = counter
+                    counter += 1
+                    stack.append(successor)
+                    on_stack[successor] = True
+                    work.append((successor, iter(transitions[successor])))
+                    break
+                if on_stack[successor]:
+                    low[node] = min(low[node], order[successor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == order[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def check(evaluator, games, seed=0):
+    """
+    Play games with the batch simulator and the same policy and compare
+    its win rates with the exact chances.
+    Return (exact chances, batch win rates, z scores) per seat, the z
+    scores staying within about 3 if both play the same rules.
+    """
+    from batch import BatchSimulator, TablePolicy
+
+    policy = TablePolicy(
+        evaluator.action_weights, evaluator.challenge_probability, evaluator.block_probability,
+        evaluator.block_challenge_probability
+    )
+    batch = BatchSimulator(games, evaluator.seats, policy=policy, seed=seed, copies=evaluator.copies)
+    batch.run()
+    rates = list(batch.win_rates())
+    exact = evaluator.win_probabilities()
+    scores = [
+        (rate - chances) / math.sqrt(chances * (1 - chances) / games) if 0 < chances < 1 else 0.0
+        for rate, chances in zip(rates, exact)
+    ]
+    return exact, rates, scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exact chances of winning of every seat of random AI games.")
+    parser.add_argument("--seats", type=int, default=2, help="seats of the table (default: 2)")
+    parser.add_argument("--copies", type=int, default=CARD_COPIES, help="copies of each character in the deck")
+    parser.add_argument("--max-states", type=int, default=500000, help="states whose chances are kept (default: 500000)")
+    parser.add_argument("--check", type=int, default=0, help="games of the batch simulator to compare with")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    evaluator = ExactEvaluator(args.seats, copies=args.copies, max_states=args.max_states)
+    if args.check:
+        exact, rates, scores = check(evaluator, args.check, args.seed)
+        for seat, (chances, rate, score) in enumerate(zip(exact, rates, scores)):
+            print(f"Seat {seat}: exact {chances:.6f}, batch {rate:.6f}, z {score:+.2f}")
+    else:
+        for seat, chances in enumerate(evaluator.win_probabilities()):
+            print(f"Seat {seat}: {chances:.6f}")
+    print(f"{evaluator.solved} states solved, {len(evaluator.memo)} kept")
+
+
+if __name__ == "__main__":
+    main()
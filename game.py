@@ -1,9 +1,39 @@
-
+import argparse
+from ai import RandomAI
+from beliefs import BeliefAI, Beliefs
+from constants import MAX_PLAYERS, MIN_PLAYERS
 from controller import GameController
+from event_log import EventLogWriter
+from instruments import Instruments
+from simulation import MAX_TURNS, simulate
+from views import VERBOSITY_LEVELS, GameView, Renderer
+
+
+def make_ai(name, budget):
+    if name == "mcts":
+        # Imported here, the search is only needed when asked for
+        from mcts import ISMCTSAI
+        return ISMCTSAI(time_budget=budget, beliefs=Beliefs())
+    if name == "endgame":
+        from endgame import EndgameAI, EndgameTable
+        try:
+            return EndgameAI(EndgameTable(), beliefs=Beliefs())
+        except FileNotFoundError:
+            raise SystemExit("No endgame table, build it with: python endgame.py build")
+    if name == "beliefs":
+        return BeliefAI(Beliefs())
+    return RandomAI()
+
 
+def ai_listeners(ai):
+    # Strategies keeping beliefs need to hear the events of their games
+    beliefs = getattr(ai, "beliefs", None)
+    return [beliefs] if beliefs is not None else []
 
-def main():
-    controller = GameController()
+
+def main(ai=None, renderer=None):
+    renderer = renderer if renderer is not None else Renderer()
+    controller = GameController(ai=ai, view=GameView(renderer), listeners=ai_listeners(ai))
     controller.view.display_welcome_message()
 
     # Ask for human player name
@@ -16,27 +46,15 @@ def main():
             controller.current_player_index
         )
 
-        # Step 1: Choose an action and target
-        current_player = controller.current_player
-        action, target = controller.choose_action()
-
-        # Step 2: Challenge or block if necessary
-        can_perform_action = controller.challenge_or_block(
-            action,
-            current_player,
-            target
-        )
-
-        # Step 3: Perform the action
-        if can_perform_action:
-            controller.perform_action(action, current_player, target)
+        # Choose, challenge or block, then perform the action
+        controller.play_turn()
 
-        # Step 4: Check if game is over
+        # Check if game is over
         if controller.is_game_over():
             winner = controller.get_winner()
             controller.view.display_game_over(winner)
             if controller.view.ask_to_play_again():
-                controller = GameController()
+                controller.reset()
                 controller.view.display_welcome_message()
                 continue
             else:
@@ -45,5 +63,91 @@ def main():
         controller.next_turn()
 
 
+def run_simulation(number_of_games, number_of_players, seed=None, ai=None, log=None, metrics=None, profile_games=None):
+    instruments = Instruments(profile_games=profile_games) if metrics or profile_games else None
+    if log:
+        with EventLogWriter(log) as writer:
+            stats = simulate(
+                number_of_games, number_of_players, seed=seed, ai=ai, listeners=[writer] + ai_listeners(ai),
+                instruments=instruments
+            )
+        print(f"Recorded {writer.records} events to {log}")
+    else:
+        stats = simulate(
+            number_of_games, number_of_players, seed=seed, ai=ai, listeners=ai_listeners(ai), instruments=instruments
+        )
+    print(f"Simulated {stats['games']} games ({stats['turns']} turns) in {stats['seconds']:.2f}s")
+    print(f"{stats['games_per_second']:.1f} games/sec, {stats['turns_per_second']:.1f} turns/sec")
+    if stats["unfinished"]:
+        print(f"{stats['unfinished']} games stopped unfinished after {MAX_TURNS} turns")
+    if hasattr(ai, "report"):
+        print(ai.report())
+    if metrics:
+        with open(metrics, "w") as file:
+            file.write(instruments.prometheus())
+        print(f"Metrics written to {metrics}")
+    if profile_games and instruments.profiler is not None:
+        instruments.profile_stats().sort_stats("cumulative").print_stats(20)
+
+
+def game_range(text):
+    # START:STOP of the games to profile, a single number for one game
+    start, _, stop = text.partition(":")
+    try:
+        return range(int(start), int(stop) if stop else int(start) + 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid game range: {text}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Coup - Command Line Edition")
+    parser.add_argument(
+        "--simulate", type=int, metavar="N",
+        help="play N headless AI-only games and report the throughput"
+    )
+    parser.add_argument(
+        "--players", type=int, default=3, choices=range(MIN_PLAYERS, MAX_PLAYERS + 1),
+        help="size of the table, which seats PLAYERS + 3 players (default: 3)"
+    )
+    parser.add_argument(
+        "--seed", type=int,
+        help="seed of the simulated games, to make a run reproducible"
+    )
+    parser.add_argument(
+        "--ai", choices=["random", "mcts", "beliefs", "endgame"], default="random",
+        help="strategy of the AI players (default: random)"
+    )
+    parser.add_argument(
+        "--budget", type=float, default=0.5,
+        help="seconds an mcts AI may search for each decision (default: 0.5)"
+    )
+    parser.add_argument(
+        "--verbosity", choices=list(VERBOSITY_LEVELS), default="verbose",
+        help="how much of the game is shown (default: verbose)"
+    )
+    parser.add_argument(
+        "--palette", choices=["ansi", "plain"], default="ansi",
+        help="colors of the output, plain for none (default: ansi)"
+    )
+    parser.add_argument(
+        "--log", metavar="PATH",
+        help="append the events of the simulated games to a binary event log"
+    )
+    parser.add_argument(
+        "--metrics", metavar="PATH",
+        help="write the phase timers and counters of the simulated games as Prometheus text"
+    )
+    parser.add_argument(
+        "--profile-games", type=game_range, metavar="START:STOP",
+        help="profile the simulated games START to STOP with cProfile"
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    ai = make_ai(args.ai, args.budget)
+    if args.simulate:
+        run_simulation(args.simulate, args.players, args.seed, ai, args.log, args.metrics, args.profile_games)
+    else:
+        main(ai, Renderer(palette=args.palette, verbosity=VERBOSITY_LEVELS[args.verbosity]))
@@ -1,35 +1,59 @@
 from colored import Fore, Back, Style
 
+# Colors of the actions and of the characters, in the ANSI palette
+ACTION_STYLES = {
+    "tax": Fore.MAGENTA,
+    "steal": Fore.BLUE,
+    "exchange": Fore.GREEN,
+    "assassinate": f"{Fore.BLACK}{Back.WHITE}",
+    "income": Fore.YELLOW,
+    "foreign_aid": Fore.YELLOW,
+    "coup": Back.RED,
+}
+CARD_STYLES = {
+    "duke": Fore.MAGENTA,
+    "captain": Fore.BLUE,
+    "ambassador": Fore.GREEN,
+    "assassin": f"{Fore.BLACK}{Back.WHITE}",
+    "contessa": Fore.RED,
+}
 
-def colorize_text(text, action):
-    if action == "tax":
-        return f"{Fore.MAGENTA}{text}{Style.RESET}"
-    elif action == "steal":
-        return f"{Fore.BLUE}{text}{Style.RESET}"
-    elif action == "exchange":
-        return f"{Fore.GREEN}{text}{Style.RESET}"
-    elif action == "assassinate":
-        return f"{Fore.BLACK}{Back.WHITE}{text}{Style.RESET}"
-    elif action == "income":
-        return f"{Fore.YELLOW}{text}{Style.RESET}"
-    elif action == "foreign_aid":
-        return f"{Fore.YELLOW}{text}{Style.RESET}"
-    elif action == "coup":
-        return f"{Back.RED}{text}{Style.RESET}"
-
-
-def colorize_card(card):
-    if card == "duke":
-        return f"{Fore.MAGENTA}{card}{Style.RESET}"
-    elif card == "captain":
-        return f"{Fore.BLUE}{card}{Style.RESET}"
-    elif card == "ambassador":
-        return f"{Fore.GREEN}{card}{Style.RESET}"
-    elif card == "assassin":
-        return f"{Fore.BLACK}{Back.WHITE}{card}{Style.RESET}"
-    elif card == "contessa":
-        return f"{Fore.RED}{card}{Style.RESET}"
-
-
-def colorize_amount(amount):
-    return f"{Fore.YELLOW}{amount}{Style.RESET}"
+
+class Palette:
+    """
+    Colors of the terminal output, ANSI colors or none at all for a
+    plain palette. Colorized cards, actions and amounts are built once
+    and looked up afterwards.
+    """
+
+    def __init__(self, colors=True):
+        self.colors = colors
+        self._cards = {}
+        self._actions = {}
+        self._amounts = {}
+
+    def style(self, style, text):
+        return f"{style}{text}{Style.RESET}" if self.colors else str(text)
+
+    def card(self, card):
+        text = self._cards.get(card)
+        if text is None:
+            text = self._cards[card] = self.style(CARD_STYLES.get(card, ""), card)
+        return text
+
+    def action(self, action, text=None):
+        # The action name, or the given text, in the color of the action
+        key = (action, text)
+        colored = self._actions.get(key)
+        if colored is None:
+            colored = self._actions[key] = self.style(ACTION_STYLES.get(action, ""), action if text is None else text)
+        return colored
+
+    def amount(self, amount):
+        text = self._amounts.get(amount)
+        if text is None:
+            text = self._amounts[amount] = self.style(Fore.YELLOW, amount)
+        return text
+
+
+PALETTES = {"ansi": Palette(colors=True), "plain": Palette(colors=False)}
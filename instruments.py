@@ -0,0 +1,144 @@
+import cProfile
+import pstats
+from collections import Counter
+from time import perf_counter
+from constants import COUP_RULES_CONFIG
+from events import BLOCK, CHALLENGE, EXCHANGE_RETURN, GAME_END, GAME_START, REVEAL, RETURN, ACTION, TURN
+
+# The phases of a turn, timed by GameController.play_turn and next_turn
+PHASES = ("choose_action", "challenge_or_block", "perform_action", "next_turn")
+ACTION_NAMES = tuple(COUP_RULES_CONFIG)
+
+
+class Instruments:
+    """
+    Phase timers and counters of the games of a controller, or of many.
+    Counters are kept from the events of the games, so an Instruments is
+    a controller listener and can count the events of a recorded log as
+    well. Timers are kept by the controller around each phase of a turn.
+    A controller without instruments pays one None check per phase.
+
+    Counted are the games, turns and actions chosen, the challenges and
+    how many succeeded, blocks, reveals, eliminations and reshuffles, a
+    reshuffle being any return of cards to the deck: a character shown
+    to win a challenge, or the cards given back by an exchange.
+
+    profile_games is a range of game numbers, counted from 0 in the
+    order the games start, played under cProfile.
+    """
+
+    def __init__(self, clock=perf_counter, profile_games=None):
+        self.clock = clock
+        self.phase_seconds = dict.fromkeys(PHASES, 0.0)
+        self.phase_calls = dict.fromkeys(PHASES, 0)
+        self.actions = Counter()
+        self.counts = Counter()
+        self.profile_games = profile_games
+        self.profiler = None
+        self._profiling = False
+        self._exchange_seat = None
+        self._seats = 0
+
+    def record(self, phase, start):
+        # Add the time since start to a phase, return the time now so phases can be chained
+        now = self.clock()
+        self.phase_seconds[phase] += now - start
+        self.phase_calls[phase] += 1
+        return now
+
+    def __call__(self, kind, seat, other, code, value):
+        counts = self.counts
+        if kind == ACTION:
+            self.actions[ACTION_NAMES[code]] += 1
+        elif kind == TURN:
+            counts["turns"] += 1
+            self._exchange_seat = None
+        elif kind == CHALLENGE:
+            counts["challenges"] += 1
+            counts["challenges_succeeded"] += value
+        elif kind == BLOCK:
+            counts["blocks"] += 1
+        elif kind == REVEAL:
+            counts["reveals"] += 1
+        elif kind == RETURN:
+            counts["reshuffles"] += 1
+        elif kind == EXCHANGE_RETURN:
+            # Both cards of an exchange go back in one reshuffle
+            if self._exchange_seat != seat:
+                counts["reshuffles"] += 1
+                self._exchange_seat = seat
+        elif kind == GAME_START:
+            self._start_game(counts["games"])
+            counts["games"] += 1
+            self._seats = seat
+        elif kind == GAME_END:
+            # Every seat but the winner's was eliminated
+            counts["eliminations"] += self._seats - 1
+            self._end_game()
+
+    def count_events(self, records):
+        # Count the events of (kind, seat, other, code, value) records, such as those of an EventLogReader
+        for record in records:
+            self(*record)
+
+    def _start_game(self, game):
+        if self.profile_games is not None and game in self.profile_games:
+            if self.profiler is None:
+                self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            self._profiling = True
+
+    def _end_game(self):
+        if self._profiling:
+            self.profiler.disable()
+            self._profiling = False
+
+    def profile_stats(self):
+        # pstats.Stats of the profiled games, None if no game was profiled
+        return pstats.Stats(self.profiler) if self.profiler is not None else None
+
+    def merge(self, other):
+        for phase in PHASES:
+            self.phase_seconds[phase] += other.phase_seconds[phase]
+            self.phase_calls[phase] += other.phase_calls[phase]
+        self.actions.update(other.actions)
+        self.counts.update(other.counts)
+        return self
+
+    def snapshot(self):
+        """
+        Return the timers and counters as a dict of plain values
+        """
+        return {
+            "phases": {
+                phase: {"seconds": self.phase_seconds[phase], "calls": self.phase_calls[phase]} for phase in PHASES
+            },
+            "actions": {action: self.actions[action] for action in ACTION_NAMES},
+            "counts": dict(self.counts),
+        }
+
+    def prometheus(self, prefix="coup"):
+        """
+        Return the timers and counters in the Prometheus text exposition format
+        """
+        lines = [
+            f"# HELP {prefix}_phase_seconds_total Seconds spent in each phase of a turn.",
+            f"# TYPE {prefix}_phase_seconds_total counter",
+        ]
+        lines += [f'{prefix}_phase_seconds_total{{phase="{phase}"}} {self.phase_seconds[phase]:.9f}' for phase in PHASES]
+        lines += [
+            f"# HELP {prefix}_phase_calls_total Times each phase of a turn ran.",
+            f"# TYPE {prefix}_phase_calls_total counter",
+        ]
+        lines += [f'{prefix}_phase_calls_total{{phase="{phase}"}} {self.phase_calls[phase]}' for phase in PHASES]
+        lines += [
+            f"# HELP {prefix}_actions_total Actions chosen, by action.",
+            f"# TYPE {prefix}_actions_total counter",
+        ]
+        lines += [f'{prefix}_actions_total{{action="{action}"}} {self.actions[action]}' for action in ACTION_NAMES]
+        for name in sorted(self.counts):
+            lines += [
+                f"# TYPE {prefix}_{name}_total counter",
+                f"{prefix}_{name}_total {self.counts[name]}",
+            ]
+        return "\n".join(lines) + "\n"
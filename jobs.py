@@ -0,0 +1,311 @@
+import argparse
+import json
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from constants import MAX_PLAYERS, MIN_PLAYERS
+from tournament import TournamentStats, play_games
+
+MANIFEST = "job.json"
+SHARDS = "shards"
+CLAIMS = "claims"
+# Seconds after which the claim of a worker of another host expires
+DEFAULT_LEASE = 3600
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def write_json(path, data):
+    # Write to a file of this worker first, so readers only ever see a whole file
+    partial = f"{path}.{socket.gethostname()}.{os.getpid()}.partial"
+    with open(partial, "w") as file:
+        json.dump(data, file, sort_keys=True)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(partial, path)
+
+
+def read_json(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+class Job:
+    """
+    A tournament of games games split into shards of shard_size games,
+    kept in a directory that its workers share, local processes or the
+    workers of other hosts mounting it. Every game is seeded from its
+    index like run_tournament, so a shard played twice gives the same
+    result and the merged statistics are the ones of a single run.
+
+    A worker claims a shard by creating its claim file, plays it, writes
+    its statistics atomically and drops the claim. Shards with statistics
+    are never played again, which resumes a job where it stopped. The
+    claim of a worker that died is taken over once its process is gone,
+    for workers of the same host, or once it is lease seconds old.
+    """
+
+    def __init__(self, directory, lease=DEFAULT_LEASE):
+        manifest = os.path.join(directory, MANIFEST)
+        if not os.path.exists(manifest):
+            raise FileNotFoundError(f"No job in {directory}, create it with --games.")
+        self.directory = directory
+        self.lease = lease
+        parameters = read_json(manifest)
+        self.games = parameters["games"]
+        self.players = parameters["players"]
+        self.seed = parameters["seed"]
+        self.shard_size = parameters["shard_size"]
+        self.shards = -(-self.games // self.shard_size)
+
+    @classmethod
+    def create(cls, directory, games, players=3, seed=0, shard_size=10000, lease=DEFAULT_LEASE):
+        """
+        Create the job, or open it when the directory already holds the
+        same one. A job of other parameters is never overwritten.
+        """
+        parameters = {"games": games, "players": players, "seed": seed, "shard_size": shard_size}
+        manifest = os.path.join(directory, MANIFEST)
+        os.makedirs(os.path.join(directory, SHARDS), exist_ok=True)
+        os.makedirs(os.path.join(directory, CLAIMS), exist_ok=True)
+        if os.path.exists(manifest):
+            if read_json(manifest) != parameters:
+                raise ValueError(f"{directory} holds a job of other parameters: {read_json(manifest)}")
+        else:
+            write_json(manifest, parameters)
+        return cls(directory, lease)
+
+    def shard_games(self, shard):
+        # Indexes of the first game of the shard and of the one after its last
+        first = shard * self.shard_size
+        return first, min(first + self.shard_size, self.games)
+
+    def result_path(self, shard):
+        return os.path.join(self.directory, SHARDS, f"{shard:08d}.json")
+
+    def claim_path(self, shard):
+        return os.path.join(self.directory, CLAIMS, f"{shard:08d}.claim")
+
+    def finished(self):
+        # Shards whose statistics were written
+        return {
+            int(name[:-5]) for name in os.listdir(os.path.join(self.directory, SHARDS))
+            if name.endswith(".json")
+        }
+
+    def claimed(self):
+        return {
+            int(name[:-6]) for name in os.listdir(os.path.join(self.directory, CLAIMS))
+            if name.endswith(".claim")
+        }
+
+    # Claims
+    def claim(self, shard, worker):
+        """
+        Return True when the worker got the shard. The claim is written to
+        a file of the worker then linked into place, which fails if the
+        shard is claimed, so a claim file is never seen without its worker.
+        An expired claim is dropped and the shard claimed again like a free
+        one, two workers may still both get it, which is only wasted work
+        since they write the same statistics.
+        """
+        path = self.claim_path(shard)
+        partial = f"{path}.{socket.gethostname()}.{os.getpid()}.partial"
+        with open(partial, "w") as file:
+            json.dump({"worker": worker, "time": time.time()}, file)
+        try:
+            os.link(partial, path)
+            return True
+        except FileExistsError:
+            if not self.expired(path):
+                return False
+            self.release(shard)
+            try:
+                os.link(partial, path)
+                return True
+            except FileExistsError:
+                return False
+        finally:
+            os.remove(partial)
+
+    def expired(self, path):
+        try:
+            claim = read_json(path)
+        except FileNotFoundError:
+            return True
+        except ValueError:
+            # Left unreadable by a worker that died, only the lease tells
+            try:
+                return time.time() - os.path.getmtime(path) > self.lease
+            except FileNotFoundError:
+                return True
+        host, pid = claim["worker"].rsplit(":", 1)
+        if host == socket.gethostname():
+            # A worker of this host holds its claim as long as its process runs
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                pass
+            return False
+        return time.time() - claim["time"] > self.lease
+
+    def release(self, shard):
+        try:
+            os.remove(self.claim_path(shard))
+        except FileNotFoundError:
+            pass
+
+    # Playing
+    def play(self, shard, worker):
+        """
+        Play the games of the shard and write their statistics with the
+        time they took. Return the result written.
+        """
+        first, last = self.shard_games(shard)
+        start = perf_counter()
+        stats = play_games(self.seed, first, last, self.players)
+        seconds = perf_counter() - start
+        result = {
+            "shard": shard,
+            "first_game": first,
+            "last_game": last,
+            "worker": worker,
+            "seconds": seconds,
+            "stats": stats.to_dict(),
+        }
+        write_json(self.result_path(shard), result)
+        self.release(shard)
+        return result
+
+    def work(self, log=print):
+        """
+        Play the shards left until there are none this worker can claim,
+        logging the throughput of each. Return the number of shards played.
+        """
+        worker = worker_name()
+        played = 0
+        finished = self.finished()
+        for shard in range(self.shards):
+            if shard in finished or os.path.exists(self.result_path(shard)) or not self.claim(shard, worker):
+                continue
+            if os.path.exists(self.result_path(shard)):
+                # Finished while the claim was being taken over
+                self.release(shard)
+                continue
+            result = self.play(shard, worker)
+            played += 1
+            if log is not None:
+                games = result["last_game"] - result["first_game"]
+                log(
+                    f"Shard {shard}: {games} games in {result['seconds']:.2f}s, "
+                    f"{games / result['seconds']:.1f} games/sec ({worker})"
+                )
+        return played
+
+    def merge(self):
+        """
+        Return the statistics of every finished shard merged, and the
+        shards still missing.
+        """
+        stats = TournamentStats()
+        finished = self.finished()
+        for shard in sorted(finished):
+            stats.merge(TournamentStats.from_dict(read_json(self.result_path(shard))["stats"]))
+        return stats, [shard for shard in range(self.shards) if shard not in finished]
+
+    def throughput(self):
+        # Games and seconds of play of every finished shard
+        games = seconds = 0
+        for shard in self.finished():
+            result = read_json(self.result_path(shard))
+            games += result["last_game"] - result["first_game"]
+            seconds += result["seconds"]
+        return games, seconds
+
+
+def work(directory, lease=DEFAULT_LEASE):
+    # Worker process entry point
+    return Job(directory, lease).work()
+
+
+def run_job(directory, workers=None, lease=DEFAULT_LEASE):
+    """
+    Play the shards left of a job over local worker processes.
+    Return the merged statistics and the shards still missing, claimed
+    by workers of other hosts.
+    """
+    job = Job(directory, lease)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        job.work()
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(work, directory, lease) for _ in range(workers)]:
+                future.result()
+    return job.merge()
+
+
+def print_stats(stats, missing):
+    if missing:
+        print(f"{len(missing)} shards missing, the statistics are partial")
+    print(f"{stats.games} games ({stats.turns} turns)")
+    for seat, rate in stats.win_rates().items():
+        print(f"  seat {seat}: {rate:.2%} wins, eliminated {stats.eliminations[seat]} times")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play a tournament as resumable shards shared by many workers")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="create or resume a job and play it with local workers")
+    run_parser.add_argument("directory")
+    run_parser.add_argument("--games", type=int, help="games of a new job")
+    run_parser.add_argument("--players", type=int, default=3, choices=range(MIN_PLAYERS, MAX_PLAYERS + 1))
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--shard-size", type=int, default=10000, help="games of each shard (default: 10000)")
+    run_parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    work_parser = commands.add_parser("work", help="play shards of a job as one worker, from any host sharing it")
+    work_parser.add_argument("directory")
+    for command in (run_parser, work_parser):
+        command.add_argument(
+            "--lease", type=float, default=DEFAULT_LEASE,
+            help=f"seconds before a shard claimed on another host is played again (default: {DEFAULT_LEASE})"
+        )
+    status_parser = commands.add_parser("status", help="show the progress of a job")
+    status_parser.add_argument("directory")
+    merge_parser = commands.add_parser("merge", help="print the statistics of the finished shards")
+    merge_parser.add_argument("directory")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        if args.games is not None:
+            Job.create(args.directory, args.games, args.players, args.seed, args.shard_size)
+        start = perf_counter()
+        stats, missing = run_job(args.directory, args.workers, args.lease)
+        print(f"Played for {perf_counter() - start:.2f}s")
+        print_stats(stats, missing)
+    elif args.command == "work":
+        played = Job(args.directory, args.lease).work()
+        print(f"Played {played} shards")
+    elif args.command == "status":
+        job = Job(args.directory)
+        finished = job.finished()
+        claimed = job.claimed() - finished
+        games, seconds = job.throughput()
+        print(
+            f"{len(finished)} of {job.shards} shards finished, {len(claimed)} claimed, "
+            f"{job.shards - len(finished) - len(claimed)} left"
+        )
+        if seconds:
+            print(f"{games} games in {seconds:.2f}s of play, {games / seconds:.1f} games/sec per worker")
+    else:
+        print_stats(*Job(args.directory).merge())
+
+
+if __name__ == "__main__":
+    main()
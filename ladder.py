@@ -0,0 +1,334 @@
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+from itertools import combinations
+from controller import GameController
+from game import ai_listeners, make_ai
+from simulation import MAX_TURNS, game_seed, play_game
+
+# Normal quantile of the two-sided 95% confidence intervals
+Z95 = 1.959963984540054
+# Elo points per natural log unit of the odds of winning
+ELO_PER_LOGIT = 400 / math.log(10)
+# Scores of a pair of games, by the half points won by the first strategy, an unfinished game is a draw
+PAIR_SCORES = (0, 0.25, 0.5, 0.75, 1)
+# Weight of a pair score never seen, so the variance of the first pairs is not 0
+UNSEEN_WEIGHT = 1e-3
+
+
+def expected_score(elo):
+    # Chances of winning of a strategy rated elo points above its opponent
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo_difference(score):
+    # Elo points a score is worth, infinite for a score of 0 or 1
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+def pair_statistics(pairs):
+    # Mean and variance of the pair scores, pairs counting the pairs of each score
+    count = sum(pairs)
+    mean = sum(score * number for score, number in zip(PAIR_SCORES, pairs)) / count
+    return mean, sum(number * (score - mean) ** 2 for score, number in zip(PAIR_SCORES, pairs)) / count
+
+
+def make_strategy(spec, budget=0.05):
+    """
+    A strategy from its name in game.make_ai, or module:attribute for any
+    other strategy class or factory, called without arguments.
+    """
+    if ":" in spec:
+        module, attribute = spec.split(":", 1)
+        return getattr(import_module(module), attribute)()
+    return make_ai(spec, budget)
+
+
+class SPRT:
+    """
+    Sequential probability ratio test of the score of a strategy, between
+    an Elo difference to its opponent of elo0 and one of elo1. The two
+    games of a pair share their seed, so each pair is one trial scored as
+    in PAIR_SCORES, and the log likelihood ratio is the one of normally
+    distributed pair scores with the variance measured so far.
+    alpha and beta are the chances of accepting elo1 when elo0 holds and
+    elo0 when elo1 holds.
+    """
+
+    def __init__(self, elo0=0, elo1=30, alpha=0.05, beta=0.05):
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.score0 = expected_score(elo0)
+        self.score1 = expected_score(elo1)
+        self.upper = math.log((1 - beta) / alpha)
+        self.lower = math.log(beta / (1 - alpha))
+
+    def llr(self, pairs):
+        # pairs counts the pairs of each score of PAIR_SCORES
+        mean, variance = pair_statistics([number or UNSEEN_WEIGHT for number in pairs])
+        score0, score1 = self.score0, self.score1
+        return sum(pairs) * (score1 - score0) * (2 * mean - score0 - score1) / (2 * variance)
+
+    def verdict(self, pairs):
+        # 1 when elo1 is accepted, -1 when elo0 is, 0 to keep playing
+        llr = self.llr(pairs)
+        if llr >= self.upper:
+            return 1
+        if llr <= self.lower:
+            return -1
+        return 0
+
+
+class Pairing:
+    """
+    Games won by each side of a pairing and the pairs of games of each
+    score of the first strategy. Two tests of the first strategy
+    against an Elo difference of 0 run side by side, one for the first
+    strategy being elo stronger and one for it being elo weaker, the
+    verdict is known once either finds its strategy stronger or both find
+    the difference smaller than elo.
+    """
+
+    def __init__(self, first, second, elo=30, alpha=0.05, beta=0.05):
+        self.first = first
+        self.second = second
+        self.tests = (SPRT(0, elo, alpha, beta), SPRT(0, -elo, alpha, beta))
+        self.wins = 0
+        self.losses = 0
+        self.pairs = [0] * len(PAIR_SCORES)
+        # Verdicts of the tests, kept once reached
+        self.results = [0, 0]
+
+    def add(self, wins, losses, pairs):
+        self.wins += wins
+        self.losses += losses
+        self.pairs = [number + added for number, added in zip(self.pairs, pairs)]
+        for position, test in enumerate(self.tests):
+            if not self.results[position]:
+                self.results[position] = test.verdict(self.pairs)
+
+    @property
+    def verdict(self):
+        # 1 when the first strategy is stronger, -1 when the second one is, 0 when it is not known
+        if self.results[0] == 1:
+            return 1
+        if self.results[1] == 1:
+            return -1
+        return 0
+
+    @property
+    def decided(self):
+        return self.verdict != 0 or self.results == [-1, -1]
+
+    @property
+    def games(self):
+        # Unfinished games included
+        return 2 * sum(self.pairs)
+
+    def elo_interval(self):
+        # Elo difference of the first strategy and its 95% confidence interval, from the scores of the pairs
+        score, variance = pair_statistics(self.pairs)
+        margin = Z95 * math.sqrt(variance / sum(self.pairs))
+        return elo_difference(score), elo_difference(score - margin), elo_difference(score + margin)
+
+
+def seatings(seats):
+    # The seats of the first strategy in the two games of a pair, the second one takes the others
+    first = [seat for seat in range(seats) if seat % 2 == 0]
+    return first, [seat for seat in range(seats) if seat % 2 == 1]
+
+
+def play_pairs(first, second, seats, base_seed, first_pair, last_pair, budget):
+    """
+    Worker entry point, plays the pairs of games first_pair..last_pair - 1
+    of two strategies. Both games of a pair have the same seed with the
+    strategies in each other's seats, which cancels most of the advantage
+    of a seat. Return (games won by first, games won by second, pairs)
+    where pairs counts the pairs of each score of PAIR_SCORES.
+    """
+    strategies = (make_strategy(first, budget), make_strategy(second, budget))
+    listeners = ai_listeners(strategies[0]) + ai_listeners(strategies[1])
+    wins = [0, 0]
+    pairs = [0] * len(PAIR_SCORES)
+    controller = GameController(headless=True, number_of_seats=seats, listeners=listeners)
+    for pair in range(first_pair, last_pair):
+        seed = game_seed(base_seed, pair)
+        # Half points of the first strategy
+        points = 0
+        for first_seats in seatings(seats):
+            controller.reset(seed)
+            for player in controller.players:
+                player.ai = strategies[0 if player.seat in first_seats else 1]
+            winner, _ = play_game(controller, MAX_TURNS)
+            if winner is None:
+                points += 1
+            elif winner.seat in first_seats:
+                wins[0] += 1
+                points += 2
+            else:
+                wins[1] += 1
+        pairs[points] += 1
+    return wins[0], wins[1], pairs
+
+
+class Ladder:
+    """
+    Rate strategies by playing every pair of them against each other,
+    round robin, until sequential tests tell which of the two is stronger
+    or that they are less than elo apart, or max_games games were played. Games are played by pairs
+    with swapped seatings, pairs_per_batch pairs per worker between two
+    looks at the test. Strategies are given as for make_strategy and
+    the games of a pairing are seeded from seed and their names.
+    """
+
+    def __init__(
+        self, strategies, seats=2, elo=30, alpha=0.05, beta=0.05, max_games=10000, seed=0, workers=1, pairs_per_batch=10,
+        budget=0.05
+    ):
+        if len(set(strategies)) < 2:
+            raise ValueError("A ladder needs at least 2 strategies.")
+        self.strategies = list(strategies)
+        self.seats = seats
+        self.max_games = max_games
+        self.seed = seed
+        self.workers = workers or os.cpu_count() or 1
+        self.pairs_per_batch = pairs_per_batch
+        self.budget = budget
+        self.pairings = [
+            Pairing(first, second, elo, alpha, beta) for first, second in combinations(self.strategies, 2)
+        ]
+
+    def run(self, progress=None):
+        # Play every pairing to its verdict, progress is called with each pairing decided
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        try:
+            for pairing in self.pairings:
+                self.play(pairing, executor)
+                if progress is not None:
+                    progress(pairing)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return self
+
+    def play(self, pairing, executor):
+        base_seed = f"{self.seed}:{pairing.first}:{pairing.second}"
+        max_pairs = (self.max_games + 1) // 2
+        pair = 0
+        while not pairing.decided and pair < max_pairs:
+            ranges = []
+            for _ in range(self.workers):
+                last = min(pair + self.pairs_per_batch, max_pairs)
+                if last > pair:
+                    ranges.append((pair, last))
+                pair = last
+            arguments = [
+                (pairing.first, pairing.second, self.seats, base_seed, first, last, self.budget) for first, last in ranges
+            ]
+            if executor is None:
+                results = [play_pairs(*argument) for argument in arguments]
+            else:
+                results = [future.result() for future in [executor.submit(play_pairs, *argument) for argument in arguments]]
+            for wins, losses, pairs in results:
+                pairing.add(wins, losses, pairs)
+
+    def ratings(self, iterations=1000):
+        """
+        Return {strategy: (elo, margin)} fitted to the results of every
+        pairing with a Bradley-Terry model, the mean rating being 0 and
+        margin the half width of a 95% confidence interval. Each strategy
+        gets a virtual win and loss against an average opponent, so one
+        that never lost still gets a finite rating.
+        """
+        index = {strategy: position for position, strategy in enumerate(self.strategies)}
+        count = len(self.strategies)
+        wins = [[0] * count for _ in range(count)]
+        for pairing in self.pairings:
+            first, second = index[pairing.first], index[pairing.second]
+            wins[first][second] += pairing.wins
+            wins[second][first] += pairing.losses
+        strengths = [1.0] * count
+        for _ in range(iterations):
+            updated = []
+            for i in range(count):
+                won = sum(wins[i]) + 1
+                # The virtual opponent has a strength of 1
+                weight = 2 / (strengths[i] + 1)
+                weight += sum(
+                    (wins[i][j] + wins[j][i]) / (strengths[i] + strengths[j]) for j in range(count) if j != i
+                )
+                updated.append(won / weight)
+            mean = math.exp(sum(math.log(strength) for strength in updated) / count)
+            updated = [strength / mean for strength in updated]
+            converged = max(abs(math.log(new / old)) for new, old in zip(updated, strengths)) < 1e-10
+            strengths = updated
+            if converged:
+                break
+        ratings = {}
+        for i, strategy in enumerate(self.strategies):
+            virtual = strengths[i] / (strengths[i] + 1)
+            information = 2 * virtual * (1 - virtual)
+            for j in range(count):
+                if j != i:
+                    score = strengths[i] / (strengths[i] + strengths[j])
+                    information += (wins[i][j] + wins[j][i]) * score * (1 - score)
+            ratings[strategy] = (ELO_PER_LOGIT * math.log(strengths[i]), Z95 * ELO_PER_LOGIT / math.sqrt(information))
+        return ratings
+
+
+def format_elo(elo):
+    return f"{elo:+.0f}" if math.isfinite(elo) else ("+inf" if elo > 0 else "-inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate AI strategies against each other with early stopping.")
+    parser.add_argument(
+        "strategies", nargs="+",
+        help="strategies to rate: random, beliefs, mcts, endgame or module:attribute of a strategy"
+    )
+    parser.add_argument("--seats", type=int, default=2, help="seats of each game, shared by the two strategies (default: 2)")
+    parser.add_argument("--elo", type=float, default=30, help="Elo difference the test tells apart (default: 30)")
+    parser.add_argument(
+        "--alpha", type=float, default=0.05, help="chances of finding a difference where there is none (default: 0.05)"
+    )
+    parser.add_argument(
+        "--beta", type=float, default=0.05, help="chances of missing a difference of --elo (default: 0.05)"
+    )
+    parser.add_argument("--max-games", type=int, default=10000, help="games of a pairing without a verdict (default: 10000)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes, 0 for all cores (default: 1)")
+    parser.add_argument("--budget", type=float, default=0.05, help="seconds an mcts AI searches per decision (default: 0.05)")
+    args = parser.parse_args()
+
+    ladder = Ladder(
+        args.strategies, args.seats, args.elo, args.alpha, args.beta, args.max_games, args.seed, args.workers,
+        budget=args.budget
+    )
+
+    def progress(pairing):
+        elo, low, high = pairing.elo_interval()
+        if pairing.verdict:
+            verdict = f"{pairing.first if pairing.verdict == 1 else pairing.second} stronger"
+        else:
+            verdict = f"less than {args.elo:g} Elo apart" if pairing.decided else "no verdict"
+        print(
+            f"{pairing.first} vs {pairing.second}: {pairing.wins}-{pairing.losses} in {pairing.games} games, "
+            f"{format_elo(elo)} Elo [{format_elo(low)}, {format_elo(high)}], {verdict}"
+        )
+
+    ladder.run(progress)
+    played = sum(pairing.games for pairing in ladder.pairings)
+    budgeted = len(ladder.pairings) * 2 * ((args.max_games + 1) // 2)
+    print(f"{played} games played, {played / budgeted:.0%} of the {budgeted} without early stopping")
+    for strategy, (elo, margin) in sorted(ladder.ratings().items(), key=lambda item: -item[1][0]):
+        print(f"{strategy:>12} {elo:+7.1f} ± {margin:.1f}")
+
+
+if __name__ == "__main__":
+    main()
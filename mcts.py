@@ -0,0 +1,391 @@
+import math
+import random
+from itertools import combinations
+from time import perf_counter
+from ai import RandomAI
+from controller import GameController
+from constants import COUP_RULES_CONFIG
+from deals import DealSampler, dealt_seats
+from state import CARD_CODES
+
+# A rollout still running after this many turns counts as a loss for everyone
+MAX_ROLLOUT_TURNS = 500
+# Deals sampled at once for the iterations of a search
+SAMPLE_BATCH = 256
+
+
+def determinize(state, seat, rng, deal=None):
+    """
+    Return a copy of the state where the cards the seat cannot see,
+    the other hands and the deck, are dealt again: as in deal, a hand for
+    each seat of deals.dealt_seats drawn by a DealSampler, or at random.
+    """
+    state = state.clone(rng)
+    seats = dealt_seats(state, seat)
+    hand_sizes = []
+    for other in seats:
+        hand = state.hand(other)
+        hand_sizes.append((other, len(hand)))
+        for code in hand:
+            state.return_card(code)
+    if deal is None:
+        for other, size in hand_sizes:
+            state.set_hand(other, [state.draw_card() for _ in range(size)])
+        return state
+    for other, hand in zip(seats, deal):
+        for code in hand:
+            state.take_from_deck(code)
+        state.set_hand(other, hand)
+    return state
+
+
+def rollout(game):
+    """
+    Finish a game whose current turn is over.
+    Return the seat of the winner, or None if the game runs too long.
+    """
+    for _ in range(MAX_ROLLOUT_TURNS):
+        if game.is_game_over():
+            return game.get_winner().seat
+        game.next_turn()
+        game.play_turn()
+    return None
+
+
+class Node:
+    """
+    Statistics of one information set: for every move seen there,
+    [visits, wins of the seat deciding, times the move was available].
+    """
+
+    __slots__ = ("seat", "moves")
+
+    def __init__(self, seat):
+        self.seat = seat
+        self.moves = {}
+
+
+class TreeWalker(RandomAI):
+    """
+    Strategy of every seat of the simulated games of a search.
+    While a decision is found in the search table it is selected by UCB,
+    the first decision missing from it is added and the rest of the game
+    is played at random.
+    """
+
+    def __init__(self, search):
+        self.search = search
+        self.path = []
+        self.in_tree = True
+        self.targets = {}
+
+    def start(self):
+        self.path = []
+        self.in_tree = True
+
+    def decide(self, key, seat, moves, rng):
+        table = self.search.table
+        node = table.get(key)
+        if node is None:
+            node = table[key] = Node(seat)
+        move, expanded = self.search.select(node, moves, rng)
+        self.path.append((node, move))
+        if expanded:
+            self.in_tree = False
+        return move
+
+    def backpropagate(self, winner):
+        for node, move in self.path:
+            entry = node.moves[move]
+            entry[0] += 1
+            if node.seat == winner:
+                entry[1] += 1
+
+    def choose_action(self, controller, player, options):
+        if not self.in_tree:
+            return super().choose_action(controller, player, options)
+        key = (player.state.information_hash(player.seat), "action", ())
+        action, target, _ = self.decide(key, player.seat, action_moves(controller, player), player.rng)
+        self.targets[player.seat] = target
+        return action
+
+    def choose_target(self, controller, player, action, targets):
+        seat = self.targets.pop(player.seat, None)
+        if seat is None:
+            return super().choose_target(controller, player, action, targets)
+        return controller.players[seat]
+
+    def decide_to_challenge(self, controller, player, challenged, action, target=None, claimed_card=None):
+        if not self.in_tree:
+            return super().decide_to_challenge(controller, player, challenged, action, target, claimed_card)
+        key = (player.state.information_hash(player.seat), *challenge_context(challenged, action, target, claimed_card))
+        return self.decide(key, player.seat, (True, False), player.rng)
+
+    def decide_to_block(self, controller, player, blocked_player, action, target=None):
+        if not self.in_tree:
+            return super().decide_to_block(controller, player, blocked_player, action, target)
+        key = (player.state.information_hash(player.seat), *block_context(blocked_player, action, target))
+        return self.decide(key, player.seat, (True, False), player.rng)
+
+    def choose_card_to_reveal(self, player):
+        if not self.in_tree:
+            return super().choose_card_to_reveal(player)
+        cards = player.cards
+        key = (player.state.information_hash(player.seat), "reveal", ())
+        return cards.index(self.decide(key, player.seat, sorted(set(cards)), player.rng))
+
+    def choose_cards_to_keep(self, controller, player, cards):
+        if not self.in_tree:
+            return super().choose_cards_to_keep(controller, player, cards)
+        key = (player.state.information_hash(player.seat), "exchange", tuple(sorted(cards)))
+        return list(self.decide(key, player.seat, keep_moves(cards, len(player.cards)), player.rng))
+
+
+def action_moves(controller, player):
+    # Every (action, target seat, claim) the player can play
+    return controller.moves.moves(player.coins, player.seat, controller.state.alive_mask())
+
+
+def keep_moves(cards, number_to_keep):
+    return sorted(set(combinations(sorted(cards), number_to_keep)))
+
+
+def challenge_context(challenged, action, target, claimed_card):
+    kind = "challenge" if claimed_card is None else "block_challenge"
+    return kind, (challenged.seat, action, target.seat if target else None, claimed_card)
+
+
+def block_context(blocked_player, action, target):
+    return "block", (blocked_player.seat, action, target.seat if target else None)
+
+
+def responders_after(game, actor, seat):
+    # The players asked to respond after the given seat
+    return [player for player in game.get_other_players(actor) if player.seat > seat]
+
+
+def perform_unless_stopped(game, action, actor, target, performed):
+    if performed:
+        game.perform_action(action, actor, target)
+
+
+class ISMCTSAI(RandomAI):
+    """
+    Information set Monte Carlo tree search.
+    Every search iteration deals the cards the AI cannot see again at
+    random, plays the decision being searched and finishes the game with
+    the TreeWalker strategy for every seat.
+    Tree nodes are keyed by the hash of what the deciding seat can see and
+    the decision being taken, so the table is also a transposition table
+    and the nodes below a decision are reused by the next decisions.
+    A search stops after time_budget seconds or the given number of
+    iterations, whichever comes first.
+    With beliefs, a beliefs.Beliefs listening to the game, only the hands
+    the seat believes possible are dealt to the other seats.
+    The search of the last decision is described by last_search.
+    """
+
+    def __init__(
+        self, time_budget=0.1, iterations=None, exploration=0.7, max_table_size=200000, seed=None, beliefs=None
+    ):
+        if not time_budget and not iterations:
+            raise ValueError("The search needs a time budget or a number of iterations")
+        self.time_budget = time_budget
+        self.iterations = iterations
+        self.exploration = exploration
+        self.max_table_size = max_table_size
+        self.rng = random.Random(seed)
+        self.beliefs = beliefs
+        self.table = {}
+        self.targets = {}
+        self.last_search = None
+        self.decisions = 0
+        self.total_iterations = 0
+        self.total_seconds = 0.0
+
+    def select(self, node, moves, rng):
+        """
+        Return the move to play at the node and whether it was never tried
+        """
+        stats = node.moves
+        untried = []
+        for move in moves:
+            entry = stats.get(move)
+            if entry is None:
+                entry = stats[move] = [0, 0, 0]
+            entry[2] += 1
+            if entry[0] == 0:
+                untried.append(move)
+        if untried:
+            return rng.choice(untried), True
+
+        exploration = self.exploration
+
+        def upper_bound(move):
+            visits, wins, available = stats[move]
+            return wins / visits + exploration * math.sqrt(math.log(available) / visits)
+        return max(moves, key=upper_bound), False
+
+    def search(self, state, seat, key, moves, play):
+        """
+        Search the decision of the seat between moves.
+        play(game, move) plays a move in a simulated game and the rest of the turn.
+        """
+        if len(moves) == 1:
+            return moves[0]
+        if len(self.table) > self.max_table_size:
+            self.table.clear()
+
+        walker = TreeWalker(self)
+        deals = self.deals(state, seat)
+        start = perf_counter()
+        deadline = start + self.time_budget if self.time_budget else None
+        iterations = 0
+        while True:
+            if self.iterations and iterations >= self.iterations:
+                break
+            if deadline and iterations and perf_counter() >= deadline:
+                break
+            rng = random.Random(self.rng.getrandbits(64))
+            game = GameController(headless=True, state=determinize(state, seat, rng, next(deals)), rng=rng, ai=walker)
+            walker.start()
+            move = walker.decide(key, seat, moves, rng)
+            play(game, move)
+            walker.backpropagate(rollout(game))
+            iterations += 1
+
+        elapsed = perf_counter() - start
+        self.decisions += 1
+        self.total_iterations += iterations
+        self.total_seconds += elapsed
+        root = self.table[key].moves
+        self.last_search = {
+            "decision": key[1],
+            "iterations": iterations,
+            "seconds": elapsed,
+            "time_budget": self.time_budget,
+            "iteration_budget": self.iterations,
+            "rollouts_per_second": iterations / elapsed if elapsed else 0.0,
+            "tree_size": len(self.table),
+        }
+        return max(moves, key=lambda move: root[move][0])
+
+    def deals(self, state, seat):
+        # Deals of the hidden cards for the iterations of a search, sampled by batches
+        sampler = DealSampler.for_state(state, seat, self.allowed_hands(state, seat))
+        if not sampler.total:
+            # Beliefs of different seats can rule out every deal together
+            sampler = DealSampler.for_state(state, seat)
+        # Searches cut short by the time budget only use a few, batches grow as they are used up
+        batch = 8
+        while True:
+            yield from sampler.sample(batch, self.rng)
+            batch = min(batch * 2, SAMPLE_BATCH)
+
+    def allowed_hands(self, state, seat):
+        # The hands the seat believes each other seat may hold, None without beliefs
+        if self.beliefs is None:
+            return None
+        tracker = self.beliefs.tracker(seat)
+        return {
+            other: [hand for hand, _ in tracker.hands(other)]
+            for other in dealt_seats(state, seat)
+            if tracker.sizes[other] == state.hand_size(other)
+        }
+
+    def report(self):
+        rate = self.total_iterations / self.total_seconds if self.total_seconds else 0.0
+        return (
+            f"{self.decisions} decisions searched, {self.total_iterations} rollouts "
+            f"({rate:.0f}/sec), {len(self.table)} nodes in the tree"
+        )
+
+    # Strategy
+    def choose_action(self, controller, player, options):
+        seat = player.seat
+        key = (controller.state.information_hash(seat), "action", ())
+
+        def play(game, move):
+            action, target_seat, _ = move
+            actor = game.players[seat]
+            target = game.players[target_seat] if target_seat is not None else None
+            perform_unless_stopped(game, action, actor, target, game.challenge_or_block(action, actor, target))
+
+        action, target, _ = self.search(controller.state, seat, key, action_moves(controller, player), play)
+        self.targets[seat] = target
+        return action
+
+    def choose_target(self, controller, player, action, targets):
+        seat = self.targets.pop(player.seat, None)
+        if seat is None:
+            return super().choose_target(controller, player, action, targets)
+        return controller.players[seat]
+
+    def decide_to_challenge(self, controller, player, challenged, action, target=None, claimed_card=None):
+        seat = player.seat
+        key = (controller.state.information_hash(seat), *challenge_context(challenged, action, target, claimed_card))
+        target_seat = target.seat if target else None
+
+        def play(game, challenge):
+            me = game.players[seat]
+            other = game.players[challenged.seat]
+            target = game.players[target_seat] if target_seat is not None else None
+            if claimed_card is not None:
+                # Challenging a block, the action only goes on if the blocker was bluffing
+                if challenge and game.handle_challenge(me, other, action, claimed_card):
+                    game.perform_action(action, me, target)
+                return
+            if challenge:
+                performed = not game.handle_challenge(me, other, action)
+            elif COUP_RULES_CONFIG[action]["blocked_by"] and game.ask_block(me, other, action, target):
+                performed = not game.handle_block(me, other, action, target)
+            else:
+                performed = game.challenge_or_block(action, other, target, responders_after(game, other, seat))
+            perform_unless_stopped(game, action, other, target, performed)
+
+        return self.search(controller.state, seat, key, (True, False), play)
+
+    def decide_to_block(self, controller, player, blocked_player, action, target=None):
+        seat = player.seat
+        key = (controller.state.information_hash(seat), *block_context(blocked_player, action, target))
+        target_seat = target.seat if target else None
+
+        def play(game, block):
+            me = game.players[seat]
+            actor = game.players[blocked_player.seat]
+            target = game.players[target_seat] if target_seat is not None else None
+            if block:
+                performed = not game.handle_block(me, actor, action, target)
+            else:
+                performed = game.challenge_or_block(action, actor, target, responders_after(game, actor, seat))
+            perform_unless_stopped(game, action, actor, target, performed)
+
+        return self.search(controller.state, seat, key, (True, False), play)
+
+    def choose_card_to_reveal(self, player):
+        # The search plays on from the next turn, what is left of this turn is not simulated
+        seat = player.seat
+        cards = player.cards
+        key = (player.state.information_hash(seat), "reveal", ())
+
+        def play(game, card):
+            game.state.reveal_card(seat, game.players[seat].cards.index(card))
+
+        card = self.search(player.state, seat, key, sorted(set(cards)), play)
+        return cards.index(card)
+
+    def choose_cards_to_keep(self, controller, player, cards):
+        # An exchange ends the turn, so the search plays on from the next turn
+        seat = player.seat
+        key = (controller.state.information_hash(seat), "exchange", tuple(sorted(cards)))
+
+        def play(game, keep):
+            state = game.state
+            state.set_hand(seat, [CARD_CODES[card] for card in keep])
+            returned = list(cards)
+            for card in keep:
+                returned.remove(card)
+            for card in returned:
+                state.return_card(CARD_CODES[card])
+
+        return list(self.search(controller.state, seat, key, keep_moves(cards, len(player.cards)), play))
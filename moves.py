@@ -0,0 +1,137 @@
+from constants import COUP_RULES_CONFIG, MAX_COINS_FOR_COUP, MAX_PLAYERS, TARGETED_ACTIONS
+
+# Kinds of responses to an action or to a block
+PASS = "pass"
+CHALLENGE = "challenge"
+BLOCK = "block"
+
+
+class MoveGenerator:
+    """
+    Legal moves of a rule set for a number of seats, read from tables built once.
+    A move is an (action, target seat, claimed character) tuple, target and
+    claim being None when the action has none. Any player may claim any
+    character, bluffs included, so the moves only depend on the coins of the
+    player and on which seats are still alive, given as a bitmask.
+    Every call returns tuples shared between calls, nothing is allocated
+    once a table entry exists. Tables of small games are built upfront,
+    those of the other standard tables are filled as they are used, one
+    entry per set of seats alive, actor and set of legal actions. Bigger
+    variants would grow them with every game played, their targets and
+    moves are built on each call instead.
+    """
+
+    # Largest number of seats whose tables are built upfront
+    EAGER_SEATS = 6
+    # Largest number of seats whose tables are kept, every table of the standard game
+    CACHED_SEATS = MAX_PLAYERS + 3
+    _cache = {}
+
+    def __init__(self, seats, rules=COUP_RULES_CONFIG):
+        self.seats = seats
+        self.rules = rules
+        self.actions = tuple(rules)
+        self.blockable_actions = tuple(action for action in self.actions if rules[action]["blocked_by"])
+        # Nobody can hold more coins than a forced coup plus the biggest income
+        self.max_coins = MAX_COINS_FOR_COUP + max(rule["income"] for rule in rules.values())
+
+        self._actions_by_coins = tuple(self._build_legal_actions(coins) for coins in range(self.max_coins + 1))
+        # The moves only change with the coins when the legal actions do
+        levels = list(dict.fromkeys(self._actions_by_coins))
+        self._levels = len(levels)
+        self._level_by_coins = tuple(levels.index(legal) for legal in self._actions_by_coins)
+        self._action_masks = tuple(
+            tuple(action in legal for action in self.actions) for legal in self._actions_by_coins
+        )
+        self._responses = {action: self._build_responses(action) for action in self.actions}
+        self._block_responses = {
+            (action, character): ((PASS, None), (CHALLENGE, character))
+            for action in self.blockable_actions
+            for character in rules[action]["blocked_by"]
+        }
+        self._targets = {}
+        self._moves = {}
+        # Every (action, target, claim) tuple, shared by the moves of every entry
+        self._move_tuples = {}
+        self.cached = seats <= self.CACHED_SEATS
+        if seats <= self.EAGER_SEATS:
+            first_coins = [self._level_by_coins.index(level) for level in range(self._levels)]
+            for alive_mask in range(1 << seats):
+                for actor in range(seats):
+                    for coins in first_coins:
+                        self.moves(coins, actor, alive_mask)
+
+    @classmethod
+    def for_game(cls, seats, rules=COUP_RULES_CONFIG):
+        key = (seats, id(rules))
+        if key not in cls._cache:
+            cls._cache[key] = cls(seats, rules)
+        return cls._cache[key]
+
+    def _build_legal_actions(self, coins):
+        if coins >= MAX_COINS_FOR_COUP:
+            return ("coup",)
+        return tuple(action for action in self.actions if coins >= self.rules[action]["cost"])
+
+    def _build_responses(self, action):
+        rule = self.rules[action]
+        responses = [(PASS, None)]
+        if rule["can_be_challenged"]:
+            responses.append((CHALLENGE, rule["performed_by"]))
+        responses.extend((BLOCK, character) for character in rule["blocked_by"])
+        return tuple(responses)
+
+    def legal_actions(self, coins):
+        return self._actions_by_coins[min(coins, self.max_coins)]
+
+    def action_mask(self, coins):
+        # One boolean per action of the rule set, in rule set order
+        return self._action_masks[min(coins, self.max_coins)]
+
+    def targets(self, actor, alive_mask):
+        # Seats alive other than the actor, in seat order
+        key = alive_mask * self.seats + actor
+        targets = self._targets.get(key)
+        if targets is None:
+            targets = tuple(seat for seat in range(self.seats) if seat != actor and alive_mask >> seat & 1)
+            if self.cached:
+                self._targets[key] = targets
+        return targets
+
+    def moves(self, coins, actor, alive_mask):
+        """
+        Return every legal (action, target, claimed character) of the actor
+        """
+        coins = min(coins, self.max_coins)
+        key = (alive_mask * self.seats + actor) * self._levels + self._level_by_coins[coins]
+        moves = self._moves.get(key)
+        if moves is None:
+            moves = []
+            targets = self.targets(actor, alive_mask)
+            for action in self._actions_by_coins[coins]:
+                if action in TARGETED_ACTIONS:
+                    moves.extend(self._move(action, target) for target in targets)
+                else:
+                    moves.append(self._move(action, None))
+            moves = tuple(moves)
+            if self.cached:
+                self._moves[key] = moves
+        return moves
+
+    def _move(self, action, target):
+        move = self._move_tuples.get((action, target))
+        if move is None:
+            move = self._move_tuples[(action, target)] = (action, target, self.rules[action]["performed_by"])
+        return move
+
+    def responses(self, action):
+        """
+        Return the legal (kind, claimed character) responses of another player
+        to an action: pass, challenge the actor's claim, or block claiming
+        one of the blocking characters.
+        """
+        return self._responses[action]
+
+    def block_responses(self, action, claimed_character):
+        # The actor may let a block stand or challenge the blocker's claim
+        return self._block_responses[(action, claimed_character)]
@@ -1,36 +1,74 @@
 import random
 from time import sleep
 from views import PlayerView
+from ai import RandomAI
+from constants import CHARACTERS
+from state import CARD_CODES, EMPTY, HAND_SIZE, GameState
 
 
 class Player:
-    def __init__(self, name, is_ai, cards=None):
+    """
+    A seat of a game. Coins and cards are read from and written to
+    the GameState of the game, a player without a game gets a
+    one seat state of its own.
+    """
+
+    def __init__(self, name, is_ai, cards=None, view=None, ai=None, rng=None, ai_delay=1, sleep=sleep, state=None, seat=0):
         self.name = name
         self.is_ai = is_ai
-        self.coins = 2
-        self.cards = cards if cards is not None else []
-        self.revealed = []
-        self.view = PlayerView()
+        # Strategy taking the decisions of an AI player
+        self.ai = ai if ai is not None or not is_ai else RandomAI()
+        self.rng = rng if rng is not None else random.Random()
+        self.state = state if state is not None else GameState(1, self.rng, copies=0)
+        self.seat = seat
+        for card in cards or []:
+            self.state.give_card(seat, CARD_CODES[card])
+        self.view = view if view is not None else PlayerView()
+        # Pacing of the AI, a headless game uses no delay at all
+        self.ai_delay = ai_delay
+        self.sleep = sleep
+
+    @property
+    def coins(self):
+        return self.state.coins[self.seat]
+
+    @coins.setter
+    def coins(self, coins):
+        self.state.set_coins(self.seat, coins)
+
+    @property
+    def cards(self):
+        return [CHARACTERS[code] for code in self.state.hand(self.seat)]
+
+    @property
+    def revealed(self):
+        return [CHARACTERS[code] for code in self.state.revealed_cards(self.seat)]
 
     def reveal_card(self):
+        # Reveal a card chosen by the player and return it
         if self.is_eliminated:
             raise Exception("Player has no more cards to reveal and is already eliminated.")
 
         # Choose a card to reveal
         card_index = 0
+        number_of_cards = self.state.hand_size(self.seat)
         if self.is_ai:
             self.view.print_ai_thinking_reveal(self)
-            sleep(1)
-            card_index = random.choice([0, 1]) if len(self.cards) > 1 else 0
-        elif len(self.cards) > 1:
+            self.ai_pause()
+            card_index = self.ai.choose_card_to_reveal(self)
+        elif number_of_cards > 1:
             card_index = self.view.get_card_to_reveal(self)
 
-        revealed_card = self.cards.pop(card_index)
-        self.revealed.append(revealed_card)
+        revealed_card = CHARACTERS[self.state.reveal_card(self.seat, card_index)]
         self.view.display_player_revealed_card(self.name, revealed_card)
 
         # Check if the player is eliminated
         self.check_elimination()
+        return revealed_card
+
+    def ai_pause(self):
+        if self.ai_delay:
+            self.sleep(self.ai_delay)
 
     def check_elimination(self):
         if self.is_eliminated:
@@ -38,4 +76,5 @@ class Player:
 
     @property
     def is_eliminated(self):
-        return len(self.cards) == 0
+        # Inlined GameState.is_eliminated, this is checked for every seat every turn
+        return self.state.hidden[self.seat * HAND_SIZE] == EMPTY
@@ -0,0 +1,360 @@
+import argparse
+import bisect
+import mmap
+import os
+import random
+import struct
+from controller import GameController
+from event_log import EventLogReader
+from events import (
+    BLOCK,
+    CHALLENGE,
+    COINS,
+    DEAL,
+    EXCHANGE_DRAW,
+    EXCHANGE_RETURN,
+    GAME_END,
+    GAME_START,
+    RETURN,
+    REVEAL,
+    TURN,
+    ACTION,
+    EventSchema,
+    to_seed
+)
+from state import EMPTY, HAND_SIZE, GameState
+
+INDEX_MAGIC = b"COUPIDX\0"
+INDEX_VERSION = 1
+# magic, version, keyframe interval, rules fingerprint, records indexed, games, offset of the game table
+INDEX_HEADER = struct.Struct("<8sHIQQQQ")
+# first record, offset of the first keyframe, keyframes, seats, card copies
+GAME_ENTRY = struct.Struct("<QQIHH")
+# turn, record following the keyframe, seat whose turn it is
+KEYFRAME = struct.Struct("<IQH")
+DEFAULT_INTERVAL = 16
+
+
+class Replay:
+    """
+    Rebuild games from their events, without any AI or randomness.
+    Every event is checked against the rebuilt state, a card revealed
+    or returned that is not in the hand raises, as does a winner other
+    than the last seat alive.
+    After a turn event the game is at the start of that turn.
+    """
+
+    def __init__(self):
+        self.game = None
+        self.seed = None
+        self.winner = None
+        self.last_action = None
+        self._exchange = None
+
+    def start(self, seats, copies, seed=None, turn=0, turns=0):
+        # An empty table of a game, cards are dealt by the events that follow
+        rng = random.Random(0)
+        state = GameState(seats, rng, copies=copies)
+        state.set_turn(turn)
+        self.game = GameController(headless=True, state=state, rng=rng)
+        self.game.turns = turns
+        self.seed = seed
+        self.winner = None
+        self.last_action = None
+        self._exchange = None
+        return self.game
+
+    def apply(self, event):
+        kind, seat, other, code, value = event
+        if kind == GAME_START:
+            self.start(seat, other, to_seed(value) if code == 1 else None)
+            return
+        state = self.game.state
+        if kind == TURN:
+            state.set_turn(seat)
+            self.game.turns = value
+        elif kind == DEAL:
+            state.take_from_deck(code)
+            state.give_card(seat, code)
+        elif kind == REVEAL:
+            state.reveal_card(seat, state.hand(seat).index(code))
+        elif kind == RETURN:
+            state.take_card(seat, code)
+            state.return_card(code)
+        elif kind == COINS:
+            state.set_coins(seat, state.coins[seat] + value)
+        elif kind == EXCHANGE_DRAW:
+            state.take_from_deck(code)
+            if self._exchange is None:
+                self._exchange = state.hand(seat)
+            self._exchange.append(code)
+        elif kind == EXCHANGE_RETURN:
+            # The cards kept are the hand and the cards drawn, less those returned
+            cards = self._exchange
+            cards.remove(code)
+            state.return_card(code)
+            if len(cards) == state.hand_size(seat):
+                state.set_hand(seat, cards)
+                self._exchange = None
+        elif kind == ACTION:
+            self.last_action = event
+        elif kind in (CHALLENGE, BLOCK):
+            # The reveals and returns that follow carry their outcome
+            pass
+        elif kind == GAME_END:
+            if not self.game.is_game_over() or self.game.get_winner().seat != seat:
+                raise Exception("The recorded winner is not the last player alive.")
+            self.winner = seat
+        else:
+            raise Exception(f"Unknown event kind {kind}.")
+
+    def pack_keyframe(self, record):
+        """
+        Return the state at the start of the current turn as bytes,
+        record being the index of the event following it
+        """
+        state = self.game.state
+        seats = state.seats
+        return KEYFRAME.pack(self.game.turns, record, state.turn) + struct.pack(
+            f"<{seats}h{seats * HAND_SIZE}b{seats * HAND_SIZE}b", *state.coins, *state.hidden, *state.revealed
+        )
+
+    def load_keyframe(self, data, offset, seats, copies):
+        """
+        Rebuild the game from a keyframe, return the index of the record following it
+        """
+        turns, record, turn = KEYFRAME.unpack_from(data, offset)
+        values = struct.unpack_from(f"<{seats}h{seats * HAND_SIZE}b{seats * HAND_SIZE}b", data, offset + KEYFRAME.size)
+        coins = values[:seats]
+        hidden = values[seats:seats + seats * HAND_SIZE]
+        revealed = values[seats + seats * HAND_SIZE:]
+        state = self.start(seats, copies, turn=turn, turns=turns).state
+        for seat in range(seats):
+            state.set_coins(seat, coins[seat])
+            start = seat * HAND_SIZE
+            # A revealed card was dealt first, then revealed
+            for code in revealed[start:start + HAND_SIZE] + hidden[start:start + HAND_SIZE]:
+                if code != EMPTY:
+                    state.take_from_deck(code)
+                    state.give_card(seat, code)
+            for code in revealed[start:start + HAND_SIZE]:
+                if code != EMPTY:
+                    state.reveal_card(seat, 0)
+        return record
+
+
+def keyframe_size(seats):
+    return KEYFRAME.size + seats * 2 + seats * HAND_SIZE * 2
+
+
+def build_index(log_path, index_path=None, interval=DEFAULT_INTERVAL):
+    """
+    Replay every game of a log and write its index: where each game starts
+    and a keyframe of its state every interval turns, from turn 1.
+    Return the number of games indexed.
+    """
+    index_path = index_path or log_path + ".index"
+    replay = Replay()
+    games = []
+    with EventLogReader(log_path) as reader, open(index_path, "wb") as index:
+        index.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, interval, 0, 0, 0, 0))
+        for record, event in enumerate(reader.records()):
+            replay.apply(event)
+            if event[0] == GAME_START:
+                games.append([record, index.tell(), 0, event[1], event[2]])
+            elif event[0] == TURN and (event[4] - 1) % interval == 0:
+                index.write(replay.pack_keyframe(record + 1))
+                games[-1][2] += 1
+        games_offset = index.tell()
+        for entry in games:
+            index.write(GAME_ENTRY.pack(*entry))
+        index.seek(0)
+        index.write(INDEX_HEADER.pack(
+            INDEX_MAGIC, INDEX_VERSION, interval, reader.schema.fingerprint, len(reader), len(games), games_offset
+        ))
+    return len(games)
+
+
+class ReplayIndex:
+    """
+    Jump to any turn of any game of a log: load the keyframe at or before
+    the turn from the index and replay the few events after it.
+    """
+
+    def __init__(self, log_path, index_path=None):
+        self.reader = EventLogReader(log_path)
+        with open(index_path or log_path + ".index", "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.interval, fingerprint, records, self.games, self.games_offset = INDEX_HEADER.unpack_from(self.map)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError("Not a replay index.")
+        if fingerprint != self.reader.schema.fingerprint or records > len(self.reader):
+            raise ValueError("The replay index does not belong to this event log, build it again.")
+        self.records = records
+
+    def __len__(self):
+        return self.games
+
+    def game_entry(self, game):
+        if not 0 <= game < self.games:
+            raise IndexError(f"The log has no game {game}.")
+        return GAME_ENTRY.unpack_from(self.map, self.games_offset + game * GAME_ENTRY.size)
+
+    def game_end(self, game):
+        # Index of the first record after the game
+        return self.game_entry(game + 1)[0] if game + 1 < self.games else self.records
+
+    def seek(self, game, turn):
+        """
+        Return a Replay of the game at the start of the given turn, turn 1 being the first
+        """
+        return self._seek(game, turn)[0]
+
+    def _seek(self, game, turn):
+        # The replay and the index of the record following the turn event
+        _, offset, keyframes, seats, copies = self.game_entry(game)
+        size = keyframe_size(seats)
+        turns = [KEYFRAME.unpack_from(self.map, offset + index * size)[0] for index in range(keyframes)]
+        position = bisect.bisect_right(turns, turn) - 1
+        if position < 0:
+            raise IndexError(f"Game {game} has no turn {turn}.")
+        replay = Replay()
+        record = replay.load_keyframe(self.map, offset + position * size, seats, copies)
+        if turns[position] == turn:
+            return replay, record
+        for record, event in enumerate(self.reader.records(record, self.game_end(game)), record + 1):
+            replay.apply(event)
+            if event[0] == TURN and event[4] == turn:
+                return replay, record
+        raise IndexError(f"Game {game} has no turn {turn}.")
+
+    def events(self, game, turn):
+        # Yield the events of a turn of a game
+        _, record = self._seek(game, turn)
+        for event in self.reader.records(record, self.game_end(game)):
+            if event[0] == TURN:
+                break
+            yield event
+
+    def close(self):
+        self.map.close()
+        self.reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def fast_forward(log_path):
+    """
+    Replay every game of a log without rendering, checking every event
+    against the rebuilt state. Return the number of games replayed.
+    """
+    replay = Replay()
+    games = 0
+    with EventLogReader(log_path) as reader:
+        for event in reader.records():
+            replay.apply(event)
+            games += event[0] == GAME_START
+    return games
+
+
+class RecordComparer:
+    # Listener checking the events of a game against the recorded ones
+    def __init__(self, recorded, recorded_schema, schema):
+        self.recorded = recorded
+        self.recorded_schema = recorded_schema
+        self.schema = schema
+        self.position = 0
+        self.mismatch = None
+
+    def __call__(self, *event):
+        if self.mismatch is not None:
+            return
+        expected = self.recorded_schema.format(self.recorded[self.position]) if self.position < len(self.recorded) else None
+        played = self.schema.format(event)
+        if played != expected:
+            self.mismatch = (self.position, expected, played)
+        self.position += 1
+
+
+def verify(log_path, ai=None):
+    """
+    Play every seeded game of a log again with the current rules and ai,
+    and compare its events with the recorded ones. Events are compared
+    by their decoded names, so a renumbering of actions or characters
+    is not a difference but a change of outcome is.
+    Return a list of (game, event index, recorded event, new event) for
+    every game that played differently, games without a seed are skipped.
+    """
+    schema = EventSchema.from_rules()
+    differences = []
+    with EventLogReader(log_path) as reader:
+        for game_index, events in enumerate(reader.games()):
+            _, seats, copies, seeded, value = events[0]
+            if not seeded:
+                continue
+            comparer = RecordComparer(events, reader.schema, schema)
+            game = GameController(
+                headless=True, seed=to_seed(value), ai=ai, listeners=[comparer], number_of_seats=seats, copies=copies
+            )
+            while not game.is_game_over() and comparer.mismatch is None:
+                game.play_turn()
+                game.next_turn()
+            if comparer.mismatch is None and comparer.position != len(events):
+                comparer.mismatch = (comparer.position, schema.format(events[comparer.position]), None)
+            if comparer.mismatch is not None:
+                differences.append((game_index, *comparer.mismatch))
+    return differences
+
+
+def describe(replay):
+    # Plain text lines of the state of a replayed game
+    game = replay.game
+    lines = [f"Turn {game.turns}, {game.current_player.name} to play"]
+    for player in game.players:
+        if player.is_eliminated and not player.revealed:
+            continue
+        status = " (eliminated)" if player.is_eliminated else ""
+        lines.append(
+            f"  {player.name}: {player.coins} coins, cards {player.cards}, revealed {player.revealed}{status}"
+        )
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay games recorded in a binary event log.")
+    parser.add_argument("log", help="event log to replay")
+    commands = parser.add_subparsers(dest="command", required=True)
+    index_command = commands.add_parser("index", help="write the keyframe index of the log")
+    index_command.add_argument("--interval", type=int, default=DEFAULT_INTERVAL, help="turns between keyframes")
+    show_command = commands.add_parser("show", help="print a game at the start of a turn")
+    show_command.add_argument("--game", type=int, required=True)
+    show_command.add_argument("--turn", type=int, default=1)
+    commands.add_parser("check", help="replay every game and check its events")
+    commands.add_parser("verify", help="play the seeded games again and compare their events")
+    args = parser.parse_args()
+
+    if args.command == "index":
+        print(f"Indexed {build_index(args.log, interval=args.interval)} games")
+    elif args.command == "show":
+        if not os.path.exists(args.log + ".index"):
+            build_index(args.log)
+        with ReplayIndex(args.log) as index:
+            replay = index.seek(args.game, args.turn)
+            print("\n".join(describe(replay)))
+            for event in index.events(args.game, args.turn):
+                print(f"  {index.reader.schema.format(event)}")
+    elif args.command == "check":
+        print(f"Replayed {fast_forward(args.log)} games")
+    else:
+        differences = verify(args.log)
+        for game, position, recorded, played in differences:
+            print(f"Game {game} differs at event {position}: recorded {recorded}, played {played}")
+        print(f"{len(differences)} games played differently")
+
+
+if __name__ == "__main__":
+    main()
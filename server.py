@@ -0,0 +1,589 @@
+import argparse
+import asyncio
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from itertools import count
+from ai import RandomAI
+from constants import MAX_PLAYERS, MIN_PLAYERS
+from controller import GameController
+from simulation import game_seed
+from spectators import MAX_QUEUE, MAX_SKIPS, Broadcaster, Spectator, encode
+from views import GameView, PlayerView
+
+# Seconds a remote player has to answer a prompt before the AI answers for them
+PROMPT_TIMEOUT = 60.0
+# Seconds the players have to challenge or block an action before they pass
+RESPONSE_DEADLINE = 15.0
+# Seconds the AI of a featured table pauses before each decision, for its spectators to follow
+FEATURED_DELAY = 0.5
+
+
+class PromptCancelled(Exception):
+    # Raised in the thread waiting on a prompt that was withdrawn
+    pass
+
+
+class RemotePlayerView(PlayerView):
+    """
+    Player view of a table whose human seats are remote connections
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def get_card_to_reveal(self, player):
+        choice = self.table.ask(player, "reveal", player.cards)
+        return choice if choice is not None else player.ai.choose_card_to_reveal(player)
+
+    def display_player_eliminated(self, player_name):
+        self.table.broadcast({"type": "eliminated", "player": player_name})
+
+    def display_player_revealed_card(self, player_name, card):
+        self.table.broadcast({"type": "revealed", "player": player_name, "card": card})
+
+    def print_ai_thinking_reveal(self, player=None):
+        pass
+
+
+class RemoteGameView(GameView):
+    """
+    Game view of a table whose human seats are remote connections.
+    Everything shown is sent to every seat of the table as a message,
+    except the hidden cards of a seat which only go to that seat.
+    Prompts go to the seat deciding and wait for its answer, a seat
+    that left or did not answer in time is played by the AI.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def display_welcome_message(self):
+        self.table.broadcast({"type": "welcome", "players": [player.name for player in self.table.game.players]})
+
+    def display_state(self, players, current_player_index):
+        self.table.broadcast({
+            "type": "state",
+            "turn": current_player_index,
+            "players": [
+                {
+                    "seat": player.seat,
+                    "name": player.name,
+                    "coins": player.coins,
+                    "cards": len(player.cards),
+                    "revealed": player.revealed,
+                }
+                for player in players
+            ],
+        })
+        for seat in range(self.table.humans):
+            self.table.send(seat, {"type": "hand", "cards": players[seat].cards})
+
+    def print_error(self, error):
+        self.table.broadcast({"type": "error", "error": error})
+
+    def announce_action(self, player, action, character="", target=None):
+        self.table.broadcast({
+            "type": "action",
+            "player": player.name,
+            "action": action,
+            "character": character,
+            "target": target.name if target else None,
+        })
+
+    def print_income(self, player):
+        self.announce_action(player, "income")
+
+    def print_foreign_aid(self, player):
+        self.announce_action(player, "foreign_aid")
+
+    def print_tax(self, player):
+        self.announce_action(player, "tax", "duke")
+
+    def announce_eliminated_player(self, player):
+        self.table.broadcast({"type": "eliminated", "player": player.name})
+
+    def display_game_over(self, winner):
+        self.table.broadcast({"type": "game_over", "winner": winner.name, "seat": winner.seat})
+
+    def challenge_failed(self, challenger, challenged, claimed_card):
+        self.table.broadcast({
+            "type": "challenge", "challenger": challenger.name, "challenged": challenged.name,
+            "card": claimed_card, "succeeded": False,
+        })
+
+    def challenge_succeeded(self, challenger, challenged, claimed_card):
+        self.table.broadcast({
+            "type": "challenge", "challenger": challenger.name, "challenged": challenged.name,
+            "card": claimed_card, "succeeded": True,
+        })
+
+    def block_successful(self, blocker, blocked_player, action):
+        self.table.broadcast({"type": "block", "blocker": blocker.name, "blocked": blocked_player.name, "action": action})
+
+    def print_ai_thinking(self, about="", player=None):
+        pass
+
+    def get_player_action(self, player, options):
+        choice = self.table.ask(player, "action", list(options))
+        if choice is None:
+            return player.ai.choose_action(self.table.game, player, options)
+        return options[choice]
+
+    def get_player_target(self, players, player):
+        choice = self.table.ask(player, "target", [target.name for target in players])
+        if choice is None:
+            return player.rng.choice(players)
+        return players[choice]
+
+    def get_challenge_decision(self, challenger, challenged, action, target=None):
+        choice = self.table.ask(
+            challenger, "challenge", [False, True],
+            challenged=challenged.name, action=action, target=target.name if target else None
+        )
+        if choice is None:
+            return challenger.ai.decide_to_challenge(self.table.game, challenger, challenged, action, target)
+        return bool(choice)
+
+    def get_block_decision(self, blocker, blocked_player, action):
+        choice = self.table.ask(blocker, "block", [False, True], blocked=blocked_player.name, action=action)
+        if choice is None:
+            return blocker.ai.decide_to_block(self.table.game, blocker, blocked_player, action)
+        return bool(choice)
+
+    def choose_cards_to_exchange(self, player, cards):
+        choice = self.table.ask(player, "exchange", cards, keep=len(player.cards))
+        if choice is None:
+            return player.ai.choose_cards_to_keep(self.table.game, player, cards)
+        return [cards[index] for index in choice]
+
+    def ask_to_play_again(self):
+        return False
+
+    def ask_for_player_name(self):
+        return "Human"
+
+    def withdraw_prompts(self, players):
+        self.table.withdraw([player.seat for player in players])
+        return True
+
+    def reopen_prompts(self, players):
+        self.table.reopen([player.seat for player in players])
+
+
+def valid_choice(choice, options, keep=None):
+    # A choice is an index of the options, or keep distinct indexes for an exchange
+    if keep is None:
+        return isinstance(choice, int) and not isinstance(choice, bool) and 0 <= choice < len(options)
+    if not isinstance(choice, list) or len(choice) != keep:
+        return False
+    return all(valid_choice(index, options) for index in choice) and len(set(choice)) == keep
+
+
+class Session:
+    # One connection, seated at one table at a time
+    def __init__(self, writer):
+        self.writer = writer
+        self.name = "Human"
+        self.table = None
+        self.seat = None
+        # Spectator side of the connection once it watched a table, and the table watched
+        self.spectator = None
+        self.watching = None
+
+    def send(self, message):
+        if not self.writer.is_closing():
+            self.writer.write(json.dumps(message).encode() + b"\n")
+
+
+class Table:
+    """
+    A game between remote human seats and AI seats.
+    The engine runs in a worker thread so the event loop never waits
+    on it: AI decisions are taken inline in that thread and prompts
+    block it, not the loop, until the answer comes back from the loop.
+    Every message to a connection is written from the event loop.
+    """
+
+    def __init__(self, server, table_id, number_of_players, humans, featured=False):
+        self.server = server
+        self.loop = server.loop
+        self.id = table_id
+        self.number_of_players = number_of_players
+        self.humans = humans
+        self.featured = featured
+        self.broadcaster = Broadcaster(self.loop, table_id, server.spectator_skips)
+        self.waiting = []
+        self.sessions = {}
+        self.pending = {}
+        self.prompt_ids = count()
+        self.game = None
+        # Seats whose prompts are withdrawn, no new prompt is sent to them until reopened
+        self.withdrawn = set()
+        self.lock = threading.Lock()
+
+    @property
+    def is_full(self):
+        return len(self.waiting) == self.humans
+
+    # Event loop side
+    def seat_players(self):
+        for seat, session in enumerate(self.waiting):
+            session.seat = seat
+            self.sessions[seat] = session
+            session.send({"type": "seated", "table": self.id, "seat": seat})
+
+    def answer(self, seat, prompt_id, choice):
+        entry = self.pending.get(prompt_id) if isinstance(prompt_id, int) else None
+        if entry is None or entry[0] != seat:
+            self.sessions[seat].send({"type": "error", "error": "No such prompt."})
+            return
+        prompt_seat, future, options, keep = entry
+        if not valid_choice(choice, options, keep):
+            self.sessions[seat].send({"type": "error", "error": "Invalid choice, answer again.", "id": prompt_id})
+            return
+        del self.pending[prompt_id]
+        future.set_result(choice)
+
+    def leave(self, session):
+        if session in self.waiting and not self.sessions:
+            self.waiting.remove(session)
+            return
+        self.sessions.pop(session.seat, None)
+        for prompt_id, (seat, future, _, _) in list(self.pending.items()):
+            if seat == session.seat:
+                del self.pending[prompt_id]
+                future.set_result(None)
+
+    def release(self):
+        # The game is over, its players may join other tables
+        for session in self.sessions.values():
+            session.table = None
+            session.seat = None
+
+    def _write(self, seat, message):
+        session = self.sessions.get(seat)
+        if session is not None:
+            session.send(message)
+
+    def _write_all(self, message):
+        data = json.dumps(message).encode() + b"\n"
+        for session in self.sessions.values():
+            if not session.writer.is_closing():
+                session.writer.write(data)
+
+    def _prompt(self, seat, prompt_id, future, message, options, keep):
+        with self.lock:
+            withdrawn = seat in self.withdrawn
+        if withdrawn:
+            future.set_exception(PromptCancelled())
+            return
+        session = self.sessions.get(seat)
+        if session is None:
+            future.set_result(None)
+            return
+        self.pending[prompt_id] = (seat, future, options, keep)
+        session.send(message)
+
+    def _withdraw(self, seats):
+        for prompt_id, (seat, future, _, _) in list(self.pending.items()):
+            if seat in seats:
+                del self.pending[prompt_id]
+                future.set_exception(PromptCancelled())
+                self._write(seat, {"type": "withdrawn", "id": prompt_id})
+
+    # Engine thread side
+    def withdraw(self, seats):
+        """
+        Close the open prompts of the seats, the threads waiting on them
+        raise PromptCancelled, as does any prompt until the seats are reopened
+        """
+        with self.lock:
+            self.withdrawn.update(seats)
+        self.loop.call_soon_threadsafe(self._withdraw, set(seats))
+
+    def reopen(self, seats):
+        with self.lock:
+            self.withdrawn.difference_update(seats)
+
+    def send(self, seat, message):
+        self.loop.call_soon_threadsafe(self._write, seat, message)
+
+    def broadcast(self, message):
+        self.loop.call_soon_threadsafe(self._write_all, message)
+
+    def ask(self, player, kind, options, keep=None, **details):
+        """
+        Prompt the seat of the player with a list of options and wait for
+        the index of the option chosen, a list of keep indexes for an exchange.
+        Return None if the seat left or did not answer in time, the seat
+        is then played by the AI for the rest of the game.
+        """
+        if player.is_ai:
+            return None
+        with self.lock:
+            if player.seat in self.withdrawn:
+                raise PromptCancelled()
+        prompt_id = next(self.prompt_ids)
+        future = Future()
+        message = {"type": "prompt", "id": prompt_id, "kind": kind, "options": options, **details}
+        if keep is not None:
+            message["keep"] = keep
+        self.loop.call_soon_threadsafe(self._prompt, player.seat, prompt_id, future, message, options, keep)
+        try:
+            choice = future.result(timeout=self.server.prompt_timeout)
+        except FutureTimeoutError:
+            self.loop.call_soon_threadsafe(self.pending.pop, prompt_id, None)
+            choice = None
+        if choice is None:
+            player.is_ai = True
+            player.ai = self.server.ai
+        return choice
+
+    def run(self):
+        """
+        Play the game of the table, return the number of turns played
+        """
+        seed = None if self.server.seed is None else game_seed(self.server.seed, self.id)
+        game = self.game = GameController(
+            self.number_of_players,
+            seed=seed,
+            ai=self.server.ai,
+            ai_delay=self.server.featured_delay if self.featured else self.server.ai_delay,
+            listeners=[self.broadcaster],
+            view=RemoteGameView(self),
+            player_view=RemotePlayerView(self),
+            human_seats=range(self.humans),
+            concurrent_responses=True,
+            response_deadline=self.server.response_deadline,
+        )
+        for seat, session in self.sessions.items():
+            game.players[seat].name = session.name
+        view = game.view
+        view.display_welcome_message()
+        turns = 0
+        try:
+            while not game.is_game_over():
+                view.display_state(game.players, game.current_player_index)
+                game.play_turn()
+                turns += 1
+                if game.is_game_over():
+                    break
+                game.next_turn()
+        finally:
+            game.close()
+        view.display_game_over(game.get_winner())
+        self.loop.call_soon_threadsafe(self.release)
+        return turns
+
+
+class GameServer:
+    """
+    Host many tables in one process, over TCP or a Unix socket.
+    The protocol is one JSON object per line. A client sends
+        {"type": "join", "name": "Ann", "players": 3, "humans": 1}
+    to sit at a table of players + 3 seats with humans remote seats,
+    waiting for other clients if humans is more than 1. It gets a
+    "seated" message with its seat, then the messages of the game:
+    "welcome", "state", "hand", "action", "challenge", "block",
+    "revealed", "eliminated", "error" and finally "game_over", after
+    which it may join another table. A prompt
+        {"type": "prompt", "id": 4, "kind": "action", "options": [...]}
+    is answered with the index of the option chosen,
+        {"type": "answer", "id": 4, "choice": 0}
+    or a list of "keep" indexes for an exchange.
+    Every player is asked at once whether they challenge or block an
+    action, a prompt made pointless by the answer of a player seated
+    before is closed with a "withdrawn" message.
+
+    Any table can be watched, {"type": "tables"} lists them and
+        {"type": "watch", "table": 2}
+    sends "watching", a "snapshot" of the public state of the game then
+    every "event" of the game with the hidden cards left out, until its
+    game_end event. Without a table, the first featured table still
+    playing is watched, featured tables being AI-only tables kept running
+    for spectators.
+    A spectator too slow to keep up is skipped to a new snapshot, then
+    disconnected if it keeps falling behind (see spectators.Broadcaster).
+    """
+
+    def __init__(
+        self, max_tables=1000, prompt_timeout=PROMPT_TIMEOUT, ai=None, ai_delay=0, seed=None,
+        response_deadline=RESPONSE_DEADLINE, featured=0, featured_delay=FEATURED_DELAY, spectator_queue=MAX_QUEUE,
+        spectator_skips=MAX_SKIPS
+    ):
+        self.max_tables = max_tables
+        self.prompt_timeout = prompt_timeout
+        self.response_deadline = response_deadline
+        self.ai = ai if ai is not None else RandomAI()
+        self.ai_delay = ai_delay
+        self.seed = seed
+        self.featured = featured
+        self.featured_delay = featured_delay
+        self.spectator_queue = spectator_queue
+        self.spectator_skips = spectator_skips
+        self.loop = None
+        self.executor = ThreadPoolExecutor(max_tables, thread_name_prefix="table")
+        self.table_ids = count()
+        self.waiting = {}
+        # Running tables by id
+        self.running = {}
+        self.finished_tables = 0
+        self.turns = 0
+        self.dropped_spectators = 0
+
+    async def start(self, host="127.0.0.1", port=8765, path=None):
+        # Start listening, on a Unix socket when a path is given
+        self.loop = asyncio.get_running_loop()
+        for _ in range(self.featured):
+            self.start_featured_table()
+        if path:
+            return await asyncio.start_unix_server(self.handle, path=path)
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def handle(self, reader, writer):
+        session = Session(writer)
+        try:
+            while line := await reader.readline():
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    session.send({"type": "error", "error": "Invalid JSON."})
+                    continue
+                kind = message.get("type") if isinstance(message, dict) else None
+                if kind == "join":
+                    self.stop_watching(session)
+                    self.join(session, message)
+                elif kind == "watch":
+                    self.watch(session, message)
+                elif kind == "tables":
+                    session.send({"type": "tables", "tables": [
+                        {"table": table.id, "players": table.number_of_players, "humans": table.humans, "featured": table.featured}
+                        for table in self.running.values()
+                    ]})
+                elif kind == "answer" and session.seat is not None:
+                    session.table.answer(session.seat, message.get("id"), message.get("choice"))
+                else:
+                    session.send({"type": "error", "error": "Unexpected message."})
+        except ConnectionError:
+            pass
+        finally:
+            self.stop_watching(session)
+            if session.table is not None:
+                session.table.leave(session)
+            writer.close()
+            if session.spectator is not None:
+                session.spectator.stop()
+
+    def join(self, session, message):
+        if session.table is not None:
+            session.send({"type": "error", "error": "Already at a table."})
+            return
+        players = message.get("players", 3)
+        humans = message.get("humans", 1)
+        if not isinstance(players, int) or not isinstance(humans, int) or not MIN_PLAYERS <= players <= MAX_PLAYERS or not 1 <= humans <= players + 3:
+            session.send({"type": "error", "error": "Invalid table."})
+            return
+        if len(self.running) >= self.max_tables:
+            session.send({"type": "error", "error": "The server is full."})
+            return
+        session.name = str(message.get("name") or "Human")
+        table = self.waiting.get((players, humans))
+        if table is None:
+            table = self.waiting[(players, humans)] = Table(self, next(self.table_ids), players, humans)
+        table.waiting.append(session)
+        session.table = table
+        if table.is_full:
+            del self.waiting[(players, humans)]
+            self.start_table(table)
+
+    def watch(self, session, message):
+        if session.table is not None:
+            session.send({"type": "error", "error": "Already at a table."})
+            return
+        table_id = message.get("table")
+        if table_id is None:
+            table = next((table for table in self.running.values() if table.featured and not table.broadcaster.over), None)
+        else:
+            table = self.running.get(table_id) if isinstance(table_id, int) else None
+        if table is None:
+            session.send({"type": "error", "error": "No such table."})
+            return
+        if session.watching is table and not table.broadcaster.over:
+            # Already watching it
+            return
+        if session.watching is not None:
+            session.watching.broadcaster.unsubscribe(session.spectator)
+        if session.spectator is None:
+            session.spectator = Spectator(session.writer, self.spectator_queue)
+        session.watching = table
+        table.broadcaster.subscribe(session.spectator, encode({"type": "watching", "table": table.id}))
+
+    def stop_watching(self, session):
+        if session.watching is not None:
+            session.watching.broadcaster.unsubscribe(session.spectator)
+            session.spectator.clear()
+            session.watching = None
+
+    def stop_featured(self):
+        # Let the featured tables finish their games without starting new ones
+        self.featured = 0
+
+    def start_featured_table(self):
+        self.start_table(Table(self, next(self.table_ids), 3, 0, featured=True))
+
+    def start_table(self, table):
+        table.seat_players()
+        self.running[table.id] = table
+        future = self.loop.run_in_executor(self.executor, table.run)
+        future.add_done_callback(lambda future: self.finish_table(table, future))
+
+    def finish_table(self, table, future):
+        self.running.pop(table.id, None)
+        self.finished_tables += 1
+        self.dropped_spectators += table.broadcaster.dropped
+        if table.featured and self.featured:
+            self.start_featured_table()
+        if future.exception() is not None:
+            table._write_all({"type": "error", "error": f"The game stopped: {future.exception()}"})
+            table.release()
+        else:
+            self.turns += future.result()
+
+
+async def serve(host, port, path, server):
+    listener = await server.start(host, port, path)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host Coup tables for remote players.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--max-tables", type=int, default=1000, help="tables played at the same time")
+    parser.add_argument("--prompt-timeout", type=float, default=PROMPT_TIMEOUT, help="seconds a player has to answer")
+    parser.add_argument(
+        "--response-deadline", type=float, default=RESPONSE_DEADLINE, help="seconds to challenge or block an action"
+    )
+    parser.add_argument("--ai-delay", type=float, default=0, help="seconds the AI pauses before each decision")
+    parser.add_argument("--seed", type=int, help="seed of the tables, to make them reproducible")
+    parser.add_argument("--featured", type=int, default=0, help="AI-only tables kept running for spectators")
+    parser.add_argument(
+        "--featured-delay", type=float, default=FEATURED_DELAY,
+        help=f"seconds the AI of a featured table pauses before each decision (default: {FEATURED_DELAY})"
+    )
+    args = parser.parse_args()
+    server = GameServer(
+        args.max_tables, args.prompt_timeout, ai_delay=args.ai_delay, seed=args.seed, response_deadline=args.response_deadline,
+        featured=args.featured, featured_delay=args.featured_delay
+    )
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, server))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
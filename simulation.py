@@ -0,0 +1,78 @@
+from hashlib import blake2b
+from time import perf_counter
+from controller import GameController
+
+# Turns after which a headless game is stopped unfinished, so no strategy can play forever
+MAX_TURNS = 1000
+
+
+def game_seed(base_seed, game_index):
+    """
+    Derive the seed of one game from the seed of a whole run.
+    Every game gets an independent 64 bit seed that does not depend
+    on which process plays it or in which order.
+    """
+    digest = blake2b(f"{base_seed}:{game_index}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def play_game(controller, max_turns=None):
+    """
+    Play a game until only one player is left, or max_turns turns.
+    Return a tuple of (winner, number of turns played), the winner is
+    None for a game stopped unfinished.
+    """
+    turns = 0
+    while not controller.is_game_over():
+        if max_turns is not None and turns >= max_turns:
+            return None, turns
+        controller.play_turn()
+        turns += 1
+        if controller.is_game_over():
+            break
+        controller.next_turn()
+    return controller.get_winner(), turns
+
+
+def simulate(
+    number_of_games, number_of_players=3, clock=perf_counter, seed=None, ai=None, listeners=None, instruments=None,
+    max_turns=MAX_TURNS
+):
+    """
+    Play headless AI-only games back to back and measure the throughput.
+    ai is the strategy of every seat, RandomAI by default.
+    listeners get the events of every game, an EventLogWriter records them.
+    instruments time and count every game.
+    Game i is seeded with game_seed(seed, i) when a seed is given.
+    A game is stopped unfinished after max_turns turns.
+    Return a dict with the number of games, unfinished games, turns,
+    elapsed seconds and rates.
+    """
+    turns = 0
+    unfinished = 0
+    start = clock()
+    controller = None
+    for i in range(number_of_games):
+        seed_of_game = None if seed is None else game_seed(seed, i)
+        if controller is None:
+            controller = GameController(
+                number_of_players, headless=True, seed=seed_of_game, ai=ai, listeners=listeners,
+                instruments=instruments
+            )
+        else:
+            # The games after the first are dealt in place
+            controller.reset(seed_of_game)
+        winner, game_turns = play_game(controller, max_turns)
+        turns += game_turns
+        if winner is None:
+            unfinished += 1
+    elapsed = clock() - start
+
+    return {
+        "games": number_of_games,
+        "unfinished": unfinished,
+        "turns": turns,
+        "seconds": elapsed,
+        "games_per_second": number_of_games / elapsed if elapsed else 0.0,
+        "turns_per_second": turns / elapsed if elapsed else 0.0,
+    }
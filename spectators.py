@@ -0,0 +1,244 @@
+import asyncio
+import json
+from collections import deque
+from constants import CHARACTERS
+from events import (
+    ACTION,
+    ACTION_CODES,
+    CHALLENGE,
+    COINS,
+    DEAL,
+    EVENT_NAMES,
+    EXCHANGE_DRAW,
+    EXCHANGE_RETURN,
+    GAME_END,
+    GAME_START,
+    NONE,
+    RETURN,
+    REVEAL,
+    TURN,
+)
+
+ACTION_NAMES = {code: action for action, code in ACTION_CODES.items()}
+# Events whose card only its player sees, spectators get them without the card
+HIDDEN_CARDS = {DEAL, EXCHANGE_DRAW, EXCHANGE_RETURN}
+# Messages a spectator may have waiting before it is skipped to a snapshot
+MAX_QUEUE = 256
+# Snapshots a spectator may be skipped to before it is dropped
+MAX_SKIPS = 3
+STARTING_COINS = 2
+
+
+def public_event(table, number, kind, seat, other, code, value):
+    """
+    Return the message of an event as spectators see it: cards drawn or
+    put back unseen are left out, and so is the seed of the game, which
+    would tell every card to come.
+    """
+    message = {"type": "event", "table": table, "seq": number, "event": EVENT_NAMES[kind], "seat": seat}
+    if kind == GAME_START:
+        message["copies"] = other
+        return message
+    if other != NONE:
+        message["other"] = other
+    if kind == ACTION:
+        message["action"] = ACTION_NAMES[code]
+    elif code != NONE and kind not in HIDDEN_CARDS:
+        message["card"] = CHARACTERS[code]
+    if kind == CHALLENGE:
+        message["succeeded"] = bool(value)
+    elif kind in (TURN, COINS, GAME_END):
+        message["value"] = value
+    return message
+
+
+def encode(message):
+    return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+
+class PublicState:
+    """
+    What a spectator can know of a game, kept up to date from its events:
+    the coins, number of cards and revealed cards of every seat, the seat
+    to play and the winner.
+    """
+
+    def __init__(self, seats=0):
+        self.coins = [STARTING_COINS] * seats
+        self.cards = [0] * seats
+        self.revealed = [[] for _ in range(seats)]
+        self.turn = None
+        self.turns = 0
+        self.winner = None
+
+    def update(self, kind, seat, other, code, value):
+        if kind == GAME_START:
+            self.__init__(seat)
+        elif kind in (DEAL, EXCHANGE_DRAW):
+            self.cards[seat] += 1
+        elif kind in (RETURN, EXCHANGE_RETURN):
+            self.cards[seat] -= 1
+        elif kind == REVEAL:
+            self.cards[seat] -= 1
+            self.revealed[seat].append(CHARACTERS[code])
+        elif kind == COINS:
+            self.coins[seat] += value
+        elif kind == TURN:
+            self.turn = seat
+            self.turns = value
+        elif kind == GAME_END:
+            self.winner = seat
+
+    def snapshot(self, table, number):
+        return {
+            "type": "snapshot",
+            "table": table,
+            "seq": number,
+            "turn": self.turn,
+            "turns": self.turns,
+            "winner": self.winner,
+            "players": [
+                {"seat": seat, "coins": coins, "cards": cards, "revealed": revealed}
+                for seat, (coins, cards, revealed) in enumerate(zip(self.coins, self.cards, self.revealed))
+            ],
+        }
+
+
+class Spectator:
+    """
+    The watching side of a connection and its bounded queue of encoded
+    messages, written out by its own task so a slow reader never holds
+    the others. It follows one table at a time and keeps its queue from
+    one table to the next.
+    """
+
+    def __init__(self, writer, max_queue=MAX_QUEUE):
+        self.writer = writer
+        self.max_queue = max_queue
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        # Snapshots skipped to since the queue was last written out
+        self.skips = 0
+        self.task = asyncio.get_running_loop().create_task(self.pump())
+
+    def offer(self, data):
+        # Queue a message, False when the queue is full
+        if len(self.queue) >= self.max_queue:
+            return False
+        self.queue.append(data)
+        self.ready.set()
+        return True
+
+    def skip_to(self, data):
+        # Drop the messages waiting, the snapshot given replaces them
+        self.queue.clear()
+        self.queue.append(data)
+        self.skips += 1
+        self.ready.set()
+
+    def clear(self):
+        self.queue.clear()
+
+    def stop(self):
+        # Let the pump see its connection closed
+        self.ready.set()
+
+    def drop(self):
+        # Closing would wait for the messages buffered to be read, which may never happen
+        self.queue.clear()
+        self.writer.transport.abort()
+
+    async def pump(self):
+        writer = self.writer
+        try:
+            while not writer.is_closing():
+                if self.queue:
+                    messages = list(self.queue)
+                    self.queue.clear()
+                    writer.writelines(messages)
+                    await writer.drain()
+                    if not self.queue:
+                        # Caught up
+                        self.skips = 0
+                    continue
+                self.ready.clear()
+                await self.ready.wait()
+        except ConnectionError:
+            pass
+
+
+class Broadcaster:
+    """
+    Spectator channel of a table, a listener of its GameController.
+    Each event is made public and encoded once, in the engine thread, and
+    handed to the event loop, which appends the same bytes to the queue of
+    every spectator. A spectator whose queue is full is skipped to a
+    snapshot of the public state, built at most once per event however
+    many spectators need it, and dropped after max_skips snapshots
+    without catching up, so the table never waits on its spectators.
+    """
+
+    def __init__(self, loop, table=0, max_skips=MAX_SKIPS):
+        self.loop = loop
+        self.table = table
+        self.max_skips = max_skips
+        self.spectators = set()
+        self.state = PublicState()
+        # Number of the next event, counted in the engine thread
+        self.events = 0
+        # Number of the last event published, and its snapshot once built
+        self.published = -1
+        self._snapshot = None
+        self.over = False
+        self.dropped = 0
+
+    # Engine thread side
+    def __call__(self, kind, seat, other=NONE, code=NONE, value=0):
+        event = (kind, seat, other, code, value)
+        data = encode(public_event(self.table, self.events, *event))
+        self.events += 1
+        self.loop.call_soon_threadsafe(self.publish, event, data)
+
+    # Event loop side
+    def publish(self, event, data):
+        self.state.update(*event)
+        self.published += 1
+        self._snapshot = None
+        full = [spectator for spectator in self.spectators if not spectator.offer(data)]
+        for spectator in full:
+            self.overflow(spectator, self.snapshot())
+        if event[0] == GAME_END:
+            self.close()
+
+    def snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = encode(self.state.snapshot(self.table, self.published))
+        return self._snapshot
+
+    def overflow(self, spectator, data):
+        # Skip a spectator with a full queue to data, or drop it
+        if spectator.skips >= self.max_skips:
+            self.unsubscribe(spectator)
+            spectator.drop()
+            self.dropped += 1
+        else:
+            spectator.skip_to(data)
+
+    def subscribe(self, spectator, greeting=b""):
+        """
+        Make the spectator follow the table, it gets the greeting and a
+        snapshot of the game so far then every event.
+        """
+        data = greeting + self.snapshot()
+        if not self.over:
+            self.spectators.add(spectator)
+        if not spectator.offer(data):
+            self.overflow(spectator, data)
+
+    def unsubscribe(self, spectator):
+        self.spectators.discard(spectator)
+
+    def close(self):
+        # The game is over, the spectators are let go with the messages they have left
+        self.over = True
+        self.spectators.clear()
@@ -0,0 +1,309 @@
+import random
+from deck import Deck
+from constants import CARD_COPIES, CHARACTERS
+
+# Marks an empty slot in the hidden and revealed card arrays
+EMPTY = -1
+HAND_SIZE = 2
+CARD_CODES = {character: code for code, character in enumerate(CHARACTERS)}
+# Coin counts are hashed modulo this many keys
+COIN_KEYS = 64
+ZOBRIST_SEED = 0x5EED
+
+
+class ZobristKeys:
+    """
+    Random 64 bit keys for every piece of a game state.
+    Hidden and revealed cards are keyed by (seat, character, copy number)
+    so the order of the cards in a hand does not change the hash.
+    Keys only depend on the shape of the game and are shared between states.
+    """
+
+    _cache = {}
+
+    def __init__(self, seats, characters, copies):
+        rng = random.Random(ZOBRIST_SEED)
+        self.coins = [rng.getrandbits(64) for _ in range(seats * COIN_KEYS)]
+        self.hidden = [rng.getrandbits(64) for _ in range(seats * characters * HAND_SIZE)]
+        self.revealed = [rng.getrandbits(64) for _ in range(seats * characters * HAND_SIZE)]
+        self.deck = [rng.getrandbits(64) for _ in range(characters * (copies + 1))]
+        self.turn = [rng.getrandbits(64) for _ in range(seats)]
+        self.characters = characters
+        self.copies = copies
+        # Hash of a state before any card is dealt, by starting coins
+        self.empty_hashes = {}
+
+    @classmethod
+    def for_game(cls, seats, characters, copies):
+        key = (seats, characters, copies)
+        if key not in cls._cache:
+            cls._cache[key] = cls(seats, characters, copies)
+        return cls._cache[key]
+
+    def card_key(self, keys, seat, code, copy_number):
+        return keys[(seat * self.characters + code) * HAND_SIZE + copy_number]
+
+    def deck_key(self, code, count):
+        return self.deck[code * (self.copies + 1) + count]
+
+
+class GameState:
+    """
+    Compact state of a game: small int arrays for coins, hidden cards,
+    revealed cards and the deck counts, plus the seat whose turn it is.
+    Cards are stored as their index in CHARACTERS, hands fill HAND_SIZE slots
+    per seat from the left and EMPTY marks the free slots.
+    Every change goes through the methods below, which keep the Zobrist
+    hash up to date so a state can key a transposition table.
+    The seats still alive are tracked as they are eliminated: a bitmask,
+    a count and a ring of next/previous alive seats in seat order.
+    An eliminated seat keeps its next link, so the turn can still move on
+    from a player eliminated during their own turn.
+    """
+
+    __slots__ = (
+        "seats", "coins", "hidden", "revealed", "deck", "turn", "hash", "keys",
+        "alive_bits", "alive_count", "next_seat", "previous_seat"
+    )
+
+    def __init__(self, seats, rng, copies=CARD_COPIES, coins=2):
+        self.seats = seats
+        self.keys = ZobristKeys.for_game(seats, len(CHARACTERS), copies)
+        self.coins = [coins] * seats
+        self.hidden = [EMPTY] * (seats * HAND_SIZE)
+        self.revealed = [EMPTY] * (seats * HAND_SIZE)
+        self.deck = Deck(CHARACTERS, copies, rng)
+        self.turn = 0
+        self.hash = self.compute_hash()
+        # Nobody is alive before the cards are dealt
+        self.alive_bits = 0
+        self.alive_count = 0
+        self.next_seat = list(range(seats))
+        self.previous_seat = list(range(seats))
+
+    def _cards_key(self, card_keys, seat, cards):
+        # XOR of the keys of the given cards of a seat
+        value = 0
+        seen = []
+        for code in cards:
+            if code != EMPTY:
+                value ^= self.keys.card_key(card_keys, seat, code, seen.count(code))
+                seen.append(code)
+        return value
+
+    def compute_hash(self):
+        # Hash the whole state from scratch, the incremental updates must agree with it
+        keys = self.keys
+        value = keys.turn[self.turn]
+        for seat in range(self.seats):
+            start = seat * HAND_SIZE
+            value ^= keys.coins[seat * COIN_KEYS + self.coins[seat] % COIN_KEYS]
+            value ^= self._cards_key(keys.hidden, seat, self.hidden[start:start + HAND_SIZE])
+            value ^= self._cards_key(keys.revealed, seat, self.revealed[start:start + HAND_SIZE])
+        for code, count in enumerate(self.deck.counts):
+            value ^= keys.deck_key(code, count)
+        return value
+
+    def information_hash(self, seat):
+        """
+        The hash of what the given seat can see: the state without the
+        hidden cards of the other seats and without the deck.
+        """
+        keys = self.keys
+        value = self.hash
+        hidden = self.hidden
+        for other in range(self.seats):
+            if other != seat:
+                start = other * HAND_SIZE
+                value ^= self._cards_key(keys.hidden, other, hidden[start:start + HAND_SIZE])
+        for code, count in enumerate(self.deck.counts):
+            value ^= keys.deck_key(code, count)
+        return value
+
+    def reset(self, coins=2):
+        """
+        Empty the state in place, as a new state of the same shape:
+        every seat has coins and no card, the deck is full and the
+        first seat plays.
+        """
+        seats = self.seats
+        self_coins = self.coins
+        next_seat = self.next_seat
+        previous_seat = self.previous_seat
+        for seat in range(seats):
+            self_coins[seat] = coins
+            next_seat[seat] = previous_seat[seat] = seat
+        hidden = self.hidden
+        revealed = self.revealed
+        for index in range(seats * HAND_SIZE):
+            hidden[index] = revealed[index] = EMPTY
+        self.deck.reset(self.keys.copies)
+        self.turn = 0
+        self.alive_bits = 0
+        self.alive_count = 0
+        empty_hash = self.keys.empty_hashes.get(coins)
+        if empty_hash is None:
+            empty_hash = self.keys.empty_hashes[coins] = self.compute_hash()
+        self.hash = empty_hash
+
+    def clone(self, rng=None):
+        state = GameState.__new__(GameState)
+        state.seats = self.seats
+        state.coins = self.coins[:]
+        state.hidden = self.hidden[:]
+        state.revealed = self.revealed[:]
+        state.deck = self.deck.copy(rng)
+        state.turn = self.turn
+        state.hash = self.hash
+        state.keys = self.keys
+        state.alive_bits = self.alive_bits
+        state.alive_count = self.alive_count
+        state.next_seat = self.next_seat[:]
+        state.previous_seat = self.previous_seat[:]
+        return state
+
+    # Seats alive
+    def alive_mask(self):
+        # Bitmask of the seats that still have a hidden card
+        return self.alive_bits
+
+    def next_alive(self, seat):
+        # The first seat alive after the given one, in seat order
+        next_seat = self.next_seat
+        alive_bits = self.alive_bits
+        seat = next_seat[seat]
+        while not alive_bits >> seat & 1:
+            seat = next_seat[seat]
+        return seat
+
+    def first_alive(self):
+        # The lowest seat alive, the winner once only one is left
+        alive_bits = self.alive_bits
+        return (alive_bits & -alive_bits).bit_length() - 1
+
+    def _join(self, seat):
+        # A seat gets its first card, link it between the seats alive around it
+        if self.alive_count == 0:
+            self.next_seat[seat] = self.previous_seat[seat] = seat
+        else:
+            previous = (seat - 1) % self.seats
+            while not self.alive_bits >> previous & 1:
+                previous = (previous - 1) % self.seats
+            following = self.next_seat[previous]
+            self.next_seat[seat] = following
+            self.previous_seat[seat] = previous
+            self.next_seat[previous] = seat
+            self.previous_seat[following] = seat
+        self.alive_bits |= 1 << seat
+        self.alive_count += 1
+
+    def _eliminate(self, seat):
+        previous = self.previous_seat[seat]
+        following = self.next_seat[seat]
+        self.next_seat[previous] = following
+        self.previous_seat[following] = previous
+        self.alive_bits &= ~(1 << seat)
+        self.alive_count -= 1
+
+    # Coins
+    def set_coins(self, seat, coins):
+        keys = self.keys.coins
+        offset = seat * COIN_KEYS
+        self.hash ^= keys[offset + self.coins[seat] % COIN_KEYS] ^ keys[offset + coins % COIN_KEYS]
+        self.coins[seat] = coins
+
+    # Turn
+    def set_turn(self, seat):
+        self.hash ^= self.keys.turn[self.turn] ^ self.keys.turn[seat]
+        self.turn = seat
+
+    # Hidden cards
+    def hand(self, seat):
+        start = seat * HAND_SIZE
+        return [code for code in self.hidden[start:start + HAND_SIZE] if code != EMPTY]
+
+    def hand_size(self, seat):
+        start = seat * HAND_SIZE
+        return HAND_SIZE - self.hidden[start:start + HAND_SIZE].count(EMPTY)
+
+    def is_eliminated(self, seat):
+        return self.hidden[seat * HAND_SIZE] == EMPTY
+
+    def give_card(self, seat, code):
+        start = seat * HAND_SIZE
+        hand = self.hidden[start:start + HAND_SIZE]
+        if EMPTY not in hand:
+            raise Exception("The player's hand is full.")
+        self.hash ^= self.keys.card_key(self.keys.hidden, seat, code, hand.count(code))
+        self.hidden[start + hand.index(EMPTY)] = code
+        if hand[0] == EMPTY:
+            self._join(seat)
+
+    def set_hand(self, seat, codes):
+        """
+        Replace the hidden cards of a seat that is still alive,
+        the seat stays alive while its hand changes.
+        """
+        if not 0 < len(codes) <= HAND_SIZE:
+            raise Exception("A hand must hold between 1 and HAND_SIZE cards.")
+        start = seat * HAND_SIZE
+        hand = list(codes) + [EMPTY] * (HAND_SIZE - len(codes))
+        keys = self.keys.hidden
+        self.hash ^= self._cards_key(keys, seat, self.hidden[start:start + HAND_SIZE]) ^ self._cards_key(keys, seat, hand)
+        self.hidden[start:start + HAND_SIZE] = hand
+
+    def take_card(self, seat, code):
+        # Remove a card from the hand by value
+        start = seat * HAND_SIZE
+        slot = self.hidden.index(code, start, start + HAND_SIZE)
+        return self._remove_slot(seat, slot - start)
+
+    def _remove_slot(self, seat, slot):
+        hidden = self.hidden
+        start = seat * HAND_SIZE
+        code = hidden[start + slot]
+        copies = hidden[start:start + HAND_SIZE].count(code)
+        self.hash ^= self.keys.card_key(self.keys.hidden, seat, code, copies - 1)
+        # Keep the remaining cards packed to the left
+        for index in range(start + slot, start + HAND_SIZE - 1):
+            hidden[index] = hidden[index + 1]
+        hidden[start + HAND_SIZE - 1] = EMPTY
+        if hidden[start] == EMPTY:
+            self._eliminate(seat)
+        return code
+
+    # Revealed cards
+    def revealed_cards(self, seat):
+        start = seat * HAND_SIZE
+        return [code for code in self.revealed[start:start + HAND_SIZE] if code != EMPTY]
+
+    def reveal_card(self, seat, slot):
+        # Move the card in the given slot of the hand to the revealed cards
+        code = self._remove_slot(seat, slot)
+        start = seat * HAND_SIZE
+        revealed = self.revealed[start:start + HAND_SIZE]
+        self.hash ^= self.keys.card_key(self.keys.revealed, seat, code, revealed.count(code))
+        self.revealed[start + revealed.index(EMPTY)] = code
+        return code
+
+    # Deck
+    @property
+    def deck_size(self):
+        return self.deck.size
+
+    def draw_card(self):
+        code = self.deck.draw_index()
+        count = self.deck.counts[code]
+        self.hash ^= self.keys.deck_key(code, count + 1) ^ self.keys.deck_key(code, count)
+        return code
+
+    def take_from_deck(self, code):
+        # Draw a known card, to rebuild a recorded game
+        self.deck.take_index(code)
+        count = self.deck.counts[code]
+        self.hash ^= self.keys.deck_key(code, count + 1) ^ self.keys.deck_key(code, count)
+
+    def return_card(self, code):
+        count = self.deck.counts[code]
+        self.hash ^= self.keys.deck_key(code, count) ^ self.keys.deck_key(code, count + 1)
+        self.deck.put_back_index(code)
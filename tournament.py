@@ -0,0 +1,182 @@
+import argparse
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from constants import MAX_PLAYERS, MIN_PLAYERS
+from controller import GameController
+from simulation import game_seed
+
+
+class TournamentStats:
+    """
+    Win and elimination statistics of a batch of games, by seat.
+    Statistics of separate batches can be merged in any order.
+    """
+
+    def __init__(self):
+        self.games = 0
+        self.turns = 0
+        self.wins = Counter()
+        self.eliminations = Counter()
+        # (seat, place) -> count, place 1 being the first player eliminated
+        self.elimination_places = Counter()
+        # Histogram of the game lengths, turns -> count
+        self.lengths = Counter()
+
+    def add_game(self, result):
+        self.games += 1
+        self.turns += result["turns"]
+        self.lengths[result["turns"]] += 1
+        self.wins[result["winner"]] += 1
+        for place, seat in enumerate(result["eliminated"], start=1):
+            self.eliminations[seat] += 1
+            self.elimination_places[(seat, place)] += 1
+
+    def merge(self, other):
+        self.games += other.games
+        self.turns += other.turns
+        self.wins.update(other.wins)
+        self.eliminations.update(other.eliminations)
+        self.elimination_places.update(other.elimination_places)
+        self.lengths.update(other.lengths)
+        return self
+
+    def to_dict(self):
+        # Plain counts that JSON keeps exactly, read back by from_dict
+        return {
+            "games": self.games,
+            "turns": self.turns,
+            "wins": sorted(self.wins.items()),
+            "eliminations": sorted(self.eliminations.items()),
+            "elimination_places": sorted((seat, place, count) for (seat, place), count in self.elimination_places.items()),
+            "lengths": sorted(self.lengths.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.games = data["games"]
+        stats.turns = data["turns"]
+        stats.wins = Counter(dict(data["wins"]))
+        stats.eliminations = Counter(dict(data["eliminations"]))
+        stats.elimination_places = Counter({(seat, place): count for seat, place, count in data["elimination_places"]})
+        stats.lengths = Counter(dict(data["lengths"]))
+        return stats
+
+    def win_rates(self):
+        return {
+            seat: wins / self.games for seat, wins in sorted(self.wins.items())
+        }
+
+
+def play_seeded_game(seed, number_of_players=3):
+    """
+    Play one headless game from its seed.
+    The same seed and number of players always give the same game.
+    Return a dict with the seed, winner seat, number of turns,
+    eliminated seats in order and the actions played.
+    """
+    controller = GameController(number_of_players, headless=True, seed=seed)
+    players = controller.players
+    eliminated = []
+    actions = []
+    turns = 0
+    while not controller.is_game_over():
+        seat = controller.current_player_index
+        action, target, performed = controller.play_turn()
+        target_seat = target.seat if target is not None else None
+        actions.append((seat, action, target_seat, performed))
+        turns += 1
+        for index, player in enumerate(players):
+            if player.is_eliminated and index not in eliminated:
+                eliminated.append(index)
+        if controller.is_game_over():
+            break
+        controller.next_turn()
+
+    return {
+        "seed": seed,
+        "winner": controller.get_winner().seat,
+        "turns": turns,
+        "eliminated": eliminated,
+        "actions": actions,
+    }
+
+
+def play_games(base_seed, first_game, last_game, number_of_players):
+    # Worker entry point, plays the games first_game..last_game - 1
+    stats = TournamentStats()
+    for game_index in range(first_game, last_game):
+        stats.add_game(play_seeded_game(game_seed(base_seed, game_index), number_of_players))
+    return stats
+
+
+def replay_game(base_seed, game_index, number_of_players=3):
+    """
+    Play again game number game_index of a tournament run with base_seed
+    """
+    return play_seeded_game(game_seed(base_seed, game_index), number_of_players)
+
+
+def run_tournament(number_of_games, number_of_players=3, seed=0, workers=None, chunk_size=None):
+    """
+    Play number_of_games headless games over a pool of worker processes.
+    Games are handed out in contiguous chunks so that each worker only
+    sends back merged statistics, and every game is seeded from its own
+    index so the result does not depend on the number of workers.
+    """
+    workers = workers or os.cpu_count() or 1
+    if chunk_size is None:
+        # A few chunks per worker keep the pool balanced at the end of the run
+        chunk_size = max(1, min(1000, number_of_games // (workers * 4)))
+
+    stats = TournamentStats()
+    if workers == 1:
+        return stats.merge(play_games(seed, 0, number_of_games, number_of_players))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                play_games,
+                seed,
+                first_game,
+                min(first_game + chunk_size, number_of_games),
+                number_of_players
+            )
+            for first_game in range(0, number_of_games, chunk_size)
+        ]
+        for future in futures:
+            stats.merge(future.result())
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play a seeded Coup tournament over many processes")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--players", type=int, default=3, choices=range(MIN_PLAYERS, MAX_PLAYERS + 1))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--replay", type=int, metavar="GAME", help="replay a single game of the tournament")
+    args = parser.parse_args()
+
+    if args.replay is not None:
+        result = replay_game(args.seed, args.replay, args.players)
+        print(f"Game {args.replay} (seed {result['seed']}): seat {result['winner']} won in {result['turns']} turns")
+        print(f"Eliminated in order: {result['eliminated']}")
+        for seat, action, target, performed in result["actions"]:
+            target_text = f" on seat {target}" if target is not None else ""
+            blocked_text = "" if performed else " (stopped)"
+            print(f"  seat {seat}: {action}{target_text}{blocked_text}")
+        return
+
+    start = perf_counter()
+    stats = run_tournament(args.games, args.players, args.seed, args.workers)
+    elapsed = perf_counter() - start
+    print(f"Played {stats.games} games ({stats.turns} turns) in {elapsed:.2f}s, {stats.games / elapsed:.1f} games/sec")
+    for seat, rate in stats.win_rates().items():
+        print(f"  seat {seat}: {rate:.2%} wins, eliminated {stats.eliminations[seat]} times")
+
+
+if __name__ == "__main__":
+    main()
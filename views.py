@@ -1,109 +1,194 @@
-from colored import Fore, Back, Style
-from helpers import colorize_card, colorize_text, colorize_amount
-from constants import ACTION_LABELS
+import sys
+from colored import Fore, Back
+from helpers import CARD_STYLES, PALETTES
+from constants import ACTION_DESCRIPTIONS
+
+# Verbosity levels of the terminal output, each level shows the lines of the levels below
+SILENT = 0
+# Errors, eliminations and the winner
+QUIET = 1
+# The state, actions, challenges, blocks and reveals
+NORMAL = 2
+# What the AI is thinking about too
+VERBOSE = 3
+VERBOSITY_LEVELS = {"silent": SILENT, "quiet": QUIET, "normal": NORMAL, "verbose": VERBOSE}
+
+
+def no_input(prompt):
+    # Input of a headless game, whose seats are all AI
+    raise Exception("A headless game cannot prompt a player.")
+
+
+class Renderer:
+    """
+    Terminal output shared by the views of a game.
+    Lines are collected into a frame, written with a single call at the
+    start of each turn, before a prompt and before an AI pauses.
+    Lines above the verbosity are never shown, the views check shows()
+    first so they are not even formatted. Prompts are always shown.
+    Colors come from a palette, "ansi" or "plain", which builds each
+    colorized card, action and amount once.
+    Headless games use a silent renderer whose input is no_input.
+    """
+
+    def __init__(self, stream=None, palette="ansi", verbosity=VERBOSE, input=input):
+        self.stream = stream if stream is not None else sys.stdout
+        self.palette = PALETTES[palette]
+        self.verbosity = verbosity
+        self.input = input
+        self.lines = []
+        # Last line shown for each seat, with the state it was formatted from
+        self.player_lines = {}
+
+    def shows(self, level):
+        return level <= self.verbosity
+
+    def write(self, line):
+        self.lines.append(line)
+
+    def flush(self):
+        if self.lines:
+            self.lines.append("")
+            self.stream.write("\n".join(self.lines))
+            self.stream.flush()
+            self.lines.clear()
+
+    def ask(self, prompt):
+        # Show the frame, then read the answer of the player
+        self.flush()
+        return self.input(prompt)
+
+    def player_line(self, seat, key, format_line):
+        """
+        Return the line of a seat, formatted again only when key,
+        the state it shows, changed since it was last formatted
+        """
+        cached = self.player_lines.get(seat)
+        if cached is None or cached[0] != key:
+            cached = self.player_lines[seat] = (key, format_line())
+        return cached[1]
 
 
 class PlayerView:
-    def __init__(self):
-        pass
+    def __init__(self, renderer=None):
+        self.renderer = renderer if renderer is not None else Renderer()
 
     def get_card_to_reveal(self, player):
+        renderer = self.renderer
         for index, card in enumerate(player.cards):
-            print(f"{index + 1}. {card}")
-        card_index = int(input("Enter card number: ")) - 1
+            renderer.write(f"{index + 1}. {card}")
+        card_index = int(renderer.ask("Enter card number: ")) - 1
         return card_index
 
     def display_player_eliminated(self, player_name):
-        print(f"{Fore.RED}{player_name} has been eliminated from the game.{Style.RESET}")
+        renderer = self.renderer
+        if renderer.shows(QUIET):
+            renderer.write(renderer.palette.style(Fore.RED, f"{player_name} has been eliminated from the game."))
 
     def display_player_revealed_card(self, player_name, card):
-        print(f"{Fore.RED}{player_name} revealed {card}{Style.RESET}")
+        renderer = self.renderer
+        if renderer.shows(NORMAL):
+            renderer.write(renderer.palette.style(Fore.RED, f"{player_name} revealed {card}"))
 
     def print_ai_thinking_reveal(self, player=None):
-        player_name = player.name if player else "AI"
-        print(f"{Fore.DARK_CYAN}{player_name} thinking about what to reveal...{Style.RESET}")
+        renderer = self.renderer
+        if renderer.shows(VERBOSE):
+            player_name = player.name if player else "AI"
+            renderer.write(renderer.palette.style(Fore.DARK_CYAN, f"{player_name} thinking about what to reveal..."))
+        renderer.flush()
 
 
 class GameView:
-    def __init__(self):
-        pass
+    def __init__(self, renderer=None):
+        self.renderer = renderer if renderer is not None else Renderer()
 
     def display_welcome_message(self):
-        print(f"{Fore.GREEN}Welcome to Coup - Command Line Edition{Style.RESET}")
+        renderer = self.renderer
+        if renderer.shows(NORMAL):
+            renderer.write(renderer.palette.style(Fore.GREEN, "Welcome to Coup - Command Line Edition"))
 
     def display_state(self, players, current_player_index):
-        print(f"{Fore.GREEN}======================================={Style.RESET}")
+        renderer = self.renderer
+        if not renderer.shows(NORMAL):
+            return
+        palette = renderer.palette
+        rule = palette.style(Fore.GREEN, "=======================================")
+        renderer.write(rule)
         current_player = players[current_player_index]
-        is_ai = current_player.is_ai
-        if is_ai:
-            print(f"{Fore.DARK_CYAN}{current_player.name}'s turn {Style.RESET}")
+        if current_player.is_ai:
+            renderer.write(palette.style(Fore.DARK_CYAN, f"{current_player.name}'s turn "))
         else:
-            print("Other players:")
+            renderer.write("Other players:")
             for i, player in enumerate(players):
                 if i == current_player_index:
                     continue
-                revealed_cards = " ".join([
-                    f"[{colorize_card(card)}]" for card in player.revealed
-                ])
-                print(f"{i + 1}. {player.name} ({len(player.cards)} cards) {revealed_cards} - {colorize_amount(player.coins)} coins")
-            print(f"{Fore.GREEN}======================================={Style.RESET}")
-            print(f"Player {current_player.name}'s turn (Human)" if current_player.is_ai is False else f"{Fore.YELLOW}AI's turn{Style.RESET}")
-            print(f"Coins: {colorize_amount(current_player.coins)}")
-            cards = " ".join([f"[{colorize_card(card)}]" for card in current_player.cards])
-            print(f"Cards: {cards}\n")
+                revealed = tuple(player.revealed)
+                key = (player.name, player.state.hand_size(player.seat), revealed, player.coins)
+                renderer.write(renderer.player_line(i, key, lambda: self.format_player_line(i, key)))
+            renderer.write(rule)
+            renderer.write(f"Player {current_player.name}'s turn (Human)")
+            renderer.write(f"Coins: {palette.amount(current_player.coins)}")
+            cards = " ".join([f"[{palette.card(card)}]" for card in current_player.cards])
+            renderer.write(f"Cards: {cards}\n")
             if current_player.revealed:
-                revealed_cards = " ".join([
-                    f"[{colorize_card(card)}]" for card in current_player.revealed
-                ])
-                print(f"Revealed cards: {revealed_cards}\n")
-        print(f"{Fore.GREEN}======================================={Style.RESET}")
+                revealed_cards = " ".join([f"[{palette.card(card)}]" for card in current_player.revealed])
+                renderer.write(f"Revealed cards: {revealed_cards}\n")
+        renderer.write(rule)
+        renderer.flush()
+
+    def format_player_line(self, i, key):
+        palette = self.renderer.palette
+        name, cards, revealed, coins = key
+        revealed_cards = " ".join([f"[{palette.card(card)}]" for card in revealed])
+        return f"{i + 1}. {name} ({cards} cards) {revealed_cards} - {palette.amount(coins)} coins"
 
     def print_error(self, error):
-        print(f"{Fore.RED}{error}{Style.RESET}")
+        renderer = self.renderer
+        if renderer.shows(QUIET):
+            renderer.write(renderer.palette.style(Fore.RED, error))
 
     def announce_action(self, player, action, character="", target=None):
         """
         Format the action based on the character and action:
         """
-        character_text = f"by [{colorize_card(character)}]" if character else ""
+        renderer = self.renderer
+        if not renderer.shows(NORMAL):
+            return
+        palette = renderer.palette
+        character_text = f"by [{palette.card(character)}]" if character else ""
         target_name_text = f" on {target.name}" if target else ""
-        text = f"{player.name} choose to perform [{colorize_text(action, action)}] {colorize_text(character_text, action)}{target_name_text}"
-        if action == "income":
-            print(f"{Fore.YELLOW}{text}{Style.RESET}")
-        elif action == "foreign_aid":
-            print(f"{Fore.YELLOW}{text}{Style.RESET}")
+        text = f"{player.name} choose to perform [{palette.action(action)}] {palette.action(action, character_text)}{target_name_text}"
+        if action in ("income", "foreign_aid"):
+            renderer.write(palette.style(Fore.YELLOW, text))
         elif action == "coup":
-            print(f"{Back.RED}{text}{Style.RESET}")
-        elif character == "assassin":
-            print(f"{Fore.BLACK}{Back.WHITE}{text}{Style.RESET}")
-        elif character == "ambassador":
-            print(f"{Fore.GREEN}{text}{Style.RESET}")
-        elif character == "captain":
-            print(f"{Fore.BLUE}{text}{Style.RESET}")
-        elif character == "duke":
-            print(f"{Fore.MAGENTA}{text}{Style.RESET}")
-        elif character == "contessa":
-            print(f"{Fore.RED}{text}{Style.RESET}")
+            renderer.write(palette.style(Back.RED, text))
+        elif character in CARD_STYLES:
+            renderer.write(palette.style(CARD_STYLES[character], text))
         else:
-            print(text)
+            renderer.write(text)
+
+    def print_coins(self, player):
+        renderer = self.renderer
+        if renderer.shows(NORMAL):
+            renderer.write(f"{player.name} has {renderer.palette.amount(player.coins)} coins now.")
 
     def print_steal(self, player, target):
         self.announce_action(player, "steal", "captain", target)
 
     def print_income(self, player):
         self.announce_action(player, "income")
-        print(f"{player.name} has {colorize_amount(player.coins)} coins now.")
+        self.print_coins(player)
 
     def print_foreign_aid(self, player):
         self.announce_action(player, "foreign_aid")
-        print(f"{player.name} has {colorize_amount(player.coins)} coins now.")
+        self.print_coins(player)
 
     def print_coup(self, player, target):
         self.announce_action(player, "coup", target=target)
 
     def print_tax(self, player):
         self.announce_action(player, "tax", "duke")
-        print(f"{player.name} has {colorize_amount(player.coins)} coins now.")
+        self.print_coins(player)
 
     def print_assassinate(self, player, target):
         self.announce_action(player, "assassinated", "assassin", target=target)
@@ -116,10 +201,11 @@ class GameView:
         Display the options available to the player
         and return the option selected by the player
         """
-        print(f"What would you like to do, {player.name}?")
+        renderer = self.renderer
+        renderer.write(f"What would you like to do, {player.name}?")
         for i, option in enumerate(options):
-            print(f"{i + 1}. {ACTION_LABELS[option]}")
-        option_number = input("Enter the number of your choice: ")
+            renderer.write(f"{i + 1}. {renderer.palette.action(option, ACTION_DESCRIPTIONS[option])}")
+        option_number = renderer.ask("Enter the number of your choice: ")
         # validate option number
         if not option_number.isdigit():
             self.print_error("Invalid option. Try again.")
@@ -139,28 +225,34 @@ class GameView:
         @param player: a Player object
         returns a Player object
         """
-        print(f"Who would you like to target, {player.name}?")
+        renderer = self.renderer
+        renderer.write(f"Who would you like to target, {player.name}?")
         for i, player in enumerate(players):
-            print(f"{i + 1}. {player.name}")
-        player_number = int(input("Enter the number of your target: "))
+            renderer.write(f"{i + 1}. {player.name}")
+        player_number = int(renderer.ask("Enter the number of your target: "))
         if player_number > len(players) or player_number < 1:
             self.print_error("Invalid player. Try again.")
             return self.get_player_target(players, player)
         return players[int(player_number) - 1]
 
     def announce_eliminated_player(self, player):
-        print(f"{Fore.RED}{player.name} has been eliminated from the game.{Style.RESET}")
+        renderer = self.renderer
+        if renderer.shows(QUIET):
+            renderer.write(renderer.palette.style(Fore.RED, f"{player.name} has been eliminated from the game."))
     # Additional methods for displaying information and results
 
-    @staticmethod
-    def display_game_over(winner):
-        print(f"{Fore.GREEN}{winner.name} won the game!{Style.RESET}")
-        print(f"{Fore.GREEN}Game Over{Style.RESET}")
+    def display_game_over(self, winner):
+        renderer = self.renderer
+        if renderer.shows(QUIET):
+            renderer.write(renderer.palette.style(Fore.GREEN, f"{winner.name} won the game!"))
+            renderer.write(renderer.palette.style(Fore.GREEN, "Game Over"))
         # Display the winner and final state of the game
+        renderer.flush()
 
     def ask_to_play_again(self):
-        print("Would you like to play again?")
-        decision = input("Enter 'y' for yes or 'n' for no: ")
+        renderer = self.renderer
+        renderer.write("Would you like to play again?")
+        decision = renderer.ask("Enter 'y' for yes or 'n' for no: ")
         if decision == "y":
             return True
         elif decision == "n":
@@ -183,10 +275,16 @@ class GameView:
         self.print_coup(player, "target")
 
     def challenge_failed(self, challenger, challenged, claimed_card):
-        print(f"{Back.RED}Challenge failed. {challenged.name} did have a {claimed_card}.{Style.RESET}")
+        renderer = self.renderer
+        if renderer.shows(NORMAL):
+            renderer.write(renderer.palette.style(Back.RED, f"Challenge failed. {challenged.name} did have a {claimed_card}."))
 
     def challenge_succeeded(self, challenger, challenged, claimed_card):
-        print(f"{Fore.GREEN}Challenge succeeded. {challenged.name} did not have a/an {claimed_card}.{Style.RESET}")
+        renderer = self.renderer
+        if renderer.shows(NORMAL):
+            renderer.write(renderer.palette.style(
+                Fore.GREEN, f"Challenge succeeded. {challenged.name} did not have a/an {claimed_card}."
+            ))
 
     def get_challenge_decision(
         self, challenger, challenged, action, target=None
@@ -195,15 +293,16 @@ class GameView:
         Return True if the player decides to challenge
         Return False if the player decides not to challenge
         """
+        renderer = self.renderer
         target_text = ""
         if target is challenger:
-            target_text = f" on you."
+            target_text = " on you."
         elif target:
             target_text = f" on {target.name}."
 
-        print(f"{challenger.name}, would you like to challenge {challenged.name}?")
-        print(f"{challenged.name} is performing a/an {colorize_text(action, action)}{target_text}.")
-        decision = input("Enter 'y' to challenge and 'n' to allow: ")
+        renderer.write(f"{challenger.name}, would you like to challenge {challenged.name}?")
+        renderer.write(f"{challenged.name} is performing a/an {renderer.palette.action(action)}{target_text}.")
+        decision = renderer.ask("Enter 'y' to challenge and 'n' to allow: ")
         if decision == "y":
             return True
         elif decision == "n":
@@ -219,12 +318,13 @@ class GameView:
         Return True if the player decides to block
         Return False if the player decides not to block
         """
-        print(f"{blocker.name}, would you like to block?")
-        print(f"{blocked_player.name} is performing a/an {colorize_text(action, action)}.")
+        renderer = self.renderer
+        renderer.write(f"{blocker.name}, would you like to block?")
+        renderer.write(f"{blocked_player.name} is performing a/an {renderer.palette.action(action)}.")
         # Print the cards that the challenger player has
-        print("you have the following cards:")
-        print(" ".join([f"[{colorize_card(card)}]" for card in blocker.cards]))
-        decision = input("Enter 'y' to block or 'n' to allow: ")
+        renderer.write("you have the following cards:")
+        renderer.write(" ".join([f"[{renderer.palette.card(card)}]" for card in blocker.cards]))
+        decision = renderer.ask("Enter 'y' to block or 'n' to allow: ")
         if decision == "y":
             return True
         elif decision == "n":
@@ -234,20 +334,23 @@ class GameView:
             return self.get_block_decision(blocker, blocked_player, action)
 
     def block_successful(self, blocker, blocked_player, action):
-        print(f"{blocker.name} blocked {blocked_player.name}'s {action}.")
+        renderer = self.renderer
+        if renderer.shows(NORMAL):
+            renderer.write(f"{blocker.name} blocked {blocked_player.name}'s {action}.")
 
     def choose_cards_to_exchange(self, player, cards):
         """
         Return a list of cards to exchange
         """
-        print(f"{player.name}, choose cards to keep.")
+        renderer = self.renderer
+        renderer.write(f"{player.name}, choose cards to keep.")
         for i, card in enumerate(cards):
-            print(f"{i + 1}. {card}")
+            renderer.write(f"{i + 1}. {card}")
         cards_to_keep = []
         # Choose n cards to exchange depending on player's number of cards
         num_cards_to_exchange = len(player.cards)
         for i in range(num_cards_to_exchange):
-            card_index = int(input("Enter card number: ")) - 1
+            card_index = int(renderer.ask("Enter card number: ")) - 1
             # Validate card index
             if card_index > len(cards) or card_index < 0:
                 self.print_error("Invalid card. Try again.")
@@ -257,9 +360,21 @@ class GameView:
         return cards_to_keep
 
     def print_ai_thinking(self, about="", player=None):
-        player_name = player.name if player else "AI"
-        about_text = f" about {about}" if about else ""
-        print(f"{Fore.DARK_CYAN}{player_name} thinking{about_text}...{Style.RESET}")
+        # The AI may pause next, show what happened so far first
+        renderer = self.renderer
+        if renderer.shows(VERBOSE):
+            player_name = player.name if player else "AI"
+            about_text = f" about {about}" if about else ""
+            renderer.write(renderer.palette.style(Fore.DARK_CYAN, f"{player_name} thinking{about_text}..."))
+        renderer.flush()
 
     def ask_for_player_name(self):
-        return input("Enter your name: ") or "Human"
+        return self.renderer.ask("Enter your name: ") or "Human"
+
+    def withdraw_prompts(self, players):
+        # Close the open prompts of the players, return whether they were closed,
+        # the terminal cannot take back a question it is asking
+        return False
+
+    def reopen_prompts(self, players):
+        pass